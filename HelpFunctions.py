@@ -1,16 +1,225 @@
 import hashlib
-from db_connection import query, execute_update
-from flask import Flask, jsonify, request, session
+from functools import lru_cache
+from db_connection import query, execute_update, transaction, run_in_transaction, current_unit, replica_reads_enabled
+from reporting import get_alumni_cohorts, get_cohort_size, recount_cohort_summary
+from single_flight import query_flight
+from event_stream import publish_event
+from flask import Flask, g, has_request_context, jsonify, request, session
 import logging
 
-# PostgreSQL connection setup
-#DB_PASSWORD = os.getenv('DB_PASSWORD', 'b11705059')
-DB_PASSWORD = ''  # Replace with your actual PostgreSQL password
-DB_NAME = 'final proposal'  # Replace with your actual database name
-DB_USER = 'postgres'  # PostgreSQL user
-DB_HOST = 'localhost'  # Host address
-DB_PORT = '5432'  # Port
-# DB_PORT = os.getenv('DB_PORT', '5433')
+def fetch_list(sql_query, params=None, shape="dicts"):
+    """
+    Runs a SELECT query and returns its rows as a list of dictionaries or in columnar form.
+
+    Args:
+        sql_query (str): SQL query string.
+        params (tuple): Parameters to substitute in the SQL query.
+        shape (str): 'dicts' for one dictionary per row, or 'columns' for
+            {"columns": [...], "data": [[...], ...], "row_count": n} with one array per column.
+            The columnar form avoids building a dictionary for every row.
+
+    Returns:
+        list or dict: The rows in the requested shape.
+    """
+    if shape == "columns":
+        columns, data = query(sql_query, params, shape="columns")
+        return {"columns": columns, "data": data, "row_count": len(data[0]) if data else 0}
+    columns, results = query(sql_query, params)
+    return [dict(zip(columns, row)) for row in results]
+
+
+def coalesced_query(sql_query, params=None, shape="rows"):
+    """
+    Runs a read query, sharing one execution between identical concurrent calls.
+
+    Callers running the same SQL with the same parameters while it is in
+    flight wait for it and get the same result (see single_flight.py), so a
+    burst of identical requests costs one query. Inside a transaction the
+    query runs on its own, since it has to see the transaction's writes.
+
+    Args:
+        sql_query (str): SELECT query string.
+        params (tuple): Parameters to substitute in the SQL query.
+        shape (str): Result shape, see db_connection.query.
+
+    Returns:
+        tuple: Column names and results, shared between callers (do not modify).
+    """
+    if current_unit() is not None:
+        return query(sql_query, params, shape)
+    # Callers pinned to the primary must not get a result read from a replica
+    return query_flight.do((sql_query, repr(params), shape, replica_reads_enabled()),
+                           lambda: query(sql_query, params, shape))
+
+
+def is_empty_list(result):
+    """
+    Checks whether a fetch_list result has no rows, whatever its shape.
+    """
+    if isinstance(result, dict):
+        return result["row_count"] == 0
+    return not result
+
+
+class BatchLoader:
+    """
+    Looks up rows for many keys with one `= ANY(%s)` query instead of one query per key.
+
+    Loaded keys are remembered, so asking again for the same key during a
+    request does not query the database again.
+
+    Example:
+        loader = BatchLoader("SELECT * FROM alumni WHERE alumni_id = ANY(%s)", "alumni_id")
+        alumni = loader.load_many(["b11705022", "b11705023"])  # {alumni_id: row dict or None}
+    """
+
+    def __init__(self, sql_query, key_column, many=False, value_column=None):
+        """
+        Args:
+            sql_query (str): SELECT query with one `= ANY(%s)` placeholder taking the list of keys.
+            key_column (str): Result column holding the key of each row.
+            many (bool): Whether a key can have several rows. Values are then lists
+                (empty when nothing was found), otherwise the first row or None.
+            value_column (str): Column to return instead of the whole row as a dict.
+        """
+        self.sql_query = sql_query
+        self.key_column = key_column
+        self.many = many
+        self.value_column = value_column
+        self._loaded = {}
+
+    def load_many(self, keys):
+        """
+        Loads the values of several keys, querying only the keys not loaded yet.
+
+        Args:
+            keys (list): Keys to look up; duplicates are allowed.
+
+        Returns:
+            dict: Value of every key.
+        """
+        missing = [key for key in dict.fromkeys(keys) if key not in self._loaded]
+        if missing:
+            columns, results = query(self.sql_query, (missing,))
+            found = {key: [] for key in missing}
+            key_index = columns.index(self.key_column)
+            value_index = columns.index(self.value_column) if self.value_column else None
+            for row in results:
+                found[row[key_index]].append(dict(zip(columns, row)) if value_index is None else row[value_index])
+            for key, rows in found.items():
+                self._loaded[key] = rows if self.many else (rows[0] if rows else None)
+        return {key: self._loaded[key] for key in keys}
+
+    def load(self, key):
+        """
+        Loads the value of one key, see load_many.
+        """
+        return self.load_many([key])[key]
+
+    def clear(self):
+        """
+        Forgets every loaded value, e.g. after a write.
+        """
+        self._loaded.clear()
+
+
+# Related data of alumni that list endpoints can embed, each loaded with one query for all alumni
+LOADER_QUERIES = {
+    "alumni": ("SELECT * FROM alumni WHERE alumni_id = ANY(%s)", "alumni_id"),
+    "degree": ("""
+        SELECT * FROM earned_by JOIN degree_ ON earned_by.degree_id = degree_.degree_id
+        WHERE earned_by.alumni_id = ANY(%s)
+    """, "alumni_id"),
+    "total_donations": ("""
+        SELECT alumni_id, SUM(amount) AS total_donations FROM donation
+        WHERE alumni_id = ANY(%s)
+        GROUP BY alumni_id
+    """, "alumni_id", False, "total_donations"),
+    "cadre_positions": ("""
+        SELECT a.alumni_id, a.association_id, a.position, asso.association_name
+        FROM is_cadre a
+        JOIN alumni_association asso ON a.association_id = asso.association_id
+        WHERE a.alumni_id = ANY(%s) AND (a.end_date IS NULL OR a.end_date > CURRENT_DATE)
+    """, "alumni_id", True),
+}
+
+
+def get_loader(name):
+    """
+    Returns the BatchLoader of a LOADER_QUERIES entry for the current request.
+
+    Inside a Flask request the loader is kept on `flask.g`, so every lookup
+    of the request shares what was already loaded. Outside a request a new
+    loader is returned.
+
+    Args:
+        name (str): Key of LOADER_QUERIES (e.g., 'degree').
+
+    Returns:
+        BatchLoader: The loader.
+    """
+    if not has_request_context():
+        return BatchLoader(*LOADER_QUERIES[name])
+    loaders = g.setdefault("loaders", {})
+    if name not in loaders:
+        loaders[name] = BatchLoader(*LOADER_QUERIES[name])
+    return loaders[name]
+
+
+# Columns that can be requested with the `fields` parameter, per table
+TABLE_COLUMNS = {
+    "alumni": ("alumni_id", "first_name", "last_name", "sex", "address", "graduation_year", "user_id", "phone"),
+    "donation": ("donation_id", "alumni_id", "amount", "date", "donation_type"),
+    "career_history": ("career_id", "alumni_id", "job_title", "company", "start_date", "end_date",
+                       "monthly_salary", "job_description"),
+    "association_event": ("event_name", "date", "description", "location"),
+    "alumni_association": ("association_id", "association_name", "address", "phone", "email", "founded_year",
+                           "description"),
+    "achievement": ("achievement_id", "alumnileader_id", "title", "description", "date", "category"),
+}
+
+
+def parse_fields(table, fields):
+    """
+    Validates the `fields` parameter of an endpoint against the columns of a table.
+
+    Args:
+        table (str): Table name (key of TABLE_COLUMNS).
+        fields (str): Comma-separated column names (e.g., 'first_name,last_name'), or None/empty for all columns.
+
+    Returns:
+        tuple or None: The requested columns in order, without duplicates, or None for all columns.
+
+    Raises:
+        ValueError: If a field is not a column of the table.
+    """
+    if not fields:
+        return None
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in TABLE_COLUMNS[table]]
+    if unknown:
+        raise ValueError(f"Unknown fields for {table}: {', '.join(unknown)}. "
+                         f"Available: {', '.join(TABLE_COLUMNS[table])}")
+    return requested or None
+
+
+@lru_cache(maxsize=512)
+def projected_sql(sql_template, table, fields=None):
+    """
+    Fills the `{columns}` placeholder of a query with the requested columns.
+
+    Results are cached, so each field set is formatted only once.
+
+    Args:
+        sql_template (str): SQL with a `{columns}` placeholder (e.g., 'SELECT {columns} FROM alumni').
+        table (str): Table the columns belong to; they are qualified with its name.
+        fields (tuple): Columns as returned by parse_fields, or None for all (`*`).
+
+    Returns:
+        str: The SQL query.
+    """
+    columns = "*" if fields is None else ", ".join(f"{table}.{field}" for field in fields)
+    return sql_template.format(columns=columns)
 
 
 def login_user(username, password):
@@ -90,8 +299,11 @@ def add_alumni(data):
         if not all(params):
             return "Error: Missing required fields."
 
-        # Execute the query
-        rows_affected = execute_update(sql_query, params)
+        # Execute the query and count the new alumni in their cohort
+        with transaction():
+            rows_affected = execute_update(sql_query, params)
+            if rows_affected:
+                recount_cohort_summary(get_alumni_cohorts(data.get('alumni_id')))
         return "Alumni added successfully." if rows_affected else "Failed to add alumni."
 
     except Exception as e:
@@ -99,19 +311,23 @@ def add_alumni(data):
         return f"Error: {str(e)}"
 
 
-def get_alumni(alumni_id):
+GET_ALUMNI_SQL = "SELECT {columns} FROM alumni WHERE alumni_id = %s"
+
+
+def get_alumni(alumni_id, fields=None):
     """
     Retrieves alumni details.
 
     Args:
         alumni_id (int): Alumni ID.
+        fields (tuple): Columns to return (see parse_fields), or None for all.
 
     Returns:
         dict: Alumni details or error message.
     """
     try:
         # SQL query to fetch alumni details
-        sql_query = "SELECT * FROM alumni WHERE alumni_id = %s"
+        sql_query = projected_sql(GET_ALUMNI_SQL, "alumni", fields)
         # Execute the query with the provided alumni ID
         columns, results = query(sql_query, (alumni_id,))
         
@@ -160,8 +376,13 @@ def update_alumni(alumni_id, data):
         print(f"Constructed SQL Query: {sql_query}")
         print(f"Parameters: {params}")
 
-        # Call the execute_update function
-        rows_affected = execute_update(sql_query, params)
+        # Call the execute_update function, moving the alumni to their new cohort if needed
+        moves_cohort = "graduation_year" in data or "sex" in data
+        with transaction():
+            cohorts = get_alumni_cohorts(alumni_id) if moves_cohort else []
+            rows_affected = execute_update(sql_query, params)
+            if moves_cohort and rows_affected:
+                recount_cohort_summary(cohorts + get_alumni_cohorts(alumni_id))
 
         return f"Update successful. Rows affected: {rows_affected}" if rows_affected else "No rows updated."
 
@@ -184,8 +405,12 @@ def delete_alumni(alumni_id):
         # SQL query to delete the alumni record
         sql_query = "DELETE FROM alumni WHERE alumni_id = %s"
 
-        # Execute the query with the alumni_id as a parameter
-        rows_affected = execute_update(sql_query, (alumni_id,))
+        # Execute the query with the alumni_id as a parameter, removing the alumni from their cohort
+        with transaction():
+            cohorts = get_alumni_cohorts(alumni_id)
+            rows_affected = execute_update(sql_query, (alumni_id,))
+            if rows_affected:
+                recount_cohort_summary(cohorts)
 
         # Check if any row was deleted
         if rows_affected > 0:
@@ -227,38 +452,47 @@ def find_alumni_by_name(name):
         return {"status": "error", "message": str(e)}
 
 
-def get_alumni_by_graduation_year(year):
+def get_alumni_by_graduation_year(year, page=1, page_size=50):
     """
-    Retrieves alumni by their graduation year.
+    Retrieves one page of the alumni who graduated in a given year, ordered by name.
 
     Args:
         year (int): The graduation year to filter by.
+        page (int): Page number, starting at 1.
+        page_size (int): Number of alumni per page.
 
     Returns:
         dict: A dictionary containing:
             - 'status' (str): 'success' or 'error'.
+            - 'cohort_size' (int): Number of alumni in the cohort (on success).
             - 'alumni_list' (list): List of alumni records as dictionaries (on success).
             - 'message' (str): Error message (on failure).
     """
     try:
-        # SQL query to filter alumni by graduation year
-        sql_query = "SELECT * FROM alumni WHERE graduation_year = %s"
-        
-        # Execute the query with the year parameter
-        columns, results = query(sql_query, (year,))
-        
-        # Convert the query results to a list of dictionaries
-        alumni_list = [dict(zip(columns, row)) for row in results]
-        
-        return {"status": "success", "alumni_list": alumni_list}
+        # Served in index order by idx_alumni_cohort, no sort needed
+        sql_query = """
+            SELECT alumni_id, first_name, last_name, sex, phone, address
+            FROM alumni
+            WHERE graduation_year = %s
+            ORDER BY last_name, first_name, alumni_id
+            LIMIT %s OFFSET %s
+        """
+        alumni_list = fetch_list(sql_query, (year, page_size, (page - 1) * page_size))
+        return {"status": "success", "cohort_size": get_cohort_size(year), "alumni_list": alumni_list}
     except Exception as e:
         logging.error("Error retrieving alumni by graduation year", exc_info=True)
         return {"status": "error", "message": str(e)}
 
-def list_alumni():
+LIST_ALUMNI_SQL = "SELECT * FROM alumni"
+
+
+def list_alumni(shape="dicts"):
     """
     Lists all alumni in the database.
 
+    Args:
+        shape (str): 'dicts' or 'columns', see fetch_list.
+
     Returns:
         dict: A dictionary containing:
             - 'status' (str): 'success' or 'error'.
@@ -267,13 +501,10 @@ def list_alumni():
     """
     try:
         # SQL query to fetch all alumni records
-        sql_query = "SELECT * FROM alumni"
-        
-        # Execute the query
-        columns, results = query(sql_query)
+        sql_query = LIST_ALUMNI_SQL
         
-        # Convert results to a list of dictionaries
-        alumni_list = [dict(zip(columns, row)) for row in results]
+        # Execute the query and shape the rows
+        alumni_list = fetch_list(sql_query, shape=shape)
         
         return {"status": "success", "alumni_list": alumni_list}
     except Exception as e:
@@ -421,22 +652,15 @@ def create_user(username, password, role):
         str: A success message or an error message.
     """
     try:
-        # SQL query to insert a new user
+        # SQL query to insert a new user and get its generated ID in the same round trip
         sql_query = """
             INSERT INTO user_ (user_name, password, role)
             VALUES (%s, %s, %s)
+            RETURNING user_id
         """
         
         # Execute the query with the provided parameters
-        rows_affected = execute_update(sql_query, (username, password, role))
-        
-        sql_query_4_user_id = """
-            select user_id from user_ where user_name = %s and password = %s and role = %s
-        """
-        import time
-        time.sleep(0.1)
-
-        column_names, rows = query(sql_query_4_user_id, (username, password, role))
+        column_names, rows = query(sql_query, (username, password, role))
         user_id = rows[0][0]
         
         return str(user_id) if user_id else "Error: Failed to create user."
@@ -467,6 +691,38 @@ def delete_user(user_id):
         return f"Error: {str(e)}"
 
 
+def create_alumni_account(username, password, alumni_data):
+    """
+    Creates a user account and its alumni record in one transaction.
+
+    If either step fails nothing is kept, so there are no user accounts
+    without an alumni record.
+
+    Args:
+        username (str): Username for the new user, also used as the alumni ID. (Required)
+        password (str): Password for the new user. (Required)
+        alumni_data (dict): Alumni fields, see add_alumni. 'alumni_id' and 'user_id' are filled in.
+
+    Returns:
+        str: The new user ID or an error message.
+    """
+    def _create_account():
+        user_id = create_user(username, password, "Alumni")
+        if user_id.startswith("Error"):
+            raise RuntimeError(user_id)
+
+        message = add_alumni({**alumni_data, "alumni_id": username, "user_id": int(user_id)})
+        if "Error" in message or "Failed" in message:
+            raise RuntimeError(message)
+        return user_id
+
+    try:
+        return run_in_transaction(_create_account)
+    except Exception as e:
+        logging.error("Error creating alumni account", exc_info=True)
+        return f"Error: {str(e)}"
+
+
 def update_user(user_id, data):
     """
     Updates a user's details.
@@ -509,6 +765,21 @@ def get_user_details(user_id):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def get_user_name(user_id):
+    """
+    Returns the username of a user, e.g. to revoke their tokens.
+
+    Args:
+        user_id (int): ID of the user.
+
+    Returns:
+        str or None: Username, or None if the user does not exist or cannot be read.
+    """
+    result = query("SELECT user_name FROM user_ WHERE user_id = %s", (user_id,))
+    if not result or not result[1]:
+        return None
+    return result[1][0][0]
+
 # User Role Assignment Functions
 
 def assign_role(user_id, role):
@@ -626,12 +897,12 @@ def get_career_history(career_id):
         return {"status": "error", "message": str(e)}
 
 # Career Analysis Functions
-def get_salary_trends(department, year_range):
+def get_salary_trends(department_id, year_range):
     """
     Retrieves salary trends for alumni in a given department over a specific year range.
 
     Args:
-        department (str): Department name.
+        department_id (int): Department ID (see departments.py).
         year_range (tuple): Tuple containing start year and end year.
 
     Returns:
@@ -642,32 +913,37 @@ def get_salary_trends(department, year_range):
         sql_query = """
             SELECT ch.start_date, ch.monthly_salary, d.department
             FROM career_history as ch
-            JOIN degree_ as d ON ch.alumni_id = d.alumni_id
-            WHERE d.department = %s AND EXTRACT(YEAR FROM ch.start_date) BETWEEN %s AND %s
+            JOIN earned_by as eb ON eb.alumni_id = ch.alumni_id
+            JOIN degree_ as d ON d.degree_id = eb.degree_id
+            WHERE d.department_id = %s AND EXTRACT(YEAR FROM ch.start_date) BETWEEN %s AND %s
         """
-        columns, results = query(sql_query, (department, start_year, end_year))
+        columns, results = query(sql_query, (department_id, start_year, end_year))
         salary_trends = [dict(zip(columns, row)) for row in results]
         return {"status": "success", "salary_trends": salary_trends}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def get_career_paths(alumni_id):
+CAREER_PATHS_SQL = """
+    SELECT {columns}
+    FROM career_history
+    WHERE alumni_id = %s
+    ORDER BY start_date ASC
+"""
+
+
+def get_career_paths(alumni_id, fields=None):
     """
     Retrieves the career paths of an alumni.
 
     Args:
         alumni_id (int): Alumni ID.
+        fields (tuple): Columns to return (see parse_fields), or None for all.
 
     Returns:
         dict: Career path details or error message.
     """
     try:
-        sql_query = """
-            SELECT *
-            FROM career_history
-            WHERE alumni_id = %s
-            ORDER BY start_date ASC
-        """
+        sql_query = projected_sql(CAREER_PATHS_SQL, "career_history", fields)
         columns, results = query(sql_query, (alumni_id,))
         career_paths = [dict(zip(columns, row)) for row in results]
         return {"status": "success", "career_paths": career_paths}
@@ -736,25 +1012,53 @@ def delete_donation(donation_id):
     except Exception as e:
         return f"Error: {str(e)}"
 
-def get_donation(donation_id):
+# donation is partitioned by year of date (see donation_partitions.py). A condition on the
+# date column itself lets the planner skip the other years; EXTRACT(YEAR FROM date) would not.
+DONATION_YEARS_CONDITION = "date >= make_date(%s, 1, 1) AND date < make_date(%s, 1, 1)"
+
+
+def year_range_params(year_range):
+    """
+    Returns the parameters of DONATION_YEARS_CONDITION for a range of years.
+
+    Args:
+        year_range (tuple): Start year and end year, both included.
+
+    Returns:
+        tuple: First year and the year after the last one.
+    """
+    start_year, end_year = year_range
+    return int(start_year), int(end_year) + 1
+
+
+GET_DONATION_SQL = "SELECT {columns} FROM donation WHERE alumni_id = %s"
+GET_DONATION_IN_YEARS_SQL = GET_DONATION_SQL + " AND " + DONATION_YEARS_CONDITION
+
+
+def get_donation(donation_id, shape="dicts", fields=None, year_range=None):
     """
     Retrieves a donation record.
 
     Args:
         donation_id (string): Donation ID.
+        shape (str): 'dicts' or 'columns', see fetch_list.
+        fields (tuple): Columns to return (see parse_fields), or None for all.
+        year_range (tuple): Only donations made in these years (start, end), or None for all.
 
     Returns:
         dict: Donation details or error message.
     """
     try:
-        sql_query = "SELECT * FROM donation WHERE alumni_id = %s"
-        columns, results = query(sql_query, (donation_id,))
-        if not results:
+        if year_range:
+            sql_query = projected_sql(GET_DONATION_IN_YEARS_SQL, "donation", fields)
+            params = (donation_id, *year_range_params(year_range))
+        else:
+            sql_query = projected_sql(GET_DONATION_SQL, "donation", fields)
+            params = (donation_id,)
+        donation_details = fetch_list(sql_query, params, shape)
+        if is_empty_list(donation_details):
             return {"status": "error", "message": "Donation not found"}
 
-        #donation_details = dict(zip(columns, results))
-        donation_details = [dict(zip(columns, row)) for row in results]
-        #career_paths = [dict(zip(columns, row)) for row in results]
         return {"status": "success", "donation_details": donation_details}
     except Exception as e: 
         return {"status": "error", "message": str(e)}
@@ -778,30 +1082,53 @@ def get_total_donations_by_alumni(alumni_id):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def get_top_donors(limit=10):
+TOP_DONORS_SQL = """
+    SELECT alumni_id, SUM(amount) as total_amount
+    FROM donation
+    GROUP BY alumni_id
+    ORDER BY total_amount DESC
+    LIMIT %s
+"""
+TOP_DONORS_IN_YEARS_SQL = f"""
+    SELECT alumni_id, SUM(amount) as total_amount
+    FROM donation
+    WHERE {DONATION_YEARS_CONDITION}
+    GROUP BY alumni_id
+    ORDER BY total_amount DESC
+    LIMIT %s
+"""
+
+
+def get_top_donors(limit=10, year_range=None):
     """
     Retrieves the top donors.
 
     Args:
         limit (int): Number of top donors to retrieve.
+        year_range (tuple): Only count donations made in these years (start, end), or None for all.
 
     Returns:
         dict: List of top donors or error message.
     """
     try:
-        sql_query = """
-            SELECT alumni_id, SUM(amount) as total_amount
-            FROM donation
-            GROUP BY alumni_id
-            ORDER BY total_amount DESC
-            LIMIT %s
-        """
-        columns, results = query(sql_query, (limit,))
+        if year_range:
+            columns, results = query(TOP_DONORS_IN_YEARS_SQL, (*year_range_params(year_range), limit))
+        else:
+            columns, results = query(TOP_DONORS_SQL, (limit,))
         top_donors = [dict(zip(columns, row)) for row in results]
         return {"status": "success", "top_donors": top_donors}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+DONATION_TRENDS_SQL = f"""
+    SELECT EXTRACT(YEAR FROM date) as year, SUM(amount) as total_amount
+    FROM donation
+    WHERE {DONATION_YEARS_CONDITION}
+    GROUP BY year
+    ORDER BY year
+"""
+
+
 def get_donation_trends(year_range):
     """
     Retrieves donation trends over a specific year range.
@@ -813,15 +1140,7 @@ def get_donation_trends(year_range):
         dict: Donation trends data or error message.
     """
     try:
-        start_year, end_year = year_range
-        sql_query = """
-            SELECT EXTRACT(YEAR FROM date) as year, SUM(amount) as total_amount
-            FROM donation
-            WHERE EXTRACT(YEAR FROM date) BETWEEN %s AND %s
-            GROUP BY year
-            ORDER BY year
-        """
-        columns, results = query(sql_query, (start_year, end_year))
+        columns, results = query(DONATION_TRENDS_SQL, year_range_params(year_range))
         trends = [dict(zip(columns, row)) for row in results]
         return {"status": "success", "donation_trends": trends}
     except Exception as e:
@@ -951,18 +1270,22 @@ def list_achievements(alumni_id):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def find_achievements_by_category(category):
+ACHIEVEMENTS_BY_CATEGORY_SQL = "SELECT {columns} FROM achievement WHERE category = %s"
+
+
+def find_achievements_by_category(category, fields=None):
     """
     Finds achievements by category.
 
     Args:
         category (str): Achievement category to search for.
+        fields (tuple): Columns to return (see parse_fields), or None for all.
 
     Returns:
         dict: List of achievements or error message.
     """
     try:
-        sql_query = "SELECT * FROM achievement WHERE category = %s"
+        sql_query = projected_sql(ACHIEVEMENTS_BY_CATEGORY_SQL, "achievement", fields)
         columns, results = query(sql_query, (category,))
         achievements = [dict(zip(columns, row)) for row in results]
         return {"status": "success", "achievements": achievements}
@@ -1054,16 +1377,11 @@ def get_association(association_id):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-import threading
 from datetime import datetime
-import psycopg2
-
-# Create a global lock object
-lock = threading.Lock()
 
 def add_member_to_association(alumni_id, association_id):
     """
-    Adds a member to an association using Python's threading lock to handle concurrency.
+    Adds a member to an association.
 
     Args:
         alumni_id (int): Alumni ID.
@@ -1073,46 +1391,24 @@ def add_member_to_association(alumni_id, association_id):
         str: Success or error message.
     """
     try:
-        # Acquire the lock
-        with lock:
-            # Get the current date in 'YYYY-MM-DD' format
-            today_date = datetime.today().strftime('%Y-%m-%d')
+        # Get the current date in 'YYYY-MM-DD' format
+        today_date = datetime.today().strftime('%Y-%m-%d')
 
-            # Connect to the database
-            conn = psycopg2.connect(
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                host=DB_HOST,
-                port=DB_PORT,  # Explicitly specify port
-            )
-            conn.autocommit = False  # Disable autocommit for transaction control
-            cur = conn.cursor()
-
-            # Execute the insert query
+        # Run inside a transaction so that database errors are raised and reported
+        with transaction():
             sql_query = """
                 INSERT INTO is_member (alumni_id, association_id, join_date)
                 VALUES (%s, %s, %s);
             """
-            cur.execute(sql_query, (alumni_id, association_id, today_date))
-
-            # Commit the transaction
-            conn.commit()
+            query(sql_query, (alumni_id, association_id, today_date))
+            publish_event("membership_changed", {"action": "added", "alumni_id": alumni_id,
+                                                 "association_id": association_id, "join_date": today_date})
 
-            return "Member added to association successfully."
+        return "Member added to association successfully."
 
     except Exception as e:
-        if conn:
-            conn.rollback()  # Rollback in case of an error
         return f"Error: {str(e)}"
 
-    finally:
-        # Ensure the connection and cursor are properly closed
-        if 'cur' in locals() and cur:
-            cur.close()
-        if 'conn' in locals() and conn:
-            conn.close()
-
 
 
 def remove_member_from_association(alumni_id, association_id):
@@ -1127,8 +1423,11 @@ def remove_member_from_association(alumni_id, association_id):
         str: Success or error message.
     """
     try:
-        sql_query = "DELETE FROM is_member WHERE alumni_id = %s AND association_id = %s"
-        query(sql_query, (alumni_id, association_id))
+        with transaction():
+            sql_query = "DELETE FROM is_member WHERE alumni_id = %s AND association_id = %s"
+            if query(sql_query, (alumni_id, association_id)):
+                publish_event("membership_changed", {"action": "removed", "alumni_id": alumni_id,
+                                                     "association_id": association_id})
         return "Member removed from association successfully."
     except Exception as e:
         return f"Error: {str(e)}"
@@ -1156,8 +1455,6 @@ def list_association_members(association_id):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-import psycopg2
-
 # transaction control
 def create_event(association_id, event_data):
     """
@@ -1174,53 +1471,39 @@ def create_event(association_id, event_data):
     Returns:
         str: Success or error message.
     """
-        # Connect to the PostgreSQL database
-    conn = psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT,  # Explicitly specify port
-    )
-    try:
-        # Begin a transaction
-        conn.autocommit = False  # Disable autocommit to control transactions
-        cur = conn.cursor()
-
-        # Insert into association_event
-        sql_query_event = """
-            INSERT INTO association_event (event_name, date, description, location)
-            VALUES (%s, %s, %s, %s)
-        """
-        cur.execute(sql_query_event, (
-            event_data['event_name'], event_data['date'], event_data['description'], event_data['location']
-        ))
+    try:
+        # Both inserts are committed together, or rolled back together on error
+        with transaction():
+            # Insert into association_event
+            sql_query_event = """
+                INSERT INTO association_event (event_name, date, description, location)
+                VALUES (%s, %s, %s, %s)
+            """
+            query(sql_query_event, (
+                event_data['event_name'], event_data['date'], event_data['description'], event_data['location']
+            ))
+
+            # Insert into held_by
+            sql_query_held_by = """
+                INSERT INTO held_by (association_id, event_name, date)
+                VALUES (%s, %s, %s)
+            """
+            query(sql_query_held_by, (
+                association_id, event_data['event_name'], event_data['date']
+            ))
 
-        # Insert into held_by
-        sql_query_held_by = """
-            INSERT INTO held_by (association_id, event_name, date)
-            VALUES (%s, %s, %s)
-        """
-        cur.execute(sql_query_held_by, (
-            association_id, event_data['event_name'], event_data['date']
-        ))
+            # Sent to the event stream subscribers once the transaction commits; the description
+            # is left out, NOTIFY payloads are limited to 8000 bytes
+            publish_event("event_created", {
+                "association_id": association_id, "event_name": event_data['event_name'],
+                "date": event_data['date'], "location": event_data['location'],
+            })
 
-        # Commit the transaction
-        conn.commit()
         return "Event created successfully."
 
     except Exception as e:
-        # Rollback transaction in case of error
-        conn.rollback()
         return f"Error: {str(e)}"
 
-    finally:
-        # Ensure the connection is closed
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-
 
 def update_event(association_id, event_data):
     """
@@ -1237,12 +1520,18 @@ def update_event(association_id, event_data):
         str: Success or error message.
     """
     try:
-        sql_query = """
-            UPDATE association_event
-            SET description = %s, location = %s
-            WHERE event_name = %s AND date = %s
-        """
-        query(sql_query, (event_data['description'], event_data['location'], event_data['event_name'], event_data['date']))
+        with transaction():
+            sql_query = """
+                UPDATE association_event
+                SET description = %s, location = %s
+                WHERE event_name = %s AND date = %s
+            """
+            if query(sql_query, (event_data['description'], event_data['location'],
+                                 event_data['event_name'], event_data['date'])):
+                publish_event("event_updated", {
+                    "association_id": association_id, "event_name": event_data['event_name'],
+                    "date": event_data['date'], "location": event_data['location'],
+                })
         return "Event updated successfully."
     except Exception as e:
         return f"Error: {str(e)}"
@@ -1259,10 +1548,14 @@ def delete_event(data):
         str: Success or error message.
     """
     try:
-        sql_query = "DELETE FROM association_event WHERE event_name = %s AND date = %s"
-        query(sql_query, (data['event_name'],data['date']))
-        sql_query = "DELETE FROM held_by WHERE event_name = %s AND date = %s"
-        query(sql_query, (data['event_name'],data['date']))
+        with transaction():
+            sql_query = "DELETE FROM held_by WHERE event_name = %s AND date = %s RETURNING association_id"
+            columns, results = query(sql_query, (data['event_name'],data['date']))
+            sql_query = "DELETE FROM association_event WHERE event_name = %s AND date = %s"
+            query(sql_query, (data['event_name'],data['date']))
+            for (association_id,) in results:
+                publish_event("event_deleted", {"association_id": association_id,
+                                                "event_name": data['event_name'], "date": data['date']})
         return "Event deleted successfully."
     except Exception as e:
         return f"Error: {str(e)}"
@@ -1318,18 +1611,25 @@ def remove_member_from_association(alumni_id, association_id):
         str: Success or error message.
     """
     try:
-        sql_query = "DELETE FROM is_member WHERE alumni_id = %s AND association_id = %s"
-        query(sql_query, (alumni_id, association_id))
+        with transaction():
+            sql_query = "DELETE FROM is_member WHERE alumni_id = %s AND association_id = %s"
+            if query(sql_query, (alumni_id, association_id)):
+                publish_event("membership_changed", {"action": "removed", "alumni_id": alumni_id,
+                                                     "association_id": association_id})
         return "Member removed from association successfully."
     except Exception as e:
         return f"Error: {str(e)}"
 
-def list_association_members(association_id):
+def list_association_members(association_id, shape="dicts", include=()):
     """
     Lists all members of an association.
 
     Args:
         association_id (int): Association ID.
+        shape (str): 'dicts' or 'columns', see fetch_list.
+        include (tuple): Related data to embed in every member (keys of LOADER_QUERIES,
+            e.g. ('degree', 'total_donations')). Each is loaded with one query for all
+            members. Only with shape 'dicts'.
 
     Returns:
         dict: List of members or error message.
@@ -1341,127 +1641,44 @@ def list_association_members(association_id):
             JOIN alumni al ON a.alumni_id = al.alumni_id
             WHERE a.association_id = %s
         """
-        columns, results = query(sql_query, (association_id,))
-        members = [dict(zip(columns, row)) for row in results]
+        members = fetch_list(sql_query, (association_id,), shape)
+        alumni_ids = [member["alumni_id"] for member in members] if include else []
+        for name in include:
+            related = get_loader(name).load_many(alumni_ids)
+            for member in members:
+                member[name] = related[member["alumni_id"]]
         return {"status": "success", "members": members}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-def list_events_by_association(association_id):
+EVENTS_BY_ASSOCIATION_SQL = """
+    SELECT {columns} FROM association_event
+    JOIN held_by ON association_event.event_name = held_by.event_name AND association_event.date = held_by.date
+    WHERE held_by.association_id = %s
+"""
+
+
+def list_events_by_association(association_id, shape="dicts", fields=None):
     """
     Lists all events for a specific association.
 
     Args:
         association_id (int): Association ID.
+        shape (str): 'dicts' or 'columns', see fetch_list.
+        fields (tuple): association_event columns to return (see parse_fields), or None for all.
 
     Returns:
         dict: List of events or error message.
     """
     try:
-        sql_query = """
-            SELECT * FROM association_event
-            JOIN held_by ON association_event.event_name = held_by.event_name AND association_event.date = held_by.date
-            WHERE held_by.association_id = %s
-        """
-        columns, results = query(sql_query, (association_id,))
-        events = [dict(zip(columns, row)) for row in results]
+        sql_query = projected_sql(EVENTS_BY_ASSOCIATION_SQL, "association_event", fields)
+        events = fetch_list(sql_query, (association_id,), shape)
         return {"status": "success", "events": events}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-# Data Analysis Functions
-
-# Trends and Insights Functions
-# def get_alumni_employment_trends(department, year_range):
-#     """
-#     Retrieves alumni employment trends for a specific department over a year range.
-
-#     Args:
-#         department (str): Department name.
-#         year_range (tuple): Tuple containing start year and end year.
-
-#     Returns:
-#         dict: Employment trend data or error message.
-#     """
-#     try:
-#         start_year, end_year = year_range
-#         sql_query = """
-#             SELECT graduation_year, COUNT(*) AS total_employed
-#             FROM career_history ch
-#             JOIN alumni al ON ch.alumni_id = al.alumni_id
-#             WHERE al.department = %s AND graduation_year BETWEEN %s AND %s
-#             GROUP BY graduation_year
-#             ORDER BY graduation_year
-#         """
-#         columns, results = query(sql_query, (department, start_year, end_year))
-#         trends = [dict(zip(columns, row)) for row in results]
-#         return {"status": "success", "employment_trends": trends}
-#     except Exception as e:
-#         return {"status": "error", "message": str(e)}
-
-# def calculate_donation_correlations():
-#     """
-#     Calculates correlations between alumni demographics and donation amounts.
-
-#     Returns:
-#         dict: Correlation results or error message.
-#     """
-#     try:
-#         sql_query = """
-#             SELECT al.department, COUNT(d.donation_id) AS total_donations, AVG(d.amount) AS avg_donation_amount
-#             FROM donation d
-#             JOIN alumni al ON d.alumni_id = al.alumni_id
-#             GROUP BY al.department
-#         """
-#         columns, results = query(sql_query)
-#         correlations = [dict(zip(columns, row)) for row in results]
-#         return {"status": "success", "donation_correlations": correlations}
-#     except Exception as e:
-#         return {"status": "error", "message": str(e)}
-
-# # Special Reports Functions
-# def generate_30_year_reunion_list():
-#     """
-#     Generates a list of alumni who graduated 30 years ago.
-
-#     Returns:
-#         dict: List of alumni or error message.
-#     """
-#     try:
-#         sql_query = """
-#             SELECT first_name, last_name, graduation_year
-#             FROM alumni
-#             WHERE graduation_year = EXTRACT(YEAR FROM NOW()) - 30
-#         """
-#         columns, results = query(sql_query)
-#         reunion_list = [dict(zip(columns, row)) for row in results]
-#         return {"status": "success", "reunion_list": reunion_list}
-#     except Exception as e:
-#         return {"status": "error", "message": str(e)}
-
-# def get_top_achievers(limit=10):
-#     """
-#     Retrieves the top achievers.
-
-#     Args:
-#         limit (int): Number of top achievers to retrieve.
-
-#     Returns:
-#         dict: List of top achievers or error message.
-#     """
-#     try:
-#         sql_query = """
-#             SELECT alumni_id, title, description, date
-#             FROM achievement
-#             ORDER BY date DESC
-#             LIMIT %s
-#         """
-#         columns, results = query(sql_query, (limit,))
-#         top_achievers = [dict(zip(columns, row)) for row in results]
-#         return {"status": "success", "top_achievers": top_achievers}
-#     except Exception as e:
-#         return {"status": "error", "message": str(e)}
+# Data analysis functions live in reporting.py
 
 # Event Participation CRUD Functions
 def add_event_participant(data):
@@ -1620,19 +1837,23 @@ def list_user_association_events(alumni_id):
         return {"status": "error", "message": str(e)}
 
     
-def get_all_open_association():
+OPEN_ASSOCIATIONS_SQL = "SELECT {columns} FROM alumni_association"
+
+
+def get_all_open_association(fields=None):
     """
-    Retrieves an association record.
+    Retrieves all association records.
 
     Args:
-        association_id (int): Association ID.
+        fields (tuple): Columns to return (see parse_fields), or None for all.
 
     Returns:
         dict: Association details or error message.
     """
     try:
-        sql_query = "SELECT * FROM alumni_association"
-        columns, results = query(sql_query, ())
+        sql_query = projected_sql(OPEN_ASSOCIATIONS_SQL, "alumni_association", fields)
+        # Requested by many alumni at once when an event is announced
+        columns, results = coalesced_query(sql_query, ())
         if not results:
             return {"status": "error", "message": "Association not found"}
 
@@ -1643,19 +1864,22 @@ def get_all_open_association():
     except Exception as e:
         return {"status": "error", "message": str(e)}
     
-def get_all_upcoming_events():
+UPCOMING_EVENTS_SQL = "SELECT {columns} FROM association_event WHERE date >= NOW()"
+
+
+def get_all_upcoming_events(fields=None):
     """
-    Retrieves an association record.
+    Retrieves all upcoming events.
 
     Args:
-        association_id (int): Association ID.
+        fields (tuple): Columns to return (see parse_fields), or None for all.
 
     Returns:
         dict: Association details or error message.
     """
     try:
-        sql_query = "SELECT * FROM association_event WHERE date >= NOW()"
-        columns, results = query(sql_query, ())
+        sql_query = projected_sql(UPCOMING_EVENTS_SQL, "association_event", fields)
+        columns, results = coalesced_query(sql_query, ())
         if not results:
             return {"status": "error", "message": "Events not found"}
 
@@ -1750,3 +1974,48 @@ def end_cadre(association_id, alumni_id):
         return "Cadre position ended successfully."
     except Exception as e:
         return f"Error: {str(e)}"
+
+
+def handover_cadre(association_id, handovers):
+    """
+    Hands cadre positions of an association over to new alumni in one transaction.
+
+    For every handover the current holder's is_cadre row is ended and the
+    successor's row is inserted. If any step fails (e.g., the current holder
+    does not hold that position any more), nothing is changed, so the
+    association is never left without a cadre or with two.
+
+    Args:
+        association_id (int): The ID of the association.
+        handovers (list): List of dictionaries, one per position:
+            - from_alumni_id (str): Current holder of the position.
+            - to_alumni_id (str): Successor.
+            - position (str): Cadre position.
+
+    Returns:
+        str: Success or error message.
+    """
+    def _handover():
+        for item in handovers:
+            # Ending the row also locks it, so a concurrent handover of the same position waits and then fails
+            sql_query = """
+                UPDATE is_cadre
+                SET end_date = CURRENT_DATE
+                WHERE association_id = %s AND alumni_id = %s AND position = %s AND end_date IS NULL;
+            """
+            rows_affected = execute_update(sql_query, (association_id, item['from_alumni_id'], item['position']))
+            if not rows_affected:
+                raise ValueError(f"{item['from_alumni_id']} does not hold the position {item['position']}")
+
+            sql_query = """
+                INSERT INTO is_cadre (alumni_id, association_id, position, start_date)
+                VALUES (%s, %s, %s, CURRENT_DATE)
+            """
+            execute_update(sql_query, (item['to_alumni_id'], association_id, item['position']))
+
+    try:
+        run_in_transaction(_handover)
+        return f"{len(handovers)} cadre position(s) handed over successfully."
+    except Exception as e:
+        logging.error("Error handing over cadre positions", exc_info=True)
+        return f"Error: {str(e)}"
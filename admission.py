@@ -0,0 +1,210 @@
+import math
+import threading
+import time
+from collections import Counter
+
+# Admission control setup
+# Route classes: requests per second and burst allowed to each client, the
+# number of requests of the class a process runs at once (None for no limit),
+# and the seconds each of their statements may run before it is cancelled.
+# The database pool has POOL_MAX_CONNECTIONS (20) connections, heavy requests
+# may only hold a few of them so that lookups keep working under load.
+ROUTE_CLASSES = {
+    "lookup": {"rate": 20.0, "burst": 40, "max_concurrent": None, "statement_timeout": 10},
+    "heavy": {"rate": 0.5, "burst": 3, "max_concurrent": 4, "statement_timeout": 300},
+}
+DEFAULT_ROUTE_CLASS = "lookup"
+SHED_RETRY_AFTER = 1  # seconds a client is told to wait when every slot of its class is busy
+MAX_BUCKETS = 10000  # idle buckets are dropped beyond this many clients and classes
+TOP_THROTTLED_CLIENTS = 10  # clients listed by stats()
+
+
+class Admission:
+    """
+    Decision of AdmissionController.admit for one request.
+
+    Attributes:
+        allowed (bool): Whether the request may run.
+        status (int): 429 (rate limited) or 503 (too many running) when rejected.
+        message (str): Reason of the rejection.
+        retry_after (int): Seconds the client should wait before retrying.
+        statement_timeout (float): Statement timeout of the route class, when allowed.
+    """
+
+    def __init__(self, allowed, status=None, message=None, retry_after=None, slot=None, statement_timeout=None):
+        self.allowed = allowed
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+        self.statement_timeout = statement_timeout
+        self._slot = slot
+
+    def release(self):
+        """
+        Frees the concurrency slot of the request, once it is done. Safe to call more than once.
+        """
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            slot.release()
+
+
+class _ClassLimits:
+    """
+    Limits and counters of one route class.
+    """
+
+    def __init__(self, name, rate, burst, max_concurrent, statement_timeout):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.statement_timeout = statement_timeout
+        self.slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.in_flight = 0
+        self.admitted = 0
+        self.throttled = 0
+        self.shed = 0
+
+
+class _Slot:
+    """
+    Concurrency slot held by one admitted request.
+    """
+
+    def __init__(self, controller, limits):
+        self._controller = controller
+        self._limits = limits
+
+    def release(self):
+        with self._controller._lock:
+            self._limits.in_flight -= 1
+        if self._limits.slots is not None:
+            self._limits.slots.release()
+
+
+class AdmissionController:
+    """
+    Decides whether a request may run, before it takes a database connection.
+
+    Each client gets a token bucket per route class: a request takes a token,
+    tokens come back at `rate` per second up to `burst`, and a request finding
+    the bucket empty is rejected with 429. Classes with `max_concurrent` also
+    bound the requests running at once; when all slots are busy the request is
+    rejected with 503 at once instead of queueing for a connection.
+
+    Limits are per process: with several workers a client gets the limits of
+    every worker its requests reach.
+    """
+
+    def __init__(self, route_classes=ROUTE_CLASSES):
+        self._classes = {name: _ClassLimits(name, **limits) for name, limits in route_classes.items()}
+        self._buckets = {}  # (client, route class) -> [tokens, time of the last refill]
+        self._throttled_clients = Counter()
+        self._lock = threading.Lock()
+
+    def _take_token(self, limits, client, now):
+        # Returns 0 when a token was taken, otherwise the seconds until one is available
+        bucket = self._buckets.get((client, limits.name))
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._drop_idle_buckets(now)
+            bucket = self._buckets[(client, limits.name)] = [float(limits.burst), now]
+        tokens = min(limits.burst, bucket[0] + (now - bucket[1]) * limits.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0
+        bucket[0] = tokens
+        return (1 - tokens) / limits.rate
+
+    def _drop_idle_buckets(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        for key, (tokens, updated) in list(self._buckets.items()):
+            limits = self._classes[key[1]]
+            if tokens + (now - updated) * limits.rate >= limits.burst:
+                del self._buckets[key]
+
+    def admit(self, client, route_class=DEFAULT_ROUTE_CLASS):
+        """
+        Checks the rate limit and concurrency limit of a request.
+
+        Args:
+            client (str): Who sends the request (e.g., the username, or the IP address of anonymous clients).
+            route_class (str): Route class of the endpoint, a key of ROUTE_CLASSES.
+
+        Returns:
+            Admission: The decision. When allowed, call release() once the response is sent.
+        """
+        limits = self._classes[route_class]
+        with self._lock:
+            wait = self._take_token(limits, client, time.monotonic())
+            if wait:
+                limits.throttled += 1
+                self._throttled_clients[client] += 1
+                if len(self._throttled_clients) > MAX_BUCKETS:
+                    self._throttled_clients = Counter(dict(self._throttled_clients.most_common(TOP_THROTTLED_CLIENTS)))
+                return Admission(False, 429, f"Rate limit exceeded for {route_class} requests",
+                                 max(math.ceil(wait), 1))
+
+        if limits.slots is not None and not limits.slots.acquire(blocking=False):
+            with self._lock:
+                limits.shed += 1
+            return Admission(False, 503, f"Too many {route_class} requests running, try again later",
+                             SHED_RETRY_AFTER)
+
+        with self._lock:
+            limits.admitted += 1
+            limits.in_flight += 1
+        return Admission(True, slot=_Slot(self, limits), statement_timeout=limits.statement_timeout)
+
+    def stats(self):
+        """
+        Returns the admission metrics of this process.
+
+        Returns:
+            dict: Per route class, its limits and the requests admitted, throttled (429),
+                  shed (503) and running; plus the clients throttled most often.
+        """
+        with self._lock:
+            classes = {
+                limits.name: {
+                    "rate": limits.rate,
+                    "burst": limits.burst,
+                    "max_concurrent": limits.max_concurrent,
+                    "statement_timeout": limits.statement_timeout,
+                    "admitted": limits.admitted,
+                    "throttled": limits.throttled,
+                    "shed": limits.shed,
+                    "in_flight": limits.in_flight,
+                }
+                for limits in self._classes.values()
+            }
+            top_clients = self._throttled_clients.most_common(TOP_THROTTLED_CLIENTS)
+            return {"classes": classes, "clients": len(self._buckets),
+                    "top_throttled_clients": [{"client": client, "throttled": count}
+                                              for client, count in top_clients]}
+
+
+def route_class(name):
+    """
+    Assigns an endpoint to a route class of ROUTE_CLASSES (DEFAULT_ROUTE_CLASS otherwise).
+
+    Place it directly below `@app.route`.
+
+    Args:
+        name (str): Route class (e.g., 'heavy').
+
+    Returns:
+        function: The decorator, which returns the view function unchanged.
+    """
+    if name not in ROUTE_CLASSES:
+        raise ValueError(f"Unknown route class: {name}")
+
+    def decorator(view):
+        view.route_class = name
+        return view
+    return decorator
+
+
+# Shared by every request of the process
+admission = AdmissionController()
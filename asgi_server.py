@@ -0,0 +1,360 @@
+"""
+Async (ASGI) serving mode of the alumni API.
+
+The busiest read endpoints are served by async handlers on an async
+PostgreSQL pool, so a slow client or a slow query waits on the event loop
+instead of holding a thread. They use the SQL of HelpFunctions.py and return
+the same JSON as server.py. Every other route is forwarded to the Flask app
+of server.py, so the full API is available on one port.
+
+Run:
+    uvicorn asgi_server:app --port 5002
+or:
+    python asgi_server.py
+"""
+import asyncio
+import contextlib
+import time
+from functools import wraps
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import server
+from async_db_connection import (async_query, async_fetch_list, async_replica_reads, async_statement_timeout,
+                                  open_async_pool, close_async_pool)
+from db_connection import db_circuit, start_replica_monitor
+from HelpFunctions import (GET_ALUMNI_SQL, LIST_ALUMNI_SQL, GET_DONATION_SQL, GET_DONATION_IN_YEARS_SQL,
+                           TOP_DONORS_SQL, TOP_DONORS_IN_YEARS_SQL,
+                           ACHIEVEMENTS_BY_CATEGORY_SQL, OPEN_ASSOCIATIONS_SQL, UPCOMING_EVENTS_SQL,
+                           is_empty_list, parse_fields, projected_sql, year_range_params)
+from departments import init_departments
+from donation_partitions import start_partition_maintenance
+from jobs import start_job_workers
+from auth_tokens import InvalidTokenError, start_revocation_sync, verify_token
+from admission import DEFAULT_ROUTE_CLASS, admission
+from idempotency import start_idempotency_cleanup
+from change_notify import start_change_listener
+from event_stream import AsyncSubscription, MEMBERSHIPS_SQL, async_sse_stream, event_broker
+from reporting import start_report_scheduler
+from response_encoding import COMPRESS_MIN_SIZE, compress_body, dumps_bytes
+
+ASGI_PORT = 5002
+WSGI_WORKERS = 20  # threads serving the routes forwarded to the Flask app
+DISCONNECT_POLL_INTERVAL = 0.5  # seconds between two checks that the client of a running handler is still there
+
+
+def json_response(request, payload, status_code=200):
+    """
+    Builds a JSON response encoded and compressed like the Flask app does.
+
+    Args:
+        request (Request): The incoming request.
+        payload (dict): The response data.
+        status_code (int): HTTP status code.
+
+    Returns:
+        Response: The JSON response.
+    """
+    body = dumps_bytes(payload)
+    headers = {}
+    if status_code == 200 and len(body) >= COMPRESS_MIN_SIZE:
+        headers["Vary"] = "Accept-Encoding"
+        accepted = request.headers.get("accept-encoding", "").lower()
+        body, encoding = compress_body(body, "br" in accepted, "gzip" in accepted)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def admitted(route_class=DEFAULT_ROUTE_CLASS):
+    """
+    Applies the authentication and admission control of the Flask app
+    (server.authenticate_request and server.admit_request) to an async handler.
+
+    Args:
+        route_class (str): Route class of the endpoint, a key of admission.ROUTE_CLASSES.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            # Same rules as server.authenticate_request: no header is anonymous, a bad token is a 401
+            client = request.client.host if request.client else None
+            authorization = request.headers.get("authorization")
+            if authorization:
+                scheme, _, token = authorization.partition(" ")
+                if scheme.lower() != "bearer" or not token.strip():
+                    return json_response(request, {"status": "error",
+                                                   "message": "Authorization header must be 'Bearer <token>'"}, 401)
+                try:
+                    client = verify_token(token.strip())["name"]
+                except InvalidTokenError as e:
+                    return json_response(request, {"status": "error", "message": str(e)}, 401)
+            retry_after = db_circuit.retry_after()
+            if retry_after:
+                response = json_response(request, {"status": "error",
+                                                   "message": "Database unavailable, try again later"}, 503)
+                response.headers["Retry-After"] = str(max(int(retry_after), 1))
+                return response
+            current = admission.admit(client, route_class)
+            if not current.allowed:
+                response = json_response(request, {"status": "error", "message": current.message}, current.status)
+                response.headers["Retry-After"] = str(current.retry_after)
+                return response
+            token = async_statement_timeout.set(current.statement_timeout)
+            # Same read-your-writes rule as server.route_reads; these handlers only read
+            pinned = _float_cookie(request, server.PRIMARY_READS_COOKIE) > time.time()
+            replica_token = async_replica_reads.set(not pinned)
+            try:
+                return await _cancel_on_disconnect(request, handler(request))
+            finally:
+                async_replica_reads.reset(replica_token)
+                async_statement_timeout.reset(token)
+                current.release()
+        return wrapper
+    return decorator
+
+
+async def _cancel_on_disconnect(request, coroutine):
+    # Runs a handler, cancelling it (and the query it waits on, on the server) if the client goes away
+    task = asyncio.ensure_future(coroutine)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+                # Nobody is left to read it
+                return Response(status_code=499)
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _float_cookie(request, name):
+    try:
+        return float(request.cookies[name])
+    except (KeyError, ValueError):
+        return 0.0
+
+
+def _int_arg(request, name, default):
+    # Same behavior as Flask's request.args.get(name, default, type=int)
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _result_shape(request):
+    shape = request.query_params.get("shape", "dicts")
+    return shape if shape in server.RESULT_SHAPES else None
+
+
+def _fields_arg(request, table):
+    # Same validation as server.get_fields_arg, returns (fields, error response or None)
+    try:
+        return parse_fields(table, request.query_params.get("fields")), None
+    except ValueError as e:
+        return None, json_response(request, {"status": "error", "message": str(e)}, 400)
+
+
+def _year_range_arg(request):
+    # Same validation as server.get_year_range_arg, returns (year range or None, error response or None)
+    start_year = _int_arg(request, "start_year", None)
+    end_year = _int_arg(request, "end_year", None)
+    if start_year is None and end_year is None:
+        return None, None
+    if start_year is None or end_year is None:
+        return None, json_response(request, {"status": "error",
+                                             "message": "start_year and end_year must be given together"}, 400)
+    return (start_year, end_year), None
+
+
+@admitted()
+async def get_alumni_endpoint(request):
+    """Retrieves alumni details, see server.get_alumni_endpoint."""
+    fields, error = _fields_arg(request, "alumni")
+    if error:
+        return error
+    try:
+        columns, results = await async_query(projected_sql(GET_ALUMNI_SQL, "alumni", fields),
+                                             (request.path_params["alumni_id"],))
+        if not results:
+            return json_response(request, {"status": "error", "message": "Alumni not found"}, 404)
+        return json_response(request, {"status": "success", "alumni_details": dict(zip(columns, results[0]))})
+    except Exception:
+        return json_response(request, {"status": "error",
+                                       "message": "An error occurred while retrieving alumni details."}, 404)
+
+
+@admitted("heavy")
+async def list_alumni_endpoint(request):
+    """Lists all alumni, see server.list_alumni_endpoint."""
+    shape = _result_shape(request)
+    if shape is None:
+        return json_response(request, {"status": "error", "message": "shape must be one of: dicts, columns"}, 400)
+    try:
+        alumni_list = await async_fetch_list(LIST_ALUMNI_SQL, shape=shape)
+        return json_response(request, {"status": "success", "alumni_list": alumni_list})
+    except Exception as e:
+        return json_response(request, {"status": "error", "message": str(e)})
+
+
+@admitted()
+async def get_donation_endpoint(request):
+    """Retrieves the donations of an alumni, see server.get_donation_endpoint."""
+    shape = _result_shape(request)
+    if shape is None:
+        return json_response(request, {"status": "error", "message": "shape must be one of: dicts, columns"}, 400)
+    fields, error = _fields_arg(request, "donation")
+    if error:
+        return error
+    year_range, error = _year_range_arg(request)
+    if error:
+        return error
+    try:
+        if year_range:
+            sql_query = projected_sql(GET_DONATION_IN_YEARS_SQL, "donation", fields)
+            params = (request.path_params["donation_id"], *year_range_params(year_range))
+        else:
+            sql_query = projected_sql(GET_DONATION_SQL, "donation", fields)
+            params = (request.path_params["donation_id"],)
+        donation_details = await async_fetch_list(sql_query, params, shape)
+        if is_empty_list(donation_details):
+            return json_response(request, {"status": "error", "message": "Donation not found"}, 404)
+        return json_response(request, {"status": "success", "donation_details": donation_details})
+    except Exception as e:
+        return json_response(request, {"status": "error", "message": str(e)}, 404)
+
+
+@admitted()
+async def get_top_donors_endpoint(request):
+    """Retrieves the top donors, see server.get_top_donors_endpoint."""
+    year_range, error = _year_range_arg(request)
+    if error:
+        return error
+    limit = _int_arg(request, "limit", 10)
+    try:
+        if year_range:
+            top_donors = await async_fetch_list(TOP_DONORS_IN_YEARS_SQL, (*year_range_params(year_range), limit))
+        else:
+            top_donors = await async_fetch_list(TOP_DONORS_SQL, (limit,))
+        return json_response(request, {"status": "success", "top_donors": top_donors})
+    except Exception as e:
+        return json_response(request, {"status": "error", "message": str(e)})
+
+
+@admitted()
+async def find_achievements_by_category_endpoint(request):
+    """Finds achievements by category, see server.find_achievements_by_category_endpoint."""
+    category = request.query_params.get("category")
+    if not category:
+        return json_response(request, {"status": "error", "message": "Missing category parameter"}, 400)
+    fields, error = _fields_arg(request, "achievement")
+    if error:
+        return error
+    try:
+        achievements = await async_fetch_list(projected_sql(ACHIEVEMENTS_BY_CATEGORY_SQL, "achievement", fields),
+                                              (category,))
+        return json_response(request, {"status": "success", "achievements": achievements})
+    except Exception as e:
+        return json_response(request, {"status": "error", "message": str(e)})
+
+
+@admitted()
+async def get_all_associations_endpoint(request):
+    """Retrieves all associations, see server.get_all_associations_endpoint."""
+    fields, error = _fields_arg(request, "alumni_association")
+    if error:
+        return error
+    try:
+        associations = await async_fetch_list(projected_sql(OPEN_ASSOCIATIONS_SQL, "alumni_association", fields), (),
+                                              coalesce=True)
+        if not associations:
+            return json_response(request, {"status": "error", "message": "Association not found"}, 404)
+        return json_response(request, {"status": "success", "association_details": associations})
+    except Exception as e:
+        return json_response(request, {"status": "error", "message": str(e)}, 404)
+
+
+@admitted()
+async def get_all_upcoming_events_endpoint(request):
+    """Retrieves all upcoming events, see server.get_all_upcoming_events_endpoint."""
+    fields, error = _fields_arg(request, "association_event")
+    if error:
+        return error
+    try:
+        events = await async_fetch_list(projected_sql(UPCOMING_EVENTS_SQL, "association_event", fields), (),
+                                        coalesce=True)
+        if not events:
+            return json_response(request, {"status": "error", "message": "Events not found"}, 404)
+        return json_response(request, {"status": "success", "events": events})
+    except Exception as e:
+        return json_response(request, {"status": "error", "message": str(e)}, 404)
+
+
+@admitted()
+async def stream_events_endpoint(request):
+    """
+    Streams event and membership changes, see server.stream_events_endpoint.
+
+    Each open stream only holds a queue here, not a worker thread as it does in the Flask app.
+    """
+    alumni_id = request.query_params.get("alumni_id")
+    try:
+        member_of = ()
+        if alumni_id:
+            columns, results = await async_query(MEMBERSHIPS_SQL, (alumni_id,))
+            member_of = [association_id for (association_id,) in results]
+        subscription = AsyncSubscription(asyncio.get_running_loop(), request.query_params.getlist("association_id"),
+                                         alumni_id, member_of)
+        replay = event_broker.subscribe(subscription, request.headers.get("last-event-id"))
+    except RuntimeError as e:
+        return json_response(request, {"status": "error", "message": str(e)}, 503)
+    except Exception as e:
+        return json_response(request, {"status": "error", "message": str(e)}, 500)
+    return StreamingResponse(async_sse_stream(subscription, replay), media_type="text/event-stream",
+                             headers=server.SSE_HEADERS)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await open_async_pool()
+    init_departments()
+    start_report_scheduler()
+    start_job_workers()
+    start_revocation_sync()
+    start_change_listener()
+    start_replica_monitor()
+    start_partition_maintenance()
+    start_idempotency_cleanup()
+    yield
+    await close_async_pool()
+
+
+routes = [
+    Route("/get_alumni/{alumni_id}", get_alumni_endpoint, methods=["GET"]),
+    Route("/list_alumni", list_alumni_endpoint, methods=["GET"]),
+    Route("/get_donation/{donation_id}", get_donation_endpoint, methods=["GET"]),
+    Route("/get_top_donors", get_top_donors_endpoint, methods=["GET"]),
+    Route("/find_achievements_by_category", find_achievements_by_category_endpoint, methods=["GET"]),
+    Route("/get_all_open_associations", get_all_associations_endpoint, methods=["GET"]),
+    Route("/get_all_upcoming_events", get_all_upcoming_events_endpoint, methods=["GET"]),
+    Route("/stream/events", stream_events_endpoint, methods=["GET"]),
+    # Everything else, including writes and logins, is handled by the Flask app
+    Mount("/", app=WSGIMiddleware(server.app, workers=WSGI_WORKERS)),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, port=ASGI_PORT)
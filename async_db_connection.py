@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+
+import psycopg
+from psycopg import errors
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from db_connection import (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, CONNECT_TIMEOUT, STATEMENT_TIMEOUT,
+                           REPLICA_POOL_MAX_CONNECTIONS, choose_replica, db_circuit, is_read_only_sql,
+                           record_cancelled, record_statement_timeout, shape_rows)
+from single_flight import query_flight
+
+# Async connection pool setup
+# One pooled connection serves one query at a time, while thousands of requests can wait for it without a thread each
+ASYNC_POOL_MIN_CONNECTIONS = 2
+ASYNC_POOL_MAX_CONNECTIONS = 20
+ASYNC_POOL_TIMEOUT = 30  # seconds a request waits for a free connection
+
+_async_pool = None
+_async_replica_pools = {}  # replica name -> AsyncConnectionPool, opened on first use
+
+# Statement timeout of the current request, the async counterpart of db_connection.statement_timeout()
+async_statement_timeout = ContextVar("async_statement_timeout", default=None)
+# Whether read-only queries of the current request may run on a replica, see db_connection.replica_reads()
+async_replica_reads = ContextVar("async_replica_reads", default=False)
+
+
+def _conninfo(host, port):
+    return make_conninfo(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=host, port=port,
+                         connect_timeout=CONNECT_TIMEOUT, options=f"-c statement_timeout={STATEMENT_TIMEOUT * 1000}")
+
+
+async def open_async_pool():
+    """
+    Opens the process-wide async connection pool. Called when the ASGI server starts.
+
+    Returns:
+        AsyncConnectionPool: The connection pool.
+    """
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = AsyncConnectionPool(
+            _conninfo(DB_HOST, DB_PORT),
+            min_size=ASYNC_POOL_MIN_CONNECTIONS,
+            max_size=ASYNC_POOL_MAX_CONNECTIONS,
+            timeout=ASYNC_POOL_TIMEOUT,
+            open=False,
+        )
+        await _async_pool.open()
+    return _async_pool
+
+
+async def close_async_pool():
+    """
+    Closes the async connection pool. Called when the ASGI server stops.
+    """
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+    while _async_replica_pools:
+        _, replica_pool = _async_replica_pools.popitem()
+        await replica_pool.close()
+
+
+async def _open_replica_pool(replica):
+    replica_pool = _async_replica_pools.get(replica.name)
+    if replica_pool is None:
+        replica_pool = AsyncConnectionPool(_conninfo(replica.host, replica.port), min_size=0,
+                                           max_size=REPLICA_POOL_MAX_CONNECTIONS, timeout=ASYNC_POOL_TIMEOUT,
+                                           open=False)
+        await replica_pool.open()
+        # Another request may have opened one meanwhile
+        if _async_replica_pools.setdefault(replica.name, replica_pool) is not replica_pool:
+            await replica_pool.close()
+            replica_pool = _async_replica_pools[replica.name]
+    return replica_pool
+
+
+async def _run(pool, sql_query, params, shape, timeout):
+    async with pool.connection() as connection:
+        async with connection.cursor() as cursor:
+            if timeout is not None and timeout != STATEMENT_TIMEOUT:
+                # Only lasts until the end of the transaction, which ends when the connection goes back
+                await cursor.execute("SELECT set_config('statement_timeout', %s, true)",
+                                     (str(int(timeout * 1000)),))
+            await cursor.execute(sql_query, params)
+            column_names = [desc.name for desc in cursor.description]
+            return column_names, shape_rows(column_names, await cursor.fetchall(), shape)
+
+
+async def async_query(sql_query, params=None, shape="rows", timeout=None):
+    """
+    Executes a SELECT query on the async pool.
+
+    psycopg 3 uses the same %s placeholders as psycopg2, so the SQL strings
+    of HelpFunctions.py run unchanged. If the calling task is cancelled (e.g.,
+    the client disconnected), psycopg cancels the query on the server.
+
+    Args:
+        sql_query (str): SQL query string.
+        params (tuple): Parameters to substitute in the SQL query.
+        shape (str): Result shape, 'rows', 'columns' or 'records' (see db_connection.shape_rows).
+        timeout (float): Seconds the query may run, defaults to async_statement_timeout or STATEMENT_TIMEOUT.
+
+    Returns:
+        tuple: Column names and results.
+    """
+    timeout = timeout if timeout is not None else async_statement_timeout.get()
+    replica = choose_replica() if async_replica_reads.get() and is_read_only_sql(sql_query) else None
+    if replica is not None:
+        try:
+            with replica.track():
+                return await _run(await _open_replica_pool(replica), sql_query, params, shape, timeout)
+        except asyncio.CancelledError:
+            record_cancelled()
+            raise
+        except PoolTimeout:
+            # The replica's pool is saturated, not down: the primary answers this one
+            pass
+        except (psycopg.OperationalError, errors.SerializationFailure) as e:
+            if isinstance(e, errors.QueryCanceled):
+                record_statement_timeout()
+                raise
+            # The replica went away, or cancelled the query for a conflict with replication
+            if not isinstance(e, errors.SerializationFailure):
+                replica.mark_down(e)
+
+    pool = await open_async_pool()
+    db_circuit.before_call()
+    try:
+        result = await _run(pool, sql_query, params, shape, timeout)
+    except asyncio.CancelledError:
+        record_cancelled()
+        raise
+    except PoolTimeout:
+        # Every connection is busy: the database is loaded, not unreachable, so the circuit breaker ignores it
+        logging.warning("No async connection free after %ss", ASYNC_POOL_TIMEOUT)
+        raise
+    except Exception as e:
+        if isinstance(e, errors.QueryCanceled):
+            record_statement_timeout()
+        if isinstance(e, psycopg.OperationalError) and not isinstance(e, errors.QueryCanceled):
+            db_circuit.record_failure()
+        else:
+            db_circuit.record_success()
+        logging.error("Error executing async query", exc_info=True)
+        raise
+    db_circuit.record_success()
+    return result
+
+
+async def async_coalesced_query(sql_query, params=None, shape="rows"):
+    """
+    Async counterpart of HelpFunctions.coalesced_query: identical concurrent
+    queries share one execution.
+
+    Returns:
+        tuple: Column names and results, shared between callers (do not modify).
+    """
+    return await query_flight.do_async((sql_query, repr(params), shape, async_replica_reads.get()),
+                                       lambda: async_query(sql_query, params, shape))
+
+
+async def async_fetch_list(sql_query, params=None, shape="dicts", coalesce=False):
+    """
+    Async counterpart of HelpFunctions.fetch_list.
+
+    Args:
+        sql_query (str): SQL query string.
+        params (tuple): Parameters to substitute in the SQL query.
+        shape (str): 'dicts' or 'columns', see HelpFunctions.fetch_list.
+        coalesce (bool): Share the execution with identical queries in flight.
+
+    Returns:
+        list or dict: The rows in the requested shape.
+    """
+    run_query = async_coalesced_query if coalesce else async_query
+    if shape == "columns":
+        columns, data = await run_query(sql_query, params, shape="columns")
+        return {"columns": columns, "data": data, "row_count": len(data[0]) if data else 0}
+    columns, results = await run_query(sql_query, params)
+    return [dict(zip(columns, row)) for row in results]
@@ -0,0 +1,221 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from functools import lru_cache
+
+from db_connection import query, transaction
+
+# Token setup
+# Every server process must use the same key, otherwise a token is only accepted by the process that issued it
+AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY")
+TOKEN_TTL = 8 * 60 * 60  # seconds a token stays valid
+REVOCATION_SYNC_INTERVAL = 30  # seconds between two reloads of the revocation list
+
+if AUTH_SECRET_KEY:
+    _signing_key = AUTH_SECRET_KEY.encode()
+else:
+    _signing_key = secrets.token_bytes(32)
+    logging.warning("AUTH_SECRET_KEY is not set, tokens are signed with a random key and only valid in this process")
+
+# A row with a jti revokes one token; a row with only a user_name revokes every token
+# of that user issued before revoked_at. Rows are kept until the tokens they revoke expire.
+REVOCATION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS auth_revocation (
+        revocation_id SERIAL PRIMARY KEY,
+        jti VARCHAR(32) UNIQUE,
+        user_name VARCHAR(50),
+        revoked_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        expires_at TIMESTAMPTZ NOT NULL,
+        CHECK (jti IS NOT NULL OR user_name IS NOT NULL)
+    );
+"""
+
+
+class InvalidTokenError(Exception):
+    """Raised when a token is malformed, wrongly signed, expired or revoked."""
+
+
+# Revocation list of this process, reloaded from the database by the sync thread
+_revoked_jtis = {}  # jti -> expiry of the token (epoch seconds)
+_revoked_users = {}  # user_name -> time (epoch seconds) before which its tokens are revoked
+_sync_thread = None
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return hmac.new(_signing_key, payload.encode(), hashlib.sha256).digest()
+
+
+def issue_token(user_id, username, role, ttl=TOKEN_TTL):
+    """
+    Issues a signed bearer token for a logged-in user.
+
+    The token carries everything needed to authorize a request, so verifying
+    it needs neither the database nor state shared between processes.
+
+    Args:
+        user_id (int): User ID.
+        username (str): Username.
+        role (str): Role of the user (e.g., "Admin").
+        ttl (int): Seconds the token stays valid.
+
+    Returns:
+        tuple: (token, claims).
+    """
+    now = int(time.time())
+    claims = {"sub": user_id, "name": username, "role": role, "iat": now, "exp": now + ttl,
+              "jti": secrets.token_hex(16)}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_b64encode(_sign(payload))}", claims
+
+
+@lru_cache(maxsize=4096)
+def _decode(token):
+    # Signature check and parsing only; expiry and revocation change over time and are checked on every call
+    payload, _, signature = token.partition(".")
+    try:
+        valid = hmac.compare_digest(_b64decode(signature), _sign(payload))
+        claims = json.loads(_b64decode(payload)) if valid else None
+    except (ValueError, UnicodeError):
+        claims = None
+    if not isinstance(claims, dict) or not {"sub", "name", "role", "iat", "exp", "jti"} <= claims.keys():
+        raise InvalidTokenError("Invalid token")
+    return claims
+
+
+def verify_token(token):
+    """
+    Checks a bearer token and returns its claims.
+
+    Args:
+        token (str): Token issued by issue_token.
+
+    Returns:
+        dict: Claims with 'sub' (user_id), 'name', 'role', 'iat', 'exp' and 'jti'.
+              The dict is shared between calls and must not be modified.
+
+    Raises:
+        InvalidTokenError: If the token is invalid, expired or revoked.
+    """
+    claims = _decode(token)
+    if claims["exp"] <= time.time():
+        raise InvalidTokenError("Token expired")
+    if claims["jti"] in _revoked_jtis or claims["iat"] <= _revoked_users.get(claims["name"], -1):
+        raise InvalidTokenError("Token revoked")
+    return claims
+
+
+def revoke_token(claims):
+    """
+    Revokes one token, e.g. at logout.
+
+    It is rejected at once by this process and by the other processes after
+    their next revocation sync.
+
+    Args:
+        claims (dict): Claims of the token, as returned by verify_token.
+
+    Returns:
+        str: Success or error message.
+    """
+    _revoked_jtis[claims["jti"]] = claims["exp"]
+    try:
+        with transaction():
+            query(REVOCATION_TABLE_SQL)
+            query("""
+                INSERT INTO auth_revocation (jti, user_name, expires_at)
+                VALUES (%s, %s, to_timestamp(%s))
+                ON CONFLICT (jti) DO NOTHING
+            """, (claims["jti"], claims["name"], claims["exp"]))
+        return "Token revoked"
+    except Exception as e:
+        logging.error("Error revoking token", exc_info=True)
+        return f"Error: {str(e)}"
+
+
+def revoke_user_tokens(username):
+    """
+    Revokes every token issued to a user so far, e.g. after a password or role change.
+
+    Args:
+        username (str): Username.
+
+    Returns:
+        str: Success or error message.
+    """
+    # Tokens issued in the current second are revoked too; the user simply logs in again
+    _revoked_users[username] = int(time.time())
+    try:
+        with transaction():
+            query(REVOCATION_TABLE_SQL)
+            query("""
+                INSERT INTO auth_revocation (user_name, expires_at)
+                VALUES (%s, NOW() + make_interval(secs => %s))
+            """, (username, TOKEN_TTL))
+        return "Tokens revoked"
+    except Exception as e:
+        logging.error("Error revoking user tokens", exc_info=True)
+        return f"Error: {str(e)}"
+
+
+def sync_revocations():
+    """
+    Reloads the revocation list of this process from the database and deletes expired entries.
+    """
+    global _revoked_jtis, _revoked_users
+    with transaction():
+        query(REVOCATION_TABLE_SQL)
+        query("DELETE FROM auth_revocation WHERE expires_at < NOW()")
+    columns, results = query("""
+        SELECT jti, user_name, EXTRACT(EPOCH FROM revoked_at)::bigint, EXTRACT(EPOCH FROM expires_at)::bigint
+        FROM auth_revocation
+    """)
+    now = time.time()
+    # Keep the unexpired revocations of this process, which may not have reached the database
+    revoked_jtis = {jti: expires_at for jti, expires_at in list(_revoked_jtis.items()) if expires_at > now}
+    revoked_users = {username: revoked_at for username, revoked_at in list(_revoked_users.items())
+                     if revoked_at + TOKEN_TTL > now}
+    for jti, username, revoked_at, expires_at in results:
+        if jti is not None:
+            revoked_jtis[jti] = expires_at
+        elif revoked_at > revoked_users.get(username, -1):
+            revoked_users[username] = revoked_at
+    _revoked_jtis, _revoked_users = revoked_jtis, revoked_users
+
+
+def _revocation_sync(interval):
+    while True:
+        try:
+            sync_revocations()
+        except Exception:
+            logging.error("Error syncing token revocations", exc_info=True)
+        time.sleep(interval)
+
+
+def start_revocation_sync(interval=REVOCATION_SYNC_INTERVAL):
+    """
+    Starts a background thread that reloads the revocation list periodically.
+
+    Calling it again while the thread is running has no effect.
+
+    Args:
+        interval (int): Seconds between two reloads.
+    """
+    global _sync_thread
+    if _sync_thread is not None and _sync_thread.is_alive():
+        return
+    _sync_thread = threading.Thread(target=_revocation_sync, args=(interval,), name="revocation-sync", daemon=True)
+    _sync_thread.start()
@@ -0,0 +1,107 @@
+"""
+Side-by-side benchmark of the sync (Flask) and async (ASGI) servers.
+
+Opens many concurrent keep-alive connections against each server, each one
+sending GET requests in a loop, and prints requests per second, latency
+percentiles and failures. Clients can read responses slowly (--slow) to
+simulate slow networks, which is where one thread per request runs out first.
+
+Start both servers against the same database first:
+    python server.py                        # sync, port 5001
+    uvicorn asgi_server:app --port 5002     # async
+
+Then run from the repository root:
+    python benchmarks/bench_asgi.py [--concurrency 1000] [--duration 10] [--slow 0.5]
+        [--path /get_top_donors?limit=10] [--sync-url http://127.0.0.1:5001] [--async-url http://127.0.0.1:5002]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def _read_response(reader, slow):
+    # Minimal HTTP/1.1 response reader, enough for the JSON endpoints (Content-Length bodies)
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value.strip())
+    if slow:
+        await asyncio.sleep(slow)
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, path, deadline, slow, latencies, failures):
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: keep-alive\r\n\r\n".encode()
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await _read_response(reader, slow)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures.append(status)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            failures.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, path, concurrency, duration, slow):
+    parts = urlsplit(url)
+    latencies, failures = [], []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(parts.hostname, parts.port, path, deadline, slow, latencies, failures)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return latencies, failures, elapsed
+
+
+def _percentile(values, fraction):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sync-url", default="http://127.0.0.1:5001")
+    parser.add_argument("--async-url", default="http://127.0.0.1:5002")
+    parser.add_argument("--path", default="/get_top_donors?limit=10")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--slow", type=float, default=0.0, help="seconds each client waits before reading a body")
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} clients, {args.duration:.0f}s, GET {args.path}, slow={args.slow}s")
+    print(f"{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'failures':>10}")
+    for name, url in (("sync", args.sync_url), ("async", args.async_url)):
+        latencies, failures, elapsed = asyncio.run(run(url, args.path, args.concurrency, args.duration, args.slow))
+        mean = statistics.mean(latencies) * 1000 if latencies else float("nan")
+        print(f"{name:<8}{len(latencies) / elapsed:>10.1f}{_percentile(latencies, 0.5) * 1000:>10.1f}"
+              f"{_percentile(latencies, 0.99) * 1000:>10.1f}{mean:>10.1f}{len(failures):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark for the donation analysis.
+
+Generates a synthetic dataset (1,000,000 donations from 100,000 alumni by
+default) and runs donation_analysis.analyze_donations against a row-by-row
+pure Python version of the same computation. Checks that both agree and
+prints the timings.
+
+The database is not needed. Run from the repository root:
+    python benchmarks/bench_donation_analysis.py [n_donations] [n_alumni]
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from donation_analysis import analyze_donations
+
+CURRENT_YEAR = 2024
+DEPARTMENTS = ["Information Management", "Computer Science", "Economics", "Mechanical Engineering",
+               "Chemistry", "Law", "Medicine", "Unknown"]
+
+
+def build_dataset(n_donations, n_alumni, seed=42):
+    rng = np.random.default_rng(seed)
+    graduation_year = rng.integers(1970, 2024, n_alumni).astype(float)
+    department = np.array(DEPARTMENTS, dtype=object)[rng.integers(0, len(DEPARTMENTS), n_alumni)]
+    salary = rng.normal(60000, 15000, n_alumni)
+    salary[rng.random(n_alumni) < 0.2] = np.nan  # alumni without salary data
+    # Older and better-paid alumni donate more often
+    weight = (CURRENT_YEAR - graduation_year) + np.nan_to_num(salary, nan=30000) / 5000
+    donor_index = rng.choice(n_alumni, n_donations, p=weight / weight.sum())
+    amount = np.round(rng.lognormal(7, 1, n_donations), 2)
+    return {
+        "graduation_year": graduation_year,
+        "department": department,
+        "salary": salary,
+        "donor_index": donor_index,
+        "amount": amount,
+    }
+
+
+def _pearson_python(pairs):
+    pairs = [(x, y) for x, y in pairs if not (math.isnan(x) or math.isnan(y))]
+    if len(pairs) < 2:
+        return None
+    mean_x = sum(x for x, _ in pairs) / len(pairs)
+    mean_y = sum(y for _, y in pairs) / len(pairs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    sxx = sum((x - mean_x) ** 2 for x, _ in pairs)
+    syy = sum((y - mean_y) ** 2 for _, y in pairs)
+    return sxy / math.sqrt(sxx * syy) if sxx and syy else None
+
+
+def analyze_donations_python(dataset, current_year):
+    """
+    Row-by-row reference: plain lists and loops, one donation and one alumni at a time.
+    """
+    graduation_year = dataset["graduation_year"].tolist()
+    department = list(dataset["department"])
+    salary = dataset["salary"].tolist()
+    n_alumni = len(graduation_year)
+
+    total_amount = [0.0] * n_alumni
+    donation_count = [0] * n_alumni
+    for index, amount in zip(dataset["donor_index"].tolist(), dataset["amount"].tolist()):
+        total_amount[index] += amount
+        donation_count[index] += 1
+    is_donor = [1.0 if count else 0.0 for count in donation_count]
+
+    correlations = {
+        "total_amount_vs_salary": _pearson_python(zip(total_amount, salary)),
+        "total_amount_vs_years_since_graduation": _pearson_python(
+            zip(total_amount, (current_year - year for year in graduation_year))),
+        "donation_count_vs_salary": _pearson_python(zip((float(c) for c in donation_count), salary)),
+        "is_donor_vs_salary": _pearson_python(zip(is_donor, salary)),
+        "is_donor_vs_years_since_graduation": _pearson_python(
+            zip(is_donor, (current_year - year for year in graduation_year))),
+    }
+
+    segments = {}
+    for i in range(n_alumni):
+        seg = segments.setdefault(department[i], {"size": 0, "donors": 0, "points": []})
+        seg["size"] += 1
+        seg["donors"] += is_donor[i]
+        if not math.isnan(salary[i]):
+            seg["points"].append((salary[i], total_amount[i]))
+
+    slopes = {}
+    for name, seg in segments.items():
+        points = seg["points"]
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        sxx = sum((x - mean_x) ** 2 for x, _ in points)
+        sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+        slopes[name] = sxy / sxx
+    return correlations, slopes
+
+
+def main():
+    n_donations = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_alumni = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    dataset = build_dataset(n_donations, n_alumni)
+    print(f"{n_donations} donations from {n_alumni} alumni")
+
+    start = time.perf_counter()
+    result = analyze_donations(dataset, CURRENT_YEAR)
+    numpy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    correlations, slopes = analyze_donations_python(dataset, CURRENT_YEAR)
+    python_s = time.perf_counter() - start
+
+    for name, value in correlations.items():
+        assert math.isclose(value, result["correlations"][name], rel_tol=1e-6, abs_tol=1e-9), name
+    for segment in result["segments"]:
+        assert math.isclose(slopes[segment["department"]], segment["salary_regression"]["slope"], rel_tol=1e-6), segment["department"]
+
+    print(f"numpy (vectorized): {numpy_s * 1000:9.1f} ms")
+    print(f"python (row by row): {python_s * 1000:8.1f} ms")
+    print(f"speedup: {python_s / numpy_s:.1f}x (results match)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark for the yearly partitioning of the donation table.
+
+Builds two copies of a synthetic donation table in the schema
+bench_partitions (50,000,000 donations from 500,000 alumni over 1990-2025 by
+default): a plain table, and one partitioned by year like
+donation_partitions.migrate_donation_table does. Then runs the donation
+queries of HelpFunctions against both with EXPLAIN ANALYZE and prints the
+median execution time, the buffers read and the number of partitions the
+plan actually scanned.
+
+Loading 50M rows takes a while and about 6 GB of disk; pass a smaller
+count to try it out. The tables are kept for later runs, --reload rebuilds
+them and --drop removes the schema.
+
+Needs the database configured in db_connection.py. Run from the repository root:
+    python benchmarks/bench_donation_partitions.py [--rows 50000000] [--alumni 500000] [--runs 5] [--reload | --drop]
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_connection import get_connection
+from HelpFunctions import (DONATION_TRENDS_SQL, GET_DONATION_IN_YEARS_SQL, GET_DONATION_SQL,
+                           TOP_DONORS_IN_YEARS_SQL, TOP_DONORS_SQL, year_range_params)
+
+SCHEMA = "bench_partitions"
+FIRST_YEAR = 1990
+LAST_YEAR = 2025
+TABLES = {"heap": f"{SCHEMA}.donation_heap", "partitioned": f"{SCHEMA}.donation_part"}
+
+# Rows are derived from their number, so both tables hold the same donations, spread evenly
+# over the days of FIRST_YEAR-LAST_YEAR; generate_series runs in batches so each INSERT stays short
+LOAD_BATCH = 5_000_000
+LOAD_SQL = """
+    INSERT INTO {table} (donation_id, alumni_id, amount, date, donation_type)
+    SELECT n, (n::bigint * 7919) %% %s + 1, ((n::bigint * 31) %% 100000) / 100.0 + 10,
+           make_date(%s, 1, 1) + ((n::bigint * 104729) %% %s)::int,
+           (ARRAY['Regular', 'One-time', 'Scholarship'])[1 + n %% 3]
+    FROM generate_series(%s, %s) AS n
+"""
+
+# The queries benchmarked: name, SQL of HelpFunctions, parameters
+QUERIES = [
+    ("trends 2021-2023", DONATION_TRENDS_SQL, year_range_params((2021, 2023))),
+    ("top donors 2021-2023", TOP_DONORS_IN_YEARS_SQL, (*year_range_params((2021, 2023)), 10)),
+    ("top donors all years", TOP_DONORS_SQL, (10,)),
+    ("alumni donations 2023", GET_DONATION_IN_YEARS_SQL.format(columns="*"), (4242, *year_range_params((2023, 2023)))),
+    ("alumni donations all years", GET_DONATION_SQL.format(columns="*"), (4242,)),
+]
+
+
+def create_tables(cursor):
+    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    columns = "donation_id INT NOT NULL, alumni_id INT NOT NULL, amount NUMERIC(12, 2), date DATE NOT NULL, " \
+              "donation_type VARCHAR(20)"
+    cursor.execute(f"CREATE TABLE {TABLES['heap']} ({columns}, PRIMARY KEY (donation_id))")
+    cursor.execute(f"CREATE TABLE {TABLES['partitioned']} ({columns}, PRIMARY KEY (donation_id, date)) "
+                   f"PARTITION BY RANGE (date)")
+    for year in range(FIRST_YEAR, LAST_YEAR + 3):
+        cursor.execute(f"CREATE TABLE {SCHEMA}.donation_y{year} PARTITION OF {TABLES['partitioned']} "
+                       f"FOR VALUES FROM (make_date({year}, 1, 1)) TO (make_date({year + 1}, 1, 1))")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.donation_default PARTITION OF {TABLES['partitioned']} DEFAULT")
+
+
+def load(cursor, rows, alumni):
+    days = (datetime.date(LAST_YEAR + 1, 1, 1) - datetime.date(FIRST_YEAR, 1, 1)).days
+    for table in TABLES.values():
+        for first in range(1, rows + 1, LOAD_BATCH):
+            last = min(first + LOAD_BATCH - 1, rows)
+            cursor.execute(LOAD_SQL.format(table=table), (alumni, FIRST_YEAR, days, first, last))
+            print(f"  {table}: {last:,} rows", flush=True)
+        cursor.execute(f"CREATE INDEX ON {table} (alumni_id)")
+        cursor.execute(f"VACUUM ANALYZE {table}")
+
+
+def explain(cursor, sql_query, params):
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql_query, params)
+    plan = cursor.fetchone()[0]
+    plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+    relations = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    walk(plan["Plan"])
+    buffers = plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0)
+    return plan["Execution Time"], buffers, len(relations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--alumni", type=int, default=500_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--reload", action="store_true", help="rebuild the synthetic tables")
+    parser.add_argument("--drop", action="store_true", help="drop the benchmark schema and exit")
+    args = parser.parse_args()
+
+    connection = get_connection()
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute("SET statement_timeout = 0")
+    cursor.execute("SET max_parallel_workers_per_gather = 0")  # compare the work done, not the cores used
+    if args.drop or args.reload:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    if args.drop:
+        return
+    cursor.execute("SELECT to_regclass(%s)", (TABLES["heap"],))
+    if cursor.fetchone()[0] is None:
+        print(f"Loading {args.rows:,} donations from {args.alumni:,} alumni into both tables")
+        create_tables(cursor)
+        load(cursor, args.rows, args.alumni)
+
+    print(f"{'query':<28}{'table':<13}{'median ms':>11}{'buffers':>12}{'relations':>11}")
+    for name, sql_query, params in QUERIES:
+        medians = {}
+        for label, table in TABLES.items():
+            runs = [explain(cursor, sql_query.replace("FROM donation", f"FROM {table}"), params)
+                    for _ in range(args.runs)]
+            median_ms = statistics.median(ms for ms, _, _ in runs)
+            medians[label] = median_ms
+            _, buffers, relations = runs[-1]
+            print(f"{name:<28}{label:<13}{median_ms:>11.1f}{buffers:>12,}{relations:>11}")
+        print(f"{'':<28}{'speedup':<13}{medians['heap'] / medians['partitioned']:>10.1f}x")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark for the data exports.
+
+Runs every export in exports.EXPORT_TABLES against the configured database,
+in CSV and (when pyarrow is installed) Parquet, and prints the size,
+duration, throughput in MB/s and peak Python memory of each one. Peak
+memory should stay flat as tables grow, since exports are streamed.
+
+Needs the database configured in db_connection.py. Run from the repository root:
+    python benchmarks/bench_exports.py [table ...]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exports
+
+
+def run_export(table, export_format):
+    tracemalloc.start()
+    start = time.perf_counter()
+    total_bytes = 0
+    for chunk in exports.export_table(table, {}, export_format):
+        total_bytes += len(chunk)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total_bytes, elapsed, peak
+
+
+def main():
+    tables = sys.argv[1:] or list(exports.EXPORT_TABLES)
+    formats = ["csv"] + (["parquet"] if exports.pa is not None else [])
+    if exports.pa is None:
+        print("pyarrow is not installed, skipping Parquet")
+
+    print(f"{'table':<24}{'format':<9}{'MB':>10}{'seconds':>10}{'MB/s':>10}{'peak MB':>10}")
+    for table in tables:
+        for export_format in formats:
+            total_bytes, elapsed, peak = run_export(table, export_format)
+            megabytes = total_bytes / (1024 * 1024)
+            throughput = megabytes / elapsed if elapsed else 0.0
+            print(f"{table:<24}{export_format:<9}{megabytes:>10.2f}{elapsed:>10.2f}{throughput:>10.2f}"
+                  f"{peak / (1024 * 1024):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
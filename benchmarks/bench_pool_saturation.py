@@ -0,0 +1,61 @@
+"""
+Check of the answer the Flask server gives when the connection pool is saturated.
+
+Takes every slot of the connection pool, then calls a sample of GET
+endpoints through the Flask test client and prints, per endpoint, the
+status code, the Retry-After header and how long the request waited.
+Every endpoint must answer 503 with Retry-After, even the ones whose
+HelpFunctions call catches the PoolTimeoutError and returns an error
+message; the script exits with status 1 otherwise.
+
+The database is not needed: no connection is ever opened. Run from the repository root:
+    python benchmarks/bench_pool_saturation.py [--timeout 0.2]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_connection
+from server import app
+
+# Endpoints with and without their own `except Exception`, cached and not
+PATHS = [
+    "/get_alumni/b11705022",
+    "/get_top_donors?limit=10",
+    "/cohorts/2020",
+    "/cohorts/summary?group_by=department",
+    "/get_career_paths/b11705022?fields=job_title,company",
+    "/stats/donation_partitions",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=0.2, help="seconds to wait for a connection")
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)  # the swallowed timeouts are logged by every HelpFunctions call
+    db_connection.POOL_ACQUIRE_TIMEOUT = args.timeout
+    for _ in range(db_connection.POOL_MAX_CONNECTIONS):
+        db_connection._pool_slots.acquire()
+
+    client = app.test_client()
+    failures = 0
+    print(f"{'path':<56}{'status':>7}{'retry':>7}{'ms':>8}")
+    for path in PATHS:
+        start = time.perf_counter()
+        response = client.get(path)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        retry_after = response.headers.get("Retry-After", "-")
+        ok = response.status_code == 503 and retry_after != "-"
+        failures += not ok
+        print(f"{path:<56}{response.status_code:>7}{retry_after:>7}{elapsed_ms:>8.0f}{'' if ok else '  FAIL'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
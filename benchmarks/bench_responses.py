@@ -0,0 +1,114 @@
+"""
+Benchmark for JSON response encoding.
+
+Builds synthetic result sets shaped like the payloads of the large list
+endpoints and compares, per endpoint:
+    - serialization CPU time of Flask's default encoder (indented, as in debug
+      mode) against FastJSONProvider
+    - bytes on the wire: raw, gzip and brotli (when installed)
+
+The database is not needed. Run from the repository root:
+    python benchmarks/bench_responses.py
+"""
+import datetime
+import decimal
+import gzip
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from response_encoding import (
+    BROTLI_QUALITY, GZIP_LEVEL, brotli, dumps_bytes, orjson,
+)
+
+ROUNDS = 5
+
+
+def _date(rng):
+    return datetime.date(rng.randint(1980, 2024), rng.randint(1, 12), rng.randint(1, 28))
+
+
+def build_payloads(rng):
+    """
+    Returns a dict of endpoint name -> payload, mirroring what HelpFunctions returns.
+    """
+    alumni_list = [
+        {
+            "alumni_id": f"B{rng.randint(10000000, 99999999)}",
+            "first_name": rng.choice(["Chen", "Lin", "Wang", "Lee", "Liu"]),
+            "last_name": rng.choice(["Yi", "Hsun", "Chieh", "Shih", "Chuan"]),
+            "sex": rng.choice(["M", "F"]),
+            "address": f"No. {rng.randint(1, 500)}, Sec. 4, Roosevelt Rd., Taipei",
+            "graduation_year": rng.randint(1970, 2024),
+            "user_id": i,
+            "phone": f"09{rng.randint(10000000, 99999999)}",
+        }
+        for i in range(20000)
+    ]
+    members = [
+        {k: a[k] for k in ("alumni_id", "first_name", "last_name", "phone")}
+        for a in alumni_list[:5000]
+    ]
+    donations = [
+        {
+            "donation_id": i,
+            "alumni_id": "B11705022",
+            "amount": decimal.Decimal(rng.randint(100, 100000)) / 100,
+            "date": _date(rng),
+            "donation_type": rng.choice(["Regular", "Scholarship", "Building"]),
+        }
+        for i in range(2000)
+    ]
+    events = [
+        {
+            "event_name": f"Reunion {i}",
+            "date": _date(rng),
+            "description": "Annual networking event for alumni of all departments.",
+            "location": "NTU Sports Center",
+            "association_id": rng.randint(1, 50),
+        }
+        for i in range(3000)
+    ]
+    return {
+        "/list_alumni": {"status": "success", "alumni_list": alumni_list},
+        "/get_association_members/<id>": {"status": "success", "members": members},
+        "/get_donation/<id>": {"status": "success", "donation_details": donations},
+        "/list_events_by_association/<id>": {"status": "success", "events": events},
+    }
+
+
+def _time(fn, payload):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        out = fn(payload)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    payloads = build_payloads(random.Random(42))
+
+    print(f"fast backend: {'orjson' if orjson else 'json (stdlib)'}, brotli: {'yes' if brotli else 'no'}")
+    header = f"{'endpoint':<34}{'default ms':>11}{'fast ms':>9}{'default B':>12}{'fast B':>11}{'gzip B':>10}{'br B':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, payload in payloads.items():
+        default_s, default_out = _time(lambda p: default_provider.dumps(p, indent=2).encode("utf-8"), payload)
+        fast_s, fast_out = _time(dumps_bytes, payload)
+        gzip_size = len(gzip.compress(fast_out, compresslevel=GZIP_LEVEL))
+        br_size = len(brotli.compress(fast_out, quality=BROTLI_QUALITY)) if brotli else "-"
+        print(f"{name:<34}{default_s * 1000:>11.1f}{fast_s * 1000:>9.1f}"
+              f"{len(default_out):>12}{len(fast_out):>11}{gzip_size:>10}{br_size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import logging
+
+from db_connection import query
+
+# Graduation is taken to be at the end of June of the graduation year
+GRADUATION_MONTH = 6
+TRANSITION_FIELDS = ("job_title", "company")
+
+
+def _cohort_cte(department_id, cohort):
+    """
+    Builds the `cohort` CTE selecting the alumni to analyze.
+
+    Args:
+        department_id (int): Only alumni with a degree from this department, or None for all.
+        cohort (int): Only alumni who graduated this year, or None for all.
+
+    Returns:
+        tuple: (sql, params).
+    """
+    conditions = []
+    params = []
+    if cohort is not None:
+        conditions.append("al.graduation_year = %s")
+        params.append(cohort)
+    if department_id is not None:
+        conditions.append("""EXISTS (
+            SELECT 1 FROM earned_by eb JOIN degree_ d ON d.degree_id = eb.degree_id
+            WHERE eb.alumni_id = al.alumni_id AND d.department_id = %s
+        )""")
+        params.append(department_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"cohort AS (SELECT al.alumni_id, al.graduation_year FROM alumni al {where})", params
+
+
+def get_career_transitions(department_id=None, cohort=None, by="job_title", limit=20):
+    """
+    Finds the most common moves from one job to the next.
+
+    Each job is paired with the alumni's following job (LEAD over the jobs
+    of each alumni ordered by start date).
+
+    Args:
+        department_id (int): Department filter, or None.
+        cohort (int): Graduation year filter, or None.
+        by (str): 'job_title' or 'company'.
+        limit (int): Number of transitions to return.
+
+    Returns:
+        dict: Transitions with their count, the share of moves that also changed
+              company and the average months spent in the previous job, or error message.
+    """
+    if by not in TRANSITION_FIELDS:
+        return {"status": "error", "message": f"by must be one of: {', '.join(TRANSITION_FIELDS)}"}
+    try:
+        cohort_sql, params = _cohort_cte(department_id, cohort)
+        sql_query = f"""
+            WITH {cohort_sql},
+            jobs AS (
+                SELECT ch.{by} AS from_value,
+                       ch.company,
+                       ch.start_date,
+                       LEAD(ch.{by}) OVER w AS to_value,
+                       LEAD(ch.company) OVER w AS next_company,
+                       LEAD(ch.start_date) OVER w AS next_start_date
+                FROM career_history ch
+                JOIN cohort c ON c.alumni_id = ch.alumni_id
+                WINDOW w AS (PARTITION BY ch.alumni_id ORDER BY ch.start_date, ch.career_id)
+            )
+            SELECT from_value AS from_{by},
+                   to_value AS to_{by},
+                   COUNT(*) AS transitions,
+                   ROUND(AVG((next_company IS DISTINCT FROM company)::int), 3) AS company_change_rate,
+                   ROUND(AVG(next_start_date - start_date) / 30.44, 1) AS avg_months_before_move
+            FROM jobs
+            WHERE to_value IS NOT NULL AND to_value IS DISTINCT FROM from_value
+            GROUP BY from_value, to_value
+            ORDER BY transitions DESC, from_value, to_value
+            LIMIT %s
+        """
+        columns, results = query(sql_query, (*params, limit))
+        transitions = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "transitions": transitions}
+    except Exception as e:
+        logging.error("Error computing career transitions", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def get_time_to_first_job(department_id=None, cohort=None):
+    """
+    Measures how long alumni take to start their first job, per graduating cohort.
+
+    The first job is the earliest one of each alumni (ROW_NUMBER over their
+    jobs). Jobs started before graduation count as 0 months.
+
+    Args:
+        department_id (int): Department filter, or None.
+        cohort (int): Graduation year filter, or None.
+
+    Returns:
+        dict: Per graduation year, the cohort size, how many alumni have a job,
+              the average and median months to the first job and the share of
+              the cohort employed within 6 months, or error message.
+    """
+    try:
+        cohort_sql, params = _cohort_cte(department_id, cohort)
+        sql_query = f"""
+            WITH {cohort_sql},
+            numbered_jobs AS (
+                SELECT ch.alumni_id,
+                       ch.start_date,
+                       ROW_NUMBER() OVER (PARTITION BY ch.alumni_id ORDER BY ch.start_date, ch.career_id) AS job_number
+                FROM career_history ch
+                JOIN cohort c ON c.alumni_id = ch.alumni_id
+            ),
+            first_jobs AS (
+                SELECT c.alumni_id,
+                       GREATEST((EXTRACT(YEAR FROM j.start_date) - c.graduation_year) * 12
+                                + EXTRACT(MONTH FROM j.start_date) - %s, 0)::float8 AS months
+                FROM numbered_jobs j
+                JOIN cohort c ON c.alumni_id = j.alumni_id
+                WHERE j.job_number = 1
+            )
+            SELECT c.graduation_year,
+                   COUNT(*) AS alumni_count,
+                   COUNT(f.alumni_id) AS alumni_with_job,
+                   ROUND(AVG(f.months)::numeric, 1) AS avg_months_to_first_job,
+                   PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY f.months) AS median_months_to_first_job,
+                   -- Over the whole cohort: alumni without a job count as not employed
+                   ROUND(AVG(COALESCE((f.months <= 6)::int, 0)), 3) AS employed_within_6_months_rate
+            FROM cohort c
+            LEFT JOIN first_jobs f ON f.alumni_id = c.alumni_id
+            GROUP BY c.graduation_year
+            ORDER BY c.graduation_year
+        """
+        columns, results = query(sql_query, (*params, GRADUATION_MONTH))
+        cohorts = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "time_to_first_job": cohorts}
+    except Exception as e:
+        logging.error("Error computing time to first job", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def get_salary_growth(department_id=None, cohort=None):
+    """
+    Builds the salary curve by years since graduation.
+
+    Each salary is also compared with the alumni's first recorded salary
+    (FIRST_VALUE over their jobs ordered by start date).
+
+    Args:
+        department_id (int): Department filter, or None.
+        cohort (int): Graduation year filter, or None.
+
+    Returns:
+        dict: Per year since graduation, the number of alumni, average and
+              median monthly salary and the average ratio to the first salary,
+              or error message.
+    """
+    try:
+        cohort_sql, params = _cohort_cte(department_id, cohort)
+        sql_query = f"""
+            WITH {cohort_sql},
+            salaries AS (
+                SELECT ch.alumni_id,
+                       ch.monthly_salary::numeric AS monthly_salary,
+                       EXTRACT(YEAR FROM ch.start_date)::int - c.graduation_year AS years_since_graduation,
+                       FIRST_VALUE(ch.monthly_salary::numeric) OVER (
+                           PARTITION BY ch.alumni_id ORDER BY ch.start_date, ch.career_id
+                       ) AS first_salary
+                FROM career_history ch
+                JOIN cohort c ON c.alumni_id = ch.alumni_id
+                WHERE ch.monthly_salary IS NOT NULL
+            )
+            SELECT years_since_graduation,
+                   COUNT(DISTINCT alumni_id) AS alumni_count,
+                   ROUND(AVG(monthly_salary), 2) AS avg_monthly_salary,
+                   PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY monthly_salary::float8) AS median_monthly_salary,
+                   ROUND(AVG(monthly_salary / NULLIF(first_salary, 0)), 3) AS avg_growth_vs_first_salary
+            FROM salaries
+            WHERE years_since_graduation >= 0
+            GROUP BY years_since_graduation
+            ORDER BY years_since_graduation
+        """
+        columns, results = query(sql_query, params)
+        curve = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "salary_growth": curve}
+    except Exception as e:
+        logging.error("Error computing salary growth", exc_info=True)
+        return {"status": "error", "message": str(e)}
@@ -0,0 +1,215 @@
+import json
+import logging
+import select
+import threading
+import time
+
+from db_connection import get_connection, query, transaction
+from response_cache import purge, purge_all
+
+# Change notification setup
+CHANGE_CHANNEL = "table_changes"
+LISTEN_POLL_TIMEOUT = 30  # seconds without notifications before the connection is checked
+RECONNECT_BACKOFF_MAX = 30  # seconds, the wait between reconnect attempts doubles up to this
+
+# Tables that send a notification on every statement that changes them
+CHANGE_TABLES = (
+    "alumni",
+    "donation",
+    "career_history",
+    "achievement",
+    "alumni_association",
+    "association_event",
+    "held_by",
+    "is_member",
+    "is_cadre",
+)
+
+# Statement-level, so a bulk load sends one notification rather than one per row. The payload is
+# {"table": ..., "op": "INSERT"/"UPDATE"/"DELETE", "sent_at": epoch seconds}
+CHANGE_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+    DECLARE
+        table_name TEXT;
+    BEGIN
+        -- Changes to a partitioned table (e.g., donation) are reported under the table, not the partition
+        table_name := COALESCE((SELECT relname FROM pg_class WHERE oid = pg_partition_root(TG_RELID)), TG_TABLE_NAME);
+        PERFORM pg_notify('{CHANGE_CHANNEL}', jsonb_build_object(
+            'table', table_name,
+            'op', TG_OP,
+            'sent_at', EXTRACT(EPOCH FROM clock_timestamp())
+        )::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+_handlers = []
+_channels = {}  # channel -> function called with the payload of each notification
+_resync_handlers = []  # called after every (re)connect, when notifications may have been missed
+_listener = None
+_stats_lock = threading.Lock()
+_stats = {
+    "connected": False,
+    "notifications": 0,
+    "reconnects": 0,
+    "full_flushes": 0,
+    "last_lag_ms": None,
+    "max_lag_ms": 0.0,
+    "total_lag_ms": 0.0,
+    "last_notification_at": None,
+}
+
+
+def install_change_triggers():
+    """
+    Creates the notification function and one statement trigger per table of CHANGE_TABLES.
+
+    Safe to run from several workers at once: they are serialized with an advisory lock.
+    """
+    with transaction():
+        query("SELECT pg_advisory_xact_lock(hashtext('install_change_triggers'))")
+        query(CHANGE_FUNCTION_SQL)
+        for table in CHANGE_TABLES:
+            query(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+            query(f"""
+                CREATE TRIGGER {table}_notify_change
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change()
+            """)
+
+
+def on_change(handler, tables=None):
+    """
+    Registers a function called by the listener thread for every change notification.
+
+    Args:
+        handler (callable): Called with the change, a dict with 'table' and 'op'.
+        tables (tuple): Only call it for changes to these tables, or None for all.
+    """
+    _handlers.append((handler, tables))
+
+
+def listen(channel, handler, resync=None):
+    """
+    Makes the listener thread receive the notifications of another channel.
+
+    Register channels before start_change_listener() is called.
+
+    Args:
+        channel (str): Notification channel.
+        handler (callable): Called with the payload (str) of every notification.
+        resync (callable): Called after every (re)connect of the listener, since
+            notifications sent while it was disconnected are lost.
+    """
+    _channels[channel] = handler
+    if resync is not None:
+        _resync_handlers.append(resync)
+
+
+def _dispatch(payload):
+    change = json.loads(payload)
+    lag_ms = max((time.time() - float(change["sent_at"])) * 1000, 0.0)
+    with _stats_lock:
+        _stats["notifications"] += 1
+        _stats["last_lag_ms"] = round(lag_ms, 1)
+        _stats["max_lag_ms"] = round(max(_stats["max_lag_ms"], lag_ms), 1)
+        _stats["total_lag_ms"] += lag_ms
+        _stats["last_notification_at"] = time.time()
+    for handler, tables in _handlers:
+        if tables is None or change["table"] in tables:
+            try:
+                handler(change)
+            except Exception:
+                logging.error("Error handling change notification for %s", change["table"], exc_info=True)
+
+
+def _listen(connection):
+    while True:
+        if select.select([connection], [], [], LISTEN_POLL_TIMEOUT) == ([], [], []):
+            # Nothing for a while, make sure the connection is still alive
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        connection.poll()
+        while connection.notifies:
+            notification = connection.notifies.pop(0)
+            handler = _channels.get(notification.channel)
+            if handler is None:
+                continue
+            try:
+                handler(notification.payload)
+            except (ValueError, KeyError):
+                logging.warning("Ignoring malformed notification on %s: %s", notification.channel, notification.payload)
+
+
+def _change_listener():
+    backoff = 1
+    first_connection = True
+    while True:
+        connection = None
+        try:
+            connection = get_connection()
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                for channel in _channels:
+                    cursor.execute(f"LISTEN {channel}")
+            # Changes made while no listener was connected were missed, so nothing cached can be trusted
+            for resync in _resync_handlers:
+                try:
+                    resync()
+                except Exception:
+                    logging.error("Error resyncing after the change listener connected", exc_info=True)
+            with _stats_lock:
+                _stats["connected"] = True
+                _stats["full_flushes"] += 1
+                if not first_connection:
+                    _stats["reconnects"] += 1
+            first_connection = False
+            backoff = 1
+            _listen(connection)
+        except Exception:
+            logging.error("Change listener lost its database connection, reconnecting in %ss", backoff, exc_info=True)
+        finally:
+            with _stats_lock:
+                _stats["connected"] = False
+            if connection is not None and not connection.closed:
+                connection.close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+
+
+def start_change_listener():
+    """
+    Installs the change triggers and starts the background thread that listens for change notifications.
+
+    Calling it again while the thread is running has no effect.
+    """
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    try:
+        install_change_triggers()
+    except Exception:
+        logging.error("Error installing change notification triggers", exc_info=True)
+    _listener = threading.Thread(target=_change_listener, name="change-listener", daemon=True)
+    _listener.start()
+
+
+def get_change_listener_stats():
+    """
+    Returns the metrics of the change listener of this process.
+
+    Returns:
+        dict: Whether it is connected, notifications received, delivery lag
+              (from the trigger to this process, in ms), reconnects and full cache flushes.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    total_lag_ms = stats.pop("total_lag_ms")
+    stats["avg_lag_ms"] = round(total_lag_ms / stats["notifications"], 1) if stats["notifications"] else None
+    return stats
+
+
+# Every change evicts the cached responses built from the changed table, in every worker
+listen(CHANGE_CHANNEL, _dispatch, resync=purge_all)
+on_change(lambda change: purge(change["table"]))
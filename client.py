@@ -5,10 +5,20 @@
 import requests
 import json
 import sys
+import time
+import uuid
 from datetime import datetime
 
 BASE_URL = "http://localhost:5001"
 
+# every request goes through this session, which carries the bearer token after login
+session = requests.Session()
+
+# Writes are sent with an Idempotency-Key and retried with the same key, the server runs them only once
+WRITE_TIMEOUT = (3, 10)  # seconds to connect, seconds to wait for the response
+WRITE_RETRIES = 3
+WRITE_RETRY_STATUSES = (409, 429, 503)  # 409: the first attempt is still running on the server
+
 # global variable to store the user's role
 ROLE = None
 USER_ID = None
@@ -17,6 +27,37 @@ ALUMNI_ID = None
 CADRE_LIST = []
 
 
+def send_write(method, url, **kwargs):
+    """
+    Sends a POST, PUT or DELETE request, retrying it on timeouts and temporary errors.
+
+    Every attempt carries the same Idempotency-Key, so the server performs the
+    write once and answers a retry with the response of the first attempt.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        **kwargs: Passed to session.request (e.g., json=...).
+
+    Returns:
+        requests.Response: The response of the last attempt.
+    """
+    kwargs["headers"] = {**kwargs.get("headers", {}), "Idempotency-Key": str(uuid.uuid4())}
+    kwargs.setdefault("timeout", WRITE_TIMEOUT)
+    for attempt in range(WRITE_RETRIES + 1):
+        delay = 0.5 * 2 ** attempt
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == WRITE_RETRIES:
+                raise
+        else:
+            if response.status_code not in WRITE_RETRY_STATUSES or attempt == WRITE_RETRIES:
+                return response
+            delay = float(response.headers.get("Retry-After", delay))
+        time.sleep(delay)
+
+
 def display_main_menu():
     global ROLE, USER_ID, USER_NAME, ALUMNI_ID
     """Display the main menu."""
@@ -36,7 +77,7 @@ def register():
     password = input("Enter password: ")
     role = input("Enter role (Alumni/Admin/Analyst): ")
     data = {"user_name": username, "password": password, "role": role}
-    response = requests.post(f"{BASE_URL}/create_user", json=data)
+    response = send_write("POST", f"{BASE_URL}/create_user", json=data)
     print(response.json())
     print()
 
@@ -52,10 +93,11 @@ def login():
     data = {"username": username, "password": password}
 
     try:
-        response = requests.post(f"{BASE_URL}/login", json=data)
+        response = session.post(f"{BASE_URL}/login", json=data)
 
         if response.status_code == 200:
             print(response.json()["message"])  # 打印成功訊息
+            session.headers["Authorization"] = f"Bearer {response.json()['token']}"
             return (
                 response.json().get("role"),
                 response.json().get("user_id"),
@@ -86,7 +128,7 @@ def get_alumni(alumni_id):
         url = f"{BASE_URL}/get_alumni/{alumni_id}"
 
         # Send a GET request to the server
-        response = requests.get(url)
+        response = session.get(url)
 
         # Check the status code and handle response
         if response.status_code == 200:
@@ -119,7 +161,7 @@ def get_career(alumni_id):
         url = f"{BASE_URL}/get_career_paths/{alumni_id}"
 
         # Send a GET request to the server
-        response = requests.get(url)
+        response = session.get(url)
 
         # Check the status code and handle response
         if response.status_code == 200:
@@ -166,7 +208,7 @@ def edit_profile(alumni_id):
 
     # Send the PUT request to the server
     try:
-        response = requests.put(f"{BASE_URL}/update_alumni/{alumni_id}", json=data)
+        response = send_write("PUT", f"{BASE_URL}/update_alumni/{alumni_id}", json=data)
         if response.status_code == 200:
             print("Profile updated successfully!")
         else:
@@ -203,7 +245,7 @@ def add_job(alumni_id):
     }
 
     try:
-        response = requests.post(
+        response = send_write("POST", 
             f"{BASE_URL}/add_career_history/{alumni_id}", json=career_data
         )
         if response.status_code == 200:
@@ -229,7 +271,7 @@ def get_degree(alumni_id):
         url = f"{BASE_URL}/get_degree/{alumni_id}"
 
         # Send a GET request to the server
-        response = requests.get(url)
+        response = session.get(url)
 
         # Check the status code and handle response
         if response.status_code == 200:
@@ -263,7 +305,7 @@ def get_personal_association(alumni_id):
         url = f"{BASE_URL}/get_association_by_alumni/{alumni_id}"
 
         # Send a GET request to the API
-        response = requests.get(url)
+        response = session.get(url)
 
         # print(response.json())
 
@@ -295,7 +337,7 @@ def get_personal_events(alumni_id):
         url = f"{BASE_URL}/get_personal_events/{alumni_id}"
 
         # Send a GET request to the API
-        response = requests.get(url)
+        response = session.get(url)
 
         if response.status_code == 200:
             print("Personal events retrieved successfully:")
@@ -323,7 +365,7 @@ def get_all_associations():
         url = f"{BASE_URL}/get_all_open_associations"
 
         # Send a GET request to the API
-        response = requests.get(url)
+        response = session.get(url)
 
         if response.status_code == 200:
             print("All associations retrieved successfully:")
@@ -351,7 +393,7 @@ def get_all_upcoming_events():
         url = f"{BASE_URL}/get_all_upcoming_events"
 
         # Send a GET request to the API
-        response = requests.get(url)
+        response = session.get(url)
 
         if response.status_code == 200:
             print("All upcoming events retrieved successfully:")
@@ -367,6 +409,67 @@ def get_all_upcoming_events():
         return {"status": "error", "message": str(e)}
 
 
+def watch_event_updates(alumni_id):
+    """
+    Prints event and membership changes of the alumni's associations as they happen.
+
+    Reads the Server-Sent Events stream of the server until Ctrl+C, and
+    reconnects with the ID of the last event received if the connection drops.
+
+    Args:
+        alumni_id (str): ID of the alumni.
+    """
+    url = f"{BASE_URL}/stream/events"
+    last_event_id = None
+    print("Watching for updates, press Ctrl+C to stop.")
+    try:
+        while True:
+            headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+            try:
+                with session.get(url, params={"alumni_id": alumni_id}, headers=headers,
+                                 stream=True, timeout=(5, 60)) as response:
+                    if response.status_code != 200:
+                        print(f"Unexpected error occurred. Status code: {response.status_code}")
+                        return
+                    event_type, data = None, None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("id:"):
+                            last_event_id = line[3:].strip()
+                        elif line.startswith("event:"):
+                            event_type = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data = json.loads(line[5:])
+                        elif line == "" and event_type:
+                            # A blank line ends an event
+                            print_event_update(event_type, data)
+                            event_type, data = None, None
+            except requests.RequestException as e:
+                print("Connection lost, reconnecting:", e)
+            time.sleep(3)
+    except KeyboardInterrupt:
+        print("\nStopped watching updates.")
+
+
+def print_event_update(event_type, data):
+    """
+    Prints one update received by watch_event_updates.
+
+    Args:
+        event_type (str): Type of the update (e.g., 'event_created').
+        data (dict): Data of the update.
+    """
+    if event_type == "resync":
+        print("Some updates may have been missed, view the upcoming events to refresh.")
+    elif event_type == "membership_changed":
+        print(f"Membership {data['action']}: association {data['association_id']}")
+    else:
+        title = event_type.replace("_", " ").capitalize()
+        print(f"{title}: {data['event_name']} on {data['date']} (association {data['association_id']})")
+        for key in ("description", "location"):
+            if key in data:
+                print(f"  {key.capitalize()}: {data[key]}")
+
+
 def is_association_cadre(alumni_id):
     """
     Check if the alumni is a cadre of any association.
@@ -380,7 +483,7 @@ def is_association_cadre(alumni_id):
         url = f"{BASE_URL}/is_association_cadre/{alumni_id}"
 
         # Send a GET request to the API
-        response = requests.get(url)
+        response = session.get(url)
 
         if response.status_code == 200:
             print("Association cadre status retrieved successfully:")
@@ -415,7 +518,7 @@ def add_event(association_id):
     }
 
     try:
-        response = requests.post(f"{BASE_URL}/create_event/{association_id}", json=event_data)  # 4 is a placeholder for association_id
+        response = send_write("POST", f"{BASE_URL}/create_event/{association_id}", json=event_data)  # 4 is a placeholder for association_id
         response_data = response.json()
 
         if response.status_code == 201:
@@ -438,7 +541,7 @@ def add_member(association_id, alumni_id):
     """
     url = f"{BASE_URL}/add_member_to_association/{association_id}/{alumni_id}"
     try:
-        response = requests.post(url)
+        response = send_write("POST", url)
         if response.status_code == 201:
             # print("Member added successfully.")
             return response.json()
@@ -464,7 +567,7 @@ def remove_member(association_id, alumni_id):
     """
     url = f"{BASE_URL}/remove_member_from_association/{association_id}/{alumni_id}"
     try:
-        response = requests.delete(url)
+        response = send_write("DELETE", url)
         if response.status_code == 200:
             # print("Member removed successfully.")
             return response.json()
@@ -492,7 +595,7 @@ def list_association_members(association_id):
         url = f"{BASE_URL}/get_association_members/{association_id}"
 
         # Send a GET request to the API
-        response = requests.get(url)
+        response = session.get(url)
 
         if response.status_code == 200:
             print("Association members retrieved successfully:")
@@ -523,7 +626,7 @@ def end_cadre(association_id, alumni_id):
         return {"status": "cancelled", "message": "Ending cadre position cancelled."}
     url = f"{BASE_URL}/end_cadre/{association_id}/{alumni_id}"
     try:
-        response = requests.post(url)
+        response = send_write("POST", url)
         if response.status_code == 201:
             # print("Cadre position ended successfully.")
             return response.json()
@@ -553,7 +656,7 @@ def delete_event(association_id):
     }
 
     try:
-        response = requests.delete(f"{BASE_URL}/delete_event", json=event_data)  # 4 is a placeholder for association_id
+        response = send_write("DELETE", f"{BASE_URL}/delete_event", json=event_data)  # 4 is a placeholder for association_id
         response_data = response.json()
 
         if response.status_code == 200:
@@ -582,7 +685,7 @@ def add_event_participant():
     }
 
     try:
-        response = requests.post(f"{BASE_URL}/add_event_participant", json=participant_data)
+        response = send_write("POST", f"{BASE_URL}/add_event_participant", json=participant_data)
         response_data = response.json()
 
         if response.status_code == 201:
@@ -611,7 +714,7 @@ def remove_event_participant():
     }
 
     try:
-        response = requests.delete(f"{BASE_URL}/remove_event_participant", json=participant_data)
+        response = send_write("DELETE", f"{BASE_URL}/remove_event_participant", json=participant_data)
         response_data = response.json()
 
         if response.status_code == 200:
@@ -639,7 +742,46 @@ def add_cadre_to_association(association_id):
     }
 
     try:
-        response = requests.post(f"{BASE_URL}/add_cadre_to_association/{alumni_id}/{association_id}/{pos}", json=cadre_data)
+        response = send_write("POST", f"{BASE_URL}/add_cadre_to_association/{alumni_id}/{association_id}/{pos}", json=cadre_data)
+        response_data = response.json()
+
+        if response.status_code == 201:
+            print(f"Success: {response_data.get('message')}")
+        else:
+            print(f"Error: {response_data.get('message')} (Status Code: {response.status_code})")
+
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {str(e)}")
+
+
+def handover_cadre(association_id, alumni_id):
+    """
+    Function to interact with the server and hand your cadre positions over to other alumni.
+    All positions are handed over in one request, so either all of them move or none.
+    """
+    print("\n=== Hand Over Cadre Position ===")
+
+    handovers = []
+    while True:
+        position = input("Enter the position to hand over (press Enter to finish): ").strip()
+        if not position:
+            break
+        successor_id = input("Enter the successor's alumni ID: ").strip()
+        if not successor_id:
+            print("Successor alumni ID cannot be empty.")
+            continue
+        handovers.append({
+            "from_alumni_id": alumni_id,
+            "to_alumni_id": successor_id,
+            "position": position
+        })
+
+    if not handovers:
+        print("No positions to hand over.")
+        return
+
+    try:
+        response = send_write("POST", f"{BASE_URL}/handover_cadre/{association_id}", json={"handovers": handovers})
         response_data = response.json()
 
         if response.status_code == 201:
@@ -659,7 +801,7 @@ def list_achievements(alumni_id):
     url = f"{BASE_URL}/list_achievements/{alumni_id}"
     
     try:
-        response = requests.get(url)
+        response = session.get(url)
         
         if response.status_code == 200:
             print("Achievements retrieved successfully:")
@@ -690,7 +832,7 @@ def get_donation(alumni_id):
         url = f"{BASE_URL}/get_alumni_donations/{alumni_id}"
 
         # Send a GET request to the server
-        response = requests.get(url)
+        response = session.get(url)
 
         # Check the status code and handle response
         if response.status_code == 200:
@@ -857,6 +999,7 @@ def alumni_operations():
             print("5. Join an alumni association event")
             print("6. Join an alumni association")
             print("7. I am a cadre of the alumni association")
+            print("8. Watch live event updates")
             
             sub_choice = input("Enter your choice: ")
 
@@ -978,6 +1121,7 @@ def alumni_operations():
                             print("7. Delete a participant from an event")
                             print("8. Add another alumni the Position of Cadre")
                             print("9. Exit Cadre Position")
+                            print("10. Hand over Cadre Position")
                             sub_choice = input("Enter your choice: ")
                             if sub_choice == "1":
                                 print("\n=== View Member List ===")
@@ -1066,7 +1210,12 @@ def alumni_operations():
                                 else:
                                     print(response["message"])
                                 #print("This functionality is under construction.")
+                            elif sub_choice == "10":
+                                handover_cadre(association_id, ALUMNI_ID)
                                 
+            elif sub_choice == "8":
+                print("\n=== Live Event Updates ===")
+                watch_event_updates(ALUMNI_ID)
         elif choice == "6":
             print("Exiting alumni operations.")
             break  # 退出循環，結束操作
@@ -1091,7 +1240,7 @@ def insert_donation(alumni_id: str, amount: int, date: str, campaign_id = "Regul
     }
     try:
         url = f"{BASE_URL}/record_donation/{alumni_id}"
-        response = requests.post(url, json=data)
+        response = send_write("POST", url, json=data)
         if response.status_code == 201:
             print("Success")
             return True
@@ -1123,7 +1272,7 @@ def update_donation(donation_id: int, amount: int, date: str) -> bool:
     }
     try:
         url = f"{BASE_URL}/update_donation/{donation_id}"
-        response = requests.put(url, json=data)
+        response = send_write("PUT", url, json=data)
         
         if response.status_code == 200:
             print("Update successful.")
@@ -1154,7 +1303,7 @@ def delete_donation(donation_id: int) -> bool:
     """
     try:
         url = f"{BASE_URL}/delete_donation/{donation_id}"
-        response = requests.delete(url)
+        response = send_write("DELETE", url)
         
         if response.status_code == 200:
             print("Donation deleted successfully.")
@@ -1185,7 +1334,7 @@ def get_donation(donation_id: str) -> dict:
     """
     try:
         url = f"{BASE_URL}/get_donation/{donation_id}"
-        response = requests.get(url)
+        response = session.get(url)
         
         if response.status_code == 200:
             # 如果請求成功，返回捐款資料
@@ -1227,7 +1376,7 @@ def add_achievement(alumni_id: str, title: str, description: str, date: str, cat
     
     try:
         url = f"{BASE_URL}/add_achievement/{alumni_id}"
-        response = requests.post(url, json=data)
+        response = send_write("POST", url, json=data)
         
         if response.status_code == 201:
             print("Achievement added successfully.")
@@ -1270,7 +1419,7 @@ def update_achievement(alumnileader_id: str, title: str, date: str,
 
     try:
         url = f"{BASE_URL}/update_achievement"
-        response = requests.put(url, json=data)
+        response = send_write("PUT", url, json=data)
         
         if response.status_code == 200:
             print("Update successful.")
@@ -1312,7 +1461,7 @@ def delete_achievement(title: str, date: str, alumnileader_id: str) -> bool:
         }
 
         # Sending the DELETE request with the JSON body
-        response = requests.delete(url, json=data)
+        response = send_write("DELETE", url, json=data)
 
         if response.status_code == 200:
             print("Deletion successful.")
@@ -1331,15 +1480,14 @@ def delete_achievement(title: str, date: str, alumnileader_id: str) -> bool:
         print("Error while deleting achievement details:", e)
         return False
 
-def create_user(username: str, password: str, role: str, current_user: str):
+def create_user(username: str, password: str, role: str):
     """
-    向伺服器發送請求創建新用戶（僅限 Admin）。
+    向伺服器發送請求創建新用戶（僅限 Admin，依登入的 token 判斷權限）。
 
     參數:
         username (str): 要創建的用戶名。
         password (str): 用戶的密碼。
         role (str): 用戶的角色（例如，"Admin" 或其他角色）。
-        current_user (str): 發送請求的當前用戶名，該用戶必須擁有 Admin 權限。
 
     回傳:
         bool: 如果創建成功，返回 True；如果創建失敗，返回 False。
@@ -1347,16 +1495,15 @@ def create_user(username: str, password: str, role: str, current_user: str):
     try:
         url = f"{BASE_URL}/create_user"
 
-        # 構建請求的資料，包含 username, password, role, current_user
+        # 構建請求的資料，包含 username, password, role
         data = {
             "username": username,
             "password": password,
-            "role": role,
-            "current_user": current_user
+            "role": role
         }
 
         # 發送 POST 請求
-        response = requests.post(url, json=data)
+        response = send_write("POST", url, json=data)
 
         # 根據伺服器回應的狀態碼處理結果
         if response.status_code == 201:
@@ -1412,7 +1559,7 @@ def add_alumni(username:str, first_name: str, last_name: str, sex: str, address:
         }
 
         # 發送 POST 請求
-        response = requests.post(url, json=data)
+        response = send_write("POST", url, json=data)
 
         # 根據伺服器回應的狀態碼處理結果
         if response.status_code == 201:
@@ -1433,13 +1580,67 @@ def add_alumni(username:str, first_name: str, last_name: str, sex: str, address:
         return False
 
 
-def update_user(user_id: str, admin_name: str, password: str, role: str) -> bool:
+def create_alumni_account(username: str, password: str, first_name: str, last_name: str,
+                          sex: str, address: str, graduation_year: int, phone: str) -> bool:
+    """
+    向伺服器發送請求，一次建立校友帳號與校友資料（僅限 Admin，依登入的 token 判斷權限）。
+
+    伺服器在同一個 transaction 內完成，任一步驟失敗都不會留下只有帳號沒有校友資料的情況。
+
+    參數:
+        username (str): 要創建的用戶名，同時作為校友 ID。
+        password (str): 用戶的密碼。
+        first_name (str): 校友的名字。
+        last_name (str): 校友的姓氏。
+        sex (str): 校友的性別（例如，"M" 或 "F"）。
+        address (str): 校友的地址。
+        graduation_year (int): 校友的畢業年份。
+        phone (str): 校友的電話號碼。
+
+    回傳:
+        bool: 如果建立成功，返回 True；否則返回 False。
+    """
+    try:
+        url = f"{BASE_URL}/create_alumni_account"
+        data = {
+            "username": username,
+            "password": password,
+            "first_name": first_name,
+            "last_name": last_name,
+            "sex": sex,
+            "address": address,
+            "graduation_year": graduation_year,
+            "phone": phone
+        }
+
+        # 發送 POST 請求
+        response = send_write("POST", url, json=data)
+
+        # 根據伺服器回應的狀態碼處理結果
+        if response.status_code == 201:
+            print(f"Alumni account {username} created successfully (user ID: {response.json()['message']}).")
+            return True
+        elif response.status_code in (400, 403):
+            print(f"Error: {response.json()['message']}")
+            return False
+        elif response.status_code == 500:
+            print(f"Server error: {response.json()['message']}")
+            return False
+        else:
+            print(f"An unknown error occurred. Status code: {response.status_code}")
+            return False
+
+    except requests.RequestException as e:
+        print(f"An error occurred during the request: {e}")
+        return False
+
+
+def update_user(user_id: str, password: str, role: str) -> bool:
     """
-    向伺服器發送請求更新用戶資料（僅限 Admin）。
+    向伺服器發送請求更新用戶資料（僅限 Admin，依登入的 token 判斷權限）。
 
     參數:
         user_id (int): 需要更新的用戶 ID。
-        admin_name (str): 新的用戶名稱。
         password (str): 新的密碼。
         role (str): 新的角色。
 
@@ -1451,13 +1652,12 @@ def update_user(user_id: str, admin_name: str, password: str, role: str) -> bool
 
         # 構建請求的資料，包含新的用戶資料
         data = {
-            "admin_name": admin_name,
             "password": password,
             "role": role
         }
 
         # 發送 PUT 請求
-        response = requests.put(url, json=data)
+        response = send_write("PUT", url, json=data)
 
         # 根據伺服器回應的狀態碼處理結果
         if response.status_code == 200:
@@ -1481,13 +1681,12 @@ def update_user(user_id: str, admin_name: str, password: str, role: str) -> bool
         return False
 
 
-def delete_user(user_id: int, username: str) -> bool:
+def delete_user(user_id: int) -> bool:
     """
-    向伺服器發送請求刪除用戶。
+    向伺服器發送請求刪除用戶（僅限 Admin，依登入的 token 判斷權限）。
 
     參數:
         user_id (int): 要刪除的用戶 ID。
-        username (str): 發送請求的用戶名。
 
     回傳:
         bool: 如果刪除成功，返回 True；如果刪除失敗，返回 False。
@@ -1495,13 +1694,8 @@ def delete_user(user_id: int, username: str) -> bool:
     try:
         url = f"{BASE_URL}/delete_user/{user_id}"
 
-        # 構建請求的資料，包含 username
-        data = {
-            "username": username
-        }
-
         # 發送 DELETE 請求
-        response = requests.delete(url, json=data)
+        response = send_write("DELETE", url)
 
         # 根據伺服器回應的狀態碼處理結果
         if response.status_code == 200:
@@ -1524,13 +1718,12 @@ def delete_user(user_id: int, username: str) -> bool:
         print(f"An error occurred during the request: {e}")
         return False
 
-def update_user(user_id: str, admin_name: str, password: str, role: str) -> bool:
+def update_user(user_id: str, password: str, role: str) -> bool:
     """
-    向伺服器發送請求更新用戶資料（僅限 Admin）。
+    向伺服器發送請求更新用戶資料（僅限 Admin，依登入的 token 判斷權限）。
 
     參數:
         user_id (int): 需要更新的用戶 ID。
-        username (str): 新的用戶名稱。
         password (str): 新的密碼。
         role (str): 新的角色。
 
@@ -1542,13 +1735,12 @@ def update_user(user_id: str, admin_name: str, password: str, role: str) -> bool
 
         # 構建請求的資料，包含新的用戶資料
         data = {
-            "admin_name": admin_name,
             "password": password,
             "role": role
         }
 
         # 發送 PUT 請求
-        response = requests.put(url, json=data)
+        response = send_write("PUT", url, json=data)
 
         # 根據伺服器回應的狀態碼處理結果
         if response.status_code == 200:
@@ -1703,10 +1895,6 @@ def admin_operations():
                     if not password:
                         raise ValueError("Password cannot be empty.")
 
-                    current_user = input("Enter your username (must be an Admin): ")
-                    if not current_user:
-                        raise ValueError("Your username cannot be empty.")
-
                     print("Inputs received successfully!")
                     
                 except ValueError as e:
@@ -1714,47 +1902,43 @@ def admin_operations():
                 except Exception as e:
                     print(f"An unexpected error occurred: {e}")
 
-                # 呼叫 create_user 函式
-                user_id = create_user(username, password, "Alumni", current_user)
-                print(user_id)
-                if user_id:
-                    # 用戶輸入區域
-                    try:
-                        # 使用者輸入
-                        first_name = input("Enter the alumni's first name: ").strip()
-                        if not first_name:
-                            raise ValueError("First name cannot be empty.")
-
-                        last_name = input("Enter the alumni's last name: ").strip()
-                        if not last_name:
-                            raise ValueError("Last name cannot be empty.")
-
-                        sex = input("Enter the alumni's gender (M/F): ").strip().upper()
-                        if sex not in ["M", "F"]:
-                            raise ValueError("Gender must be 'M' or 'F'.")
-
-                        address = input("Enter the alumni's address: ").strip()
-                        if not address:
-                            raise ValueError("Address cannot be empty.")
-
-                        graduation_year_input = input("Enter the alumni's graduation year: ").strip()
-                        if not graduation_year_input.isdigit():
-                            raise ValueError("Graduation year must be a number.")
-                        graduation_year = int(graduation_year_input)
-
-                        phone = input("Enter the alumni's phone number: ").strip()
-                        if not phone.isdigit():
-                            raise ValueError("Phone number must contain only digits.")
-
-                        print("All inputs received successfully!")
-
-                    except ValueError as e:
-                        print(f"Input error: {e}")
-                    except Exception as e:
-                        print(f"An unexpected error occurred: {e}")
-
-                    # 呼叫 add_alumni 函式
-                    add_alumni(username, first_name, last_name, sex, address, graduation_year, user_id, phone)
+                # 用戶輸入區域
+                try:
+                    # 使用者輸入
+                    first_name = input("Enter the alumni's first name: ").strip()
+                    if not first_name:
+                        raise ValueError("First name cannot be empty.")
+
+                    last_name = input("Enter the alumni's last name: ").strip()
+                    if not last_name:
+                        raise ValueError("Last name cannot be empty.")
+
+                    sex = input("Enter the alumni's gender (M/F): ").strip().upper()
+                    if sex not in ["M", "F"]:
+                        raise ValueError("Gender must be 'M' or 'F'.")
+
+                    address = input("Enter the alumni's address: ").strip()
+                    if not address:
+                        raise ValueError("Address cannot be empty.")
+
+                    graduation_year_input = input("Enter the alumni's graduation year: ").strip()
+                    if not graduation_year_input.isdigit():
+                        raise ValueError("Graduation year must be a number.")
+                    graduation_year = int(graduation_year_input)
+
+                    phone = input("Enter the alumni's phone number: ").strip()
+                    if not phone.isdigit():
+                        raise ValueError("Phone number must contain only digits.")
+
+                    print("All inputs received successfully!")
+
+                except ValueError as e:
+                    print(f"Input error: {e}")
+                except Exception as e:
+                    print(f"An unexpected error occurred: {e}")
+
+                # 呼叫 create_alumni_account 函式，帳號與校友資料一次建立
+                create_alumni_account(username, password, first_name, last_name, sex, address, graduation_year, phone)
             elif alumni_choice == '2':
                 # 用戶輸入區域
                 print("\n======= Update Alumni Account ========")
@@ -1762,7 +1946,6 @@ def admin_operations():
                     user_id = input("Enter the Alumni ID to update: ")
                     password = input("Enter the new password (press Enter to skip): ")
                     role = input("Enter the new role (press Enter to skip): ")
-                    admin_name = input("Enter your username (must be an Admin): ")
                 except Exception as e:
                     print(f"An error occurred: {e}")
 
@@ -1772,18 +1955,17 @@ def admin_operations():
                     role = None
 
                 # 呼叫 update_user 函式
-                update_user(user_id, admin_name, password, role)
+                update_user(user_id, password, role)
             elif alumni_choice == "3":
                 # 用戶輸入區域
                 print("\n======= Delete Alumni Account ========")
                 try:
                     user_id = input("Enter the Alumni ID to delete (usually your student ID): ")
-                    username = input("Enter your username (must be an Admin): ")
                 except Exception as e:
                     print(f"An error occurred: {e}")
 
                 # 呼叫 delete_user 函式
-                delete_user(user_id, username)
+                delete_user(user_id)
         elif sub_choice == "3":
             print("\n=== Achievement ===")
             print("1. Insert")
@@ -1842,6 +2024,118 @@ def admin_operations():
                 print("Input is not valid. Please try again.")
                 continue
 
+def get_report(path, params=None):
+    """
+    Fetches an analytics report from the server.
+
+    Args:
+        path (str): Report endpoint, e.g. "get_top_achievers".
+        params (dict): Query parameters.
+
+    Returns:
+        dict: The response JSON containing the report or an error message.
+    """
+    try:
+        response = session.get(f"{BASE_URL}/{path}", params=params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Unexpected error occurred. Status code: {response.status_code}")
+            return {"status": "error", "message": response.json().get("message", "Unexpected error occurred.")}
+    except requests.RequestException as e:
+        print("Error while fetching report:", e)
+        return {"status": "error", "message": str(e)}
+
+
+def print_table(rows):
+    """
+    Prints a list of dictionaries as a table.
+    """
+    if not rows:
+        print("No data.")
+        return
+    keys = list(rows[0].keys())
+    header = " | ".join([f"{key.replace('_', ' ').capitalize():<20}" for key in keys])
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(" | ".join([f"{str(row[key]):<20}" for key in keys]))
+
+
+def refresh_reports():
+    """
+    Asks the server to rebuild the report summary tables now.
+    """
+    try:
+        response = session.post(f"{BASE_URL}/refresh_reports")
+        response_data = response.json()
+        if response.status_code == 200:
+            for name, duration in response_data["refreshed_ms"].items():
+                print(f"{name}: refreshed in {duration} ms")
+        else:
+            print(f"Error: {response_data.get('message')} (Status Code: {response.status_code})")
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {str(e)}")
+
+
+def analyst_operations():
+    """Analyst-specific operations."""
+    while True:
+        print("\n=== Analytics ===")
+        print("1. Employment trends by department")
+        print("2. Donation statistics by department")
+        print("3. 30-year reunion list")
+        print("4. Top achievers")
+        print("5. Refresh reports")
+        print("6. Exit")
+        print("=================")
+        choice = input("Enter your choice: ").strip()
+
+        if choice == "1":
+            department = input("Enter the department (code or name): ").strip()
+            start_year = input("Enter the start graduation year: ").strip()
+            end_year = input("Enter the end graduation year: ").strip()
+            response = get_report("get_alumni_employment_trends",
+                                  {"department": department, "start_year": start_year, "end_year": end_year})
+            if response["status"] == "error":
+                print(f"Error: {response['message']}")
+            else:
+                matched = response["department"]
+                print(f"Department: {matched['code']} {matched['name']} ({matched['name_en']})")
+                print(f"(Report refreshed at {response['refreshed_at']})")
+                print_table(response["employment_trends"])
+        elif choice == "2":
+            response = get_report("calculate_donation_correlations")
+            if response["status"] == "error":
+                print(f"Error: {response['message']}")
+            else:
+                print(f"(Report refreshed at {response['refreshed_at']})")
+                print_table(response["donation_correlations"])
+        elif choice == "3":
+            years = input("Years since graduation (press Enter for 30): ").strip() or "30"
+            response = get_report("generate_30_year_reunion_list", {"years": years})
+            if response["status"] == "error":
+                print(f"Error: {response['message']}")
+            else:
+                print(f"Class of {response['graduation_year']}: {response['cohort_size']} alumni")
+                print_table(response["reunion_list"])
+        elif choice == "4":
+            limit = input("How many top achievers (press Enter for 10): ").strip() or "10"
+            response = get_report("get_top_achievers", {"limit": limit})
+            if response["status"] == "error":
+                print(f"Error: {response['message']}")
+            else:
+                print(f"(Report refreshed at {response['refreshed_at']})")
+                print_table(response["top_achievers"])
+        elif choice == "5":
+            refresh_reports()
+        elif choice == "6":
+            print("Exiting analyst operations.")
+            break
+        else:
+            print("Invalid choice, please try again.")
+
+
 def main():
     """
     Main function to manage user login and role-specific operations.
@@ -1887,8 +2181,6 @@ def main():
                 continue
 
         elif choice == "3":  # Analyst login
-            print("Analyst login is under construction.")
-            '''
             role, user_id, user_name = login()
             if role == -1:  # Login failed
                 print("Invalid credentials. Please try again.")
@@ -1902,7 +2194,6 @@ def main():
             else:  # Incorrect role for this option
                 print("Invalid role. Please try again.")
                 continue
-            '''
 
         elif choice == "4":  # Exit the program
             print("Exiting the program. Goodbye!")
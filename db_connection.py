@@ -1,6 +1,15 @@
 import psycopg2
 import logging
 import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from psycopg2 import errors, pool
 
 # PostgreSQL connection setup
 #DB_PASSWORD = os.getenv('DB_PASSWORD', 'b11705059')
@@ -12,92 +21,1254 @@ DB_HOST = 'localhost'  # Host address
 # DB_PORT = os.getenv('DB_PORT', '5433')
 DB_PORT = '5433'
 
+# Connection pool setup
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 20
+# Seconds a thread waits for a free pooled connection before giving up with PoolTimeoutError
+POOL_ACQUIRE_TIMEOUT = 10
 
-def execute_update(sql_query, params=None):
+# Read replicas (streaming replication standbys of the primary above), as "host:port,host:port".
+# Without replicas every query goes to the primary.
+DB_REPLICAS = os.getenv('DB_REPLICAS', '')
+REPLICA_POOL_MAX_CONNECTIONS = 10  # per replica
+REPLICA_MAX_LAG = 5  # seconds behind the primary before a replica stops receiving reads
+REPLICA_CHECK_INTERVAL = 5  # seconds between two health and lag checks of every replica
+# A client that wrote reads from the primary for this long, so it sees its own writes
+READ_YOUR_WRITES_WINDOW = REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL
+# Replica errors after which the query runs on the primary: its pool is full, or the
+# standby cancelled the query because it conflicted with replayed changes
+REPLICA_FALLBACK_ERRORS = (pool.PoolError, errors.SerializationFailure)
+
+# A transaction that fails with one of these errors is safe to run again
+RETRYABLE_ERRORS = (errors.SerializationFailure, errors.DeadlockDetected)
+TRANSACTION_RETRIES = 3
+RETRY_BACKOFF = 0.05  # seconds, doubled after every attempt
+
+# Timeouts
+CONNECT_TIMEOUT = 5  # seconds to open a connection, so requests fail instead of hanging when the server is unreachable
+STATEMENT_TIMEOUT = 30  # seconds a statement may run (including lock waits) unless the caller sets another timeout
+
+# Circuit breaker: after this many connection failures in a row, database calls fail at
+# once for CIRCUIT_RESET_TIMEOUT seconds, then one call is let through to probe for recovery
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 10
+
+# COPY output is handed to the reader in chunks of this size, at most COPY_QUEUE_CHUNKS at a time
+COPY_CHUNK_SIZE = 256 * 1024
+COPY_QUEUE_CHUNKS = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+# psycopg2's pool raises at once when all connections are out, threads queue on this instead
+_pool_slots = threading.BoundedSemaphore(POOL_MAX_CONNECTIONS)
+
+# The unit of work of the current thread (one Flask request runs on one thread)
+_local = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {"statement_timeouts": 0, "cancelled": 0, "pool_waits": 0, "pool_timeouts": 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class PoolTimeoutError(pool.PoolError):
     """
-    Executes an UPDATE SQL query on the database.
+    Raised when no pooled connection became free within POOL_ACQUIRE_TIMEOUT.
+
+    The database is busy, not down: the circuit breaker does not count it.
+    query() and execute_update() raise it instead of returning None, so the
+    request can be answered with 503.
+    """
+
+
+class DatabaseUnavailableError(psycopg2.OperationalError):
+    """Raised without contacting the server while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Fails database calls fast while the server is unreachable.
+
+    Closed: calls go through and connection failures are counted. After
+    `failure_threshold` failures in a row the circuit opens: calls raise
+    DatabaseUnavailableError at once instead of waiting on connect timeouts.
+    After `reset_timeout` seconds it is half-open: one call goes through as a
+    probe, and closes the circuit if it succeeds or opens it again if it fails.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """
+        Returns the seconds until a call may go through, 0 if calls go through now.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            started = self.probe_started_at if self.state == "half_open" else self.opened_at
+            return max(self.reset_timeout - (time.monotonic() - started), 0)
+
+    def before_call(self):
+        """
+        Lets a call go through, or raises DatabaseUnavailableError.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            # One probe at a time; a probe that never reported back is replaced after reset_timeout
+            started = self.probe_started_at if self.state == "half_open" else self.opened_at
+            if now - started >= self.reset_timeout:
+                self.state = "half_open"
+                self.probe_started_at = now
+                return
+            self.rejected += 1
+        raise DatabaseUnavailableError("Database unavailable, circuit breaker is open")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logging.info("Database reachable again, closing the circuit breaker")
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                if self.state == "closed":
+                    logging.error("%d database connection failures in a row, opening the circuit breaker",
+                                  self.failures)
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures,
+                    "times_opened": self.times_opened, "rejected": self.rejected}
+
+
+# Shared by every connection of the process, sync and async
+db_circuit = CircuitBreaker()
+
+
+@contextmanager
+def statement_timeout(seconds):
+    """
+    Sets the statement timeout of every query() and execute_update() of the block on this thread.
+
+    A statement running longer is cancelled on the server and raises
+    QueryCanceled. A timeout passed to query() itself takes precedence.
+
+    Example:
+        with statement_timeout(120):
+            trends = get_donation_trends(2000, 2020)
 
     Args:
-        sql_query (str): SQL query string with placeholders.
-        params (tuple): Parameters for the query.
+        seconds (float): Timeout in seconds.
+    """
+    previous = set_statement_timeout(seconds)
+    try:
+        yield
+    finally:
+        set_statement_timeout(previous)
+
+
+def set_statement_timeout(seconds):
+    """
+    Sets the statement timeout of this thread until it is set again.
+
+    Use statement_timeout() where a with block fits; this is for request
+    hooks that set the timeout before the view and restore it afterwards.
+
+    Args:
+        seconds (float): Timeout in seconds, or None for STATEMENT_TIMEOUT.
 
     Returns:
-        int: The number of rows affected.
+        float or None: The previous timeout, to restore later.
+    """
+    previous = getattr(_local, "timeout", None)
+    _local.timeout = seconds
+    return previous
+
+
+def record_cancelled():
+    """
+    Counts a query cancelled because its client went away, for get_database_stats().
+    """
+    _count("cancelled")
+
+
+def record_statement_timeout():
+    """
+    Counts a statement cancelled by its statement timeout, for get_database_stats().
+    """
+    _count("statement_timeouts")
+
+
+def get_database_stats():
+    """
+    Returns the timeout, cancellation and circuit breaker metrics of this process.
+
+    Returns:
+        dict: Statements cancelled by their timeout, queries cancelled because the
+              client disconnected, requests that waited for a pooled connection and
+              that gave up waiting, the circuit breaker state and counters, and the
+              health, lag and load of every read replica.
     """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["circuit"] = db_circuit.stats()
+    stats["replicas"] = [replica.stats() for replica in replicas]
+    return stats
+
+
+def get_connection(timeout=None):
+    """
+    Opens a new connection to the PostgreSQL database.
+
+    Args:
+        timeout (float): Statement timeout of the connection in seconds, see statement_timeout().
+
+    Returns:
+        connection: A psycopg2 connection object.
+    """
+    db_circuit.before_call()
     try:
-        # Connect to the PostgreSQL database
         connection = psycopg2.connect(
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
             port=DB_PORT,  # Explicitly specify port
+            connect_timeout=CONNECT_TIMEOUT,
+            options=f"-c statement_timeout={int(_resolve_timeout(timeout) * 1000)}",
         )
-        cursor = connection.cursor()
+    except psycopg2.OperationalError:
+        db_circuit.record_failure()
+        raise
+    db_circuit.record_success()
+    return connection
+
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use.
+
+    Returns:
+        ThreadedConnectionPool: The connection pool.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(
+                    POOL_MIN_CONNECTIONS,
+                    POOL_MAX_CONNECTIONS,
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    connect_timeout=CONNECT_TIMEOUT,
+                    options=f"-c statement_timeout={STATEMENT_TIMEOUT * 1000}",
+                )
+    return _pool
+
+
+def acquire_connection():
+    """
+    Takes a connection from the pool.
+
+    Waits up to POOL_ACQUIRE_TIMEOUT seconds when all POOL_MAX_CONNECTIONS connections are in use.
+
+    Returns:
+        connection: A pooled psycopg2 connection. Give it back with release_connection().
+
+    Raises:
+        DatabaseUnavailableError: If the circuit breaker is open.
+        PoolTimeoutError: If no connection became free in time.
+    """
+    db_circuit.before_call()
+    if not _pool_slots.acquire(blocking=False):
+        _count("pool_waits")
+        if not _pool_slots.acquire(timeout=POOL_ACQUIRE_TIMEOUT):
+            _count("pool_timeouts")
+            _local.pool_timed_out = True
+            raise PoolTimeoutError(f"No database connection free after {POOL_ACQUIRE_TIMEOUT}s")
+    try:
+        return get_pool().getconn()
+    except psycopg2.OperationalError:
+        _pool_slots.release()
+        # The pool opens new connections in getconn(), failing to connect means the server is unreachable
+        db_circuit.record_failure()
+        raise
+    except BaseException:
+        _pool_slots.release()
+        raise
+
+
+def release_connection(connection, broken=False):
+    """
+    Returns a connection to the pool.
+
+    Any transaction still open on the connection is rolled back first.
+    Broken or closed connections are discarded instead of being reused.
+
+    Args:
+        connection: The connection taken with acquire_connection().
+        broken (bool): Whether the connection hit a connection-level error.
+    """
+    if not broken and not connection.closed:
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            broken = True
+    try:
+        get_pool().putconn(connection, close=broken or bool(connection.closed))
+    finally:
+        _pool_slots.release()
+
+
+def _checkout():
+    # The connection of an open shared_connection() block, taken on first use, or one from the pool
+    if not getattr(_local, "sharing", False):
+        return acquire_connection()
+    if _local.shared is None:
+        _local.shared = acquire_connection()
+    return _local.shared
+
+
+def _checkin(connection, broken=False, failed=False):
+    # Gives back a connection taken with _checkout(); a shared one stays with its block unless it broke
+    if connection is not getattr(_local, "shared", None):
+        release_connection(connection, broken)
+    elif broken:
+        _local.shared = None
+        release_connection(connection, broken)
+    elif failed:
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            _local.shared = None
+            release_connection(connection, broken=True)
+
+
+def _is_connection_error(error):
+    # A cancelled statement (timeout) leaves a usable connection behind
+    return (isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            and not isinstance(error, (errors.QueryCanceled, DatabaseUnavailableError)))
+
+
+def _resolve_timeout(timeout):
+    # Per-call timeout, else the one of the enclosing statement_timeout() block, else the connection default
+    if timeout is not None:
+        return timeout
+    return getattr(_local, "timeout", None) or STATEMENT_TIMEOUT
+
+
+def _timeout_change(timeout):
+    # Each statement outside a transaction starts with the connection default
+    timeout = _resolve_timeout(timeout)
+    return timeout if timeout != STATEMENT_TIMEOUT else None
+
+
+def _execute(connection, sql_query, params, shape, set_timeout=None, circuit=db_circuit):
+    # set_timeout: seconds to apply to the current transaction first, None to keep the one in effect
+    # circuit: breaker told about the outcome, None for replica connections
+    try:
+        with connection.cursor() as cursor:
+            if set_timeout is not None:
+                # Only lasts until the end of the current transaction
+                cursor.execute("SET LOCAL statement_timeout = %s", (int(set_timeout * 1000),))
+            cursor.execute(sql_query, params)
+            if cursor.description:  # Indicates a query returning rows
+                column_names = [desc[0] for desc in cursor.description]
+                result = column_names, shape_rows(column_names, cursor.fetchall(), shape)
+            else:
+                result = cursor.rowcount
+    except Exception as e:
+        if isinstance(e, errors.QueryCanceled):
+            record_statement_timeout()
+        if circuit is not None:
+            if _is_connection_error(e):
+                circuit.record_failure()
+            else:
+                circuit.record_success()
+        raise
+    if circuit is not None:
+        circuit.record_success()
+    return result
+
+
+# Statements that only read and can run on a replica: a SELECT (or WITH ... SELECT)
+# without row locks, data-modifying CTEs, sequence or notification calls
+_WRITE_PATTERN = re.compile(
+    r"\b(insert|update|delete|merge|for\s+update|for\s+share|for\s+no\s+key|for\s+key\s+share"
+    r"|nextval|setval|pg_notify|pg_advisory\w*|set_config|into)\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def is_read_only_sql(sql_query):
+    """
+    Tells whether a statement only reads data, so it may run on a read replica.
+
+    Args:
+        sql_query (str): SQL query string.
+
+    Returns:
+        bool: True for plain SELECT queries.
+    """
+    text = sql_query.lstrip().lower()
+    return text.startswith(("select", "with")) and not _WRITE_PATTERN.search(text)
+
+
+class Replica:
+    """
+    One read replica, with its connection pool and the result of its last health check.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        # Unused until the first health check succeeds
+        self.healthy = False
+        self.lag = None  # seconds behind the primary at the last check
+        self.in_flight = 0
+        self.queries = 0
+        self.failures = 0
+        self.last_error = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(
+                    0,
+                    REPLICA_POOL_MAX_CONNECTIONS,
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    host=self.host,
+                    port=self.port,
+                    connect_timeout=CONNECT_TIMEOUT,
+                    options=f"-c statement_timeout={STATEMENT_TIMEOUT * 1000}",
+                )
+            return self._pool
+
+    def connect(self, timeout=None):
+        """
+        Opens a dedicated connection to the replica, for streaming reads.
+        """
+        return psycopg2.connect(
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=self.host,
+            port=self.port,
+            connect_timeout=CONNECT_TIMEOUT,
+            options=f"-c statement_timeout={int(_resolve_timeout(timeout) * 1000)}",
+        )
+
+    def execute(self, sql_query, params=None, shape="rows", timeout=None):
+        """
+        Runs a read-only query on the replica.
+
+        Raises:
+            psycopg2.Error: On any error; a connection error also marks the replica down.
+                Errors in REPLICA_FALLBACK_ERRORS mean the query should run on the primary instead.
+        """
+        connection = None
+        broken = False
+        try:
+            with self.track():
+                connection = self.get_pool().getconn()
+                return _execute(connection, sql_query, params, shape, _timeout_change(timeout), circuit=None)
+        except Exception as e:
+            broken = _is_connection_error(e)
+            if broken:
+                self.mark_down(e)
+            raise
+        finally:
+            if connection is not None:
+                if not broken:
+                    try:
+                        connection.rollback()
+                    except psycopg2.Error:
+                        broken = True
+                self.get_pool().putconn(connection, close=broken or bool(connection.closed))
+
+    @contextmanager
+    def track(self):
+        """
+        Counts a query running on the replica, for load balancing and stats.
+        """
+        with self._lock:
+            self.in_flight += 1
+            self.queries += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def mark_down(self, error):
+        with self._lock:
+            if self.healthy:
+                logging.warning("Read replica %s is down, reading from the primary: %s", self.name, error)
+            self.healthy = False
+            self.failures += 1
+            self.last_error = str(error)
+
+    def check(self):
+        """
+        Measures the replication lag and updates the health of the replica.
+        """
+        try:
+            connection = self.get_pool().getconn()
+        except Exception as e:
+            self.mark_down(e)
+            return
+        broken = False
+        try:
+            with connection.cursor() as cursor:
+                # No lag when everything received has been replayed, even if the primary has been idle
+                cursor.execute("""
+                    SELECT pg_is_in_recovery(),
+                           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+                           END
+                """)
+                in_recovery, lag = cursor.fetchone()
+            connection.rollback()
+        except Exception as e:
+            broken = _is_connection_error(e)
+            self.mark_down(e)
+            return
+        finally:
+            self.get_pool().putconn(connection, close=broken or bool(connection.closed))
+
+        with self._lock:
+            if not in_recovery:
+                # A promoted standby no longer follows the primary
+                healthy, self.last_error = False, "Not a standby (pg_is_in_recovery() is false)"
+            else:
+                healthy = lag is not None
+                self.lag = round(float(lag), 3) if lag is not None else None
+            if healthy and not self.healthy:
+                logging.info("Read replica %s is up, lag %ss", self.name, self.lag)
+            self.healthy = healthy
+
+    def usable(self):
+        return self.healthy and self.lag is not None and self.lag <= REPLICA_MAX_LAG
+
+    def stats(self):
+        with self._lock:
+            return {"replica": self.name, "healthy": self.healthy, "lag": self.lag, "usable": self.usable(),
+                    "in_flight": self.in_flight, "queries": self.queries, "failures": self.failures,
+                    "last_error": self.last_error}
+
+
+def _parse_replicas(spec):
+    replicas = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, port = item.partition(":")
+        replicas.append(Replica(host, port or DB_PORT))
+    return replicas
+
+
+replicas = _parse_replicas(DB_REPLICAS)
+_replica_monitor = None
+
+
+def choose_replica():
+    """
+    Picks the usable replica with the fewest queries running.
+
+    Returns:
+        Replica or None: None when no replica is healthy and within REPLICA_MAX_LAG.
+    """
+    usable = [replica for replica in replicas if replica.usable()]
+    if not usable:
+        return None
+    return min(usable, key=lambda replica: replica.in_flight)
+
+
+def _read_replica(sql_query):
+    # The replica for a statement of this thread, or None to run it on the primary
+    if (not replicas or not getattr(_local, "replica_reads", False)
+            or getattr(_local, "sharing", False) or not is_read_only_sql(sql_query)):
+        return None
+    return choose_replica()
+
+
+@contextmanager
+def replica_reads():
+    """
+    Lets the read-only query() calls of the block run on a read replica.
+
+    Statements that write, transaction() and shared_connection() blocks still
+    use the primary. Replicas may lag up to REPLICA_MAX_LAG seconds, so only
+    use it for reads that do not need to see a write made just before.
+
+    Example:
+        with replica_reads():
+            trends = get_donation_trends(2000, 2020)
+    """
+    previous = set_replica_reads(True)
+    try:
+        yield
+    finally:
+        set_replica_reads(previous)
+
+
+def set_replica_reads(enabled):
+    """
+    Turns replica reads on or off for this thread until set again, see replica_reads().
+
+    Args:
+        enabled (bool): Whether read-only queries may run on a replica.
+
+    Returns:
+        bool: The previous setting, to restore later.
+    """
+    previous = getattr(_local, "replica_reads", False)
+    _local.replica_reads = enabled
+    return previous
+
+
+def replica_reads_enabled():
+    """
+    Tells whether read-only queries of this thread may run on a replica, see replica_reads().
+    """
+    return getattr(_local, "replica_reads", False)
+
+
+def pop_wrote():
+    """
+    Tells whether this thread wrote to the primary since the last call, and resets it.
+
+    Used to pin a client that just wrote to the primary (see READ_YOUR_WRITES_WINDOW).
+
+    Returns:
+        bool: True if a write statement or a transaction was committed.
+    """
+    wrote = getattr(_local, "wrote", False)
+    _local.wrote = False
+    return wrote
+
+
+def set_wrote():
+    """
+    Records a write made on this thread's behalf elsewhere, for pop_wrote().
+    """
+    _local.wrote = True
+
+
+def pool_timed_out():
+    """
+    Tells whether this thread gave up waiting for a pooled connection since the last pop_pool_timeout().
+
+    The PoolTimeoutError itself may have been caught and turned into an error
+    message by a HelpFunctions call; this flag survives that.
+    """
+    return getattr(_local, "pool_timed_out", False)
+
+
+def pop_pool_timeout():
+    """
+    Same as pool_timed_out(), and resets the flag.
+    """
+    timed_out = pool_timed_out()
+    _local.pool_timed_out = False
+    return timed_out
+
+
+def check_replicas():
+    """
+    Runs the health and lag check of every replica once.
+    """
+    for replica in replicas:
+        replica.check()
+
+
+def _replica_monitor_loop(interval):
+    while True:
+        try:
+            check_replicas()
+        except Exception:
+            logging.error("Error checking read replicas", exc_info=True)
+        time.sleep(interval)
+
+
+def start_replica_monitor(interval=REPLICA_CHECK_INTERVAL):
+    """
+    Starts a background thread that checks the health and lag of the read replicas periodically.
+
+    Does nothing without replicas, or if the thread is already running.
+
+    Args:
+        interval (int): Seconds between two checks.
+    """
+    global _replica_monitor
+    if not replicas or (_replica_monitor is not None and _replica_monitor.is_alive()):
+        return
+    _replica_monitor = threading.Thread(target=_replica_monitor_loop, args=(interval,),
+                                        name="replica-monitor", daemon=True)
+    _replica_monitor.start()
+
+
+@lru_cache(maxsize=256)
+def _record_class(column_names):
+    # One class per distinct column list; rename=True handles duplicate names from joins
+    return namedtuple("Record", column_names, rename=True)
+
+
+def shape_rows(column_names, rows, shape="rows"):
+    """
+    Converts fetched rows into the requested result shape.
+
+    Args:
+        column_names (list): Column names from the cursor description.
+        rows (list): Row tuples returned by fetchall/fetchmany.
+        shape (str): One of:
+            - 'rows': the row tuples unchanged.
+            - 'columns': one list per column, in column order.
+            - 'records': named tuple rows, fields accessed by column name.
+
+    Returns:
+        list: The rows in the requested shape.
+    """
+    if shape == "columns":
+        if not rows:
+            return [[] for _ in column_names]
+        return [list(column) for column in zip(*rows)]
+    if shape == "records":
+        record = _record_class(tuple(column_names))
+        return [record._make(row) for row in rows]
+    return rows
+
+
+def execute_update(sql_query, params=None, timeout=None):
+    """
+    Executes an UPDATE SQL query on the database.
+
+    Inside transaction() the statement joins the open transaction and is not
+    committed on its own.
+
+    Args:
+        sql_query (str): SQL query string with placeholders.
+        params (tuple): Parameters for the query.
+        timeout (float): Seconds the statement may run, see statement_timeout().
+
+    Returns:
+        int: The number of rows affected.
+    """
+    unit = current_unit()
+    connection = None
+    broken = False
+    failed = False
+    try:
+        if unit is not None:
+            return unit.execute(sql_query, params, timeout=timeout)
+
+        # Take a connection from the pool
+        connection = _checkout()
 
         # Execute the query with parameters
-        cursor.execute(sql_query, params)
+        rows_affected = _execute(connection, sql_query, params, "rows", _timeout_change(timeout))
 
         # Commit the changes
         connection.commit()
+        _local.wrote = True
 
         # Return the number of rows affected
-        return cursor.rowcount
+        return rows_affected
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
+        broken = _is_connection_error(e)
+        failed = True
         logging.error("Error executing update query", exc_info=True)
         return None
 
     finally:
-        # Ensure the connection is closed
+        # Ensure the connection goes back to the pool
         if connection:
-            cursor.close()
-            connection.close()
+            _checkin(connection, broken, failed)
 
 
-def query(sql_query, params=None):
+def query(sql_query, params=None, shape="rows", timeout=None):
     """
     Execute a SQL query on the database.
 
+    Outside a transaction every statement is committed on its own. Inside
+    transaction() it joins the open transaction, and errors are raised instead
+    of returning None.
+
     Args:
         sql_query (str): SQL query string.
         params (tuple): Parameters to substitute in the SQL query.
+        shape (str): Result shape for SELECT queries, 'rows', 'columns' or 'records' (see shape_rows).
+        timeout (float): Seconds the statement may run before it is cancelled on the server.
+            Defaults to the timeout of the enclosing statement_timeout() block, or STATEMENT_TIMEOUT.
 
     Returns:
-        tuple or int: For SELECT queries, returns column names and results.
-                      For non-SELECT queries, returns the number of affected rows.
+        tuple or int: For SELECT queries (and RETURNING clauses), returns column names and results.
+                      For other queries, returns the number of affected rows.
+
+    Raises:
+        PoolTimeoutError: If every pooled connection stayed busy for POOL_ACQUIRE_TIMEOUT seconds.
     """
+    unit = current_unit()
+    if unit is not None:
+        return unit.execute(sql_query, params, shape, timeout)
+
+    replica = _read_replica(sql_query)
+    if replica is not None:
+        try:
+            return replica.execute(sql_query, params, shape, timeout)
+        except Exception as e:
+            if not (_is_connection_error(e) or isinstance(e, REPLICA_FALLBACK_ERRORS)):
+                logging.error("Error executing query on read replica %s", replica.name, exc_info=True)
+                return None
+            # The replica went away or could not answer, the primary answers instead
+
+    connection = None
+    broken = False
+    failed = False
     try:
-        # Connect to the PostgreSQL database
-        connection = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,  # Explicitly specify port
-        )
-        cursor = connection.cursor()
+        # Take a connection from the pool
+        connection = _checkout()
 
         # Execute the SQL query with parameters
-        cursor.execute(sql_query, params)
+        result = _execute(connection, sql_query, params, shape, _timeout_change(timeout))
 
-        # Fetch results if the query is a SELECT statement
-        if cursor.description:  # Indicates a query returning rows
-            column_names = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
-            return column_names, rows
-        else:
-            # For non-SELECT queries, commit the changes and return row count
-            connection.commit()
-            return cursor.rowcount
+        # Commit so that writes, including INSERT ... RETURNING, are kept
+        connection.commit()
+        if not is_read_only_sql(sql_query):
+            _local.wrote = True
+        return result
 
+    except PoolTimeoutError:
+        raise
     except Exception as e:
+        broken = _is_connection_error(e)
+        failed = True
         logging.error("Error executing query", exc_info=True)
         return None
 
     finally:
-        # Ensure the connection is closed
+        # Ensure the connection goes back to the pool
         if connection:
-            cursor.close()
-            connection.close()
+            _checkin(connection, broken, failed)
+
+
+class UnitOfWork:
+    """
+    A database transaction shared by every query() and execute_update() call
+    made on the same thread while it is open.
+
+    Created by transaction(). Statements run on one pooled connection and are
+    committed together when the transaction block ends.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        # First database error raised inside the unit, even if the caller swallowed it
+        self.error = None
+        # Statement timeout in effect on the connection, None when unknown (after a savepoint rollback)
+        self.timeout = STATEMENT_TIMEOUT
+        self._savepoint_count = 0
+
+    def execute(self, sql_query, params=None, shape="rows", timeout=None):
+        """
+        Executes a statement inside the unit of work, without committing.
+
+        Errors are recorded on the unit and re-raised, so the transaction is
+        rolled back even when a HelpFunctions wrapper turns the exception into
+        an error message.
+        """
+        timeout = _resolve_timeout(timeout)
+        set_timeout = timeout if timeout != self.timeout else None
+        self.timeout = timeout
+        try:
+            return _execute(self.connection, sql_query, params, shape, set_timeout)
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+            raise
+
+
+class Savepoint:
+    """
+    Result of a savepoint() block.
+
+    Attributes:
+        name (str): Savepoint name.
+        error (Exception or None): The database error that rolled the savepoint back, if any.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.error = None
+
+
+def current_unit():
+    """
+    Returns the unit of work open on this thread, or None.
+    """
+    return getattr(_local, "unit", None)
+
+
+@contextmanager
+def transaction(isolation_level=None):
+    """
+    Groups several queries, including HelpFunctions calls, into one transaction.
+
+    Every query() and execute_update() made inside the block runs on the same
+    pooled connection and the work is committed once at the end. If any
+    statement failed, or the block raises, everything is rolled back and the
+    error is raised. A transaction() opened inside another one joins the outer
+    transaction.
+
+    Example:
+        with transaction():
+            end_cadre(association_id, old_alumni_id)
+            add_cadre_to_association(data)
+
+    Args:
+        isolation_level (str): Optional isolation level, e.g. 'SERIALIZABLE'.
+
+    Yields:
+        UnitOfWork: The open unit of work.
+    """
+    unit = current_unit()
+    if unit is not None:
+        yield unit
+        return
+
+    connection = acquire_connection()
+    unit = UnitOfWork(connection)
+    _local.unit = unit
+    broken = False
+    try:
+        if isolation_level:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET TRANSACTION ISOLATION LEVEL {isolation_level}")
+        yield unit
+        if unit.error is not None:
+            raise unit.error
+        connection.commit()
+        _local.wrote = True
+    except Exception as e:
+        broken = _is_connection_error(e)
+        if not connection.closed:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                broken = True
+        # Report the database error itself, so that run_in_transaction() can retry on it
+        if unit.error is not None and e is not unit.error:
+            raise unit.error from e
+        raise
+    finally:
+        _local.unit = None
+        release_connection(connection, broken)
+
+
+@contextmanager
+def shared_connection():
+    """
+    Runs every query() and execute_update() of the block on one pooled connection.
+
+    Unlike transaction(), each statement is still committed on its own and a
+    failed statement does not affect the others; the block only saves taking
+    and resetting a pool connection for every statement. A transaction()
+    opened inside the block uses a connection of its own.
+
+    Example:
+        with shared_connection():
+            alumni = get_alumni(alumni_id)
+            degrees = get_degree(alumni_id)
+    """
+    if getattr(_local, "sharing", False):
+        yield
+        return
+
+    _local.sharing = True
+    _local.shared = None
+    try:
+        yield
+    finally:
+        connection = _local.shared
+        _local.sharing = False
+        _local.shared = None
+        if connection is not None:
+            release_connection(connection)
+
+
+@contextmanager
+def savepoint():
+    """
+    Marks a savepoint inside the current transaction.
+
+    If a statement in the block fails, only the work done since the savepoint
+    is rolled back and the outer transaction can go on. An exception raised by
+    the block is re-raised; a database error swallowed by a HelpFunctions call
+    is stored on the yielded Savepoint instead.
+
+    Yields:
+        Savepoint: Holds the error that rolled the savepoint back, if any.
+    """
+    unit = current_unit()
+    if unit is None:
+        raise RuntimeError("savepoint() must be used inside transaction()")
+
+    unit._savepoint_count += 1
+    point = Savepoint(f"sp_{unit._savepoint_count}")
+    previous_error = unit.error
+    with unit.connection.cursor() as cursor:
+        cursor.execute(f"SAVEPOINT {point.name}")
+
+    try:
+        yield point
+    except Exception:
+        with unit.connection.cursor() as cursor:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {point.name}")
+        unit.error = previous_error
+        unit.timeout = None
+        raise
+
+    with unit.connection.cursor() as cursor:
+        if unit.error is not previous_error:
+            point.error = unit.error
+            unit.error = previous_error
+            unit.timeout = None
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {point.name}")
+        else:
+            cursor.execute(f"RELEASE SAVEPOINT {point.name}")
+
+
+def run_in_transaction(func, *args, retries=TRANSACTION_RETRIES, isolation_level=None, **kwargs):
+    """
+    Calls a function inside a transaction, retrying on serialization failures and deadlocks.
+
+    The whole function is run again on each retry, so it must only touch the
+    database through query()/execute_update().
+
+    Args:
+        func (callable): The function to run.
+        *args: Positional arguments for the function.
+        retries (int): How many times to retry after a retryable error.
+        isolation_level (str): Optional isolation level, e.g. 'SERIALIZABLE'.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        The return value of the function.
+    """
+    for attempt in range(retries + 1):
+        try:
+            with transaction(isolation_level):
+                return func(*args, **kwargs)
+        except RETRYABLE_ERRORS:
+            # Inside an outer transaction only the outer caller can start over
+            if attempt == retries or current_unit() is not None:
+                raise
+            logging.warning("Retrying transaction after a serialization failure or deadlock (attempt %d)", attempt + 1)
+            time.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+
+def _read_connection(sql_query, timeout):
+    # A dedicated connection for a long read, to a replica when allowed and reachable
+    replica = _read_replica(sql_query)
+    if replica is not None:
+        try:
+            return replica.connect(timeout)
+        except psycopg2.OperationalError as e:
+            replica.mark_down(e)
+    return get_connection(timeout)
+
+
+def stream_query(sql_query, params=None, batch_size=2000, shape="rows", timeout=None):
+    """
+    Streams the results of a SELECT query through a server-side cursor.
+
+    Only one batch is held in memory at a time, so large tables can be read
+    with constant memory. The connection stays open until the generator is
+    exhausted or closed.
+
+    Args:
+        sql_query (str): SQL query string.
+        params (tuple): Parameters to substitute in the SQL query.
+        batch_size (int): Number of rows fetched per round trip.
+        shape (str): Shape of each batch, see shape_rows.
+        timeout (float): Seconds each fetch may run, see statement_timeout().
+
+    Yields:
+        tuple: (column_names, rows) for each batch.
+    """
+    connection = _read_connection(sql_query, timeout)
+    try:
+        # A named cursor keeps the result set on the server
+        cursor = connection.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cursor.itersize = batch_size
+        cursor.execute(sql_query, params)
 
+        column_names = None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if column_names is None:
+                column_names = [desc[0] for desc in cursor.description]
+            yield column_names, shape_rows(column_names, rows, shape)
+        cursor.close()
+    finally:
+        connection.close()
+
+
+class _CopyCancelled(Exception):
+    pass
+
+
+class _ChunkWriter:
+    """
+    File-like target for cursor.copy_expert that groups COPY output into chunks.
+
+    Chunks go through a bounded queue, so the COPY waits for the reader
+    instead of buffering the whole result in memory.
+    """
+
+    def __init__(self, chunks, stopped, chunk_size):
+        self.chunks = chunks
+        self.stopped = stopped
+        self.chunk_size = chunk_size
+        self.started = threading.Event()  # set once the first chunk is ready
+        self._buffer = []
+        self._size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunk = b"".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        self.started.set()
+        while True:
+            if self.stopped.is_set():
+                raise _CopyCancelled()
+            try:
+                self.chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+def copy_query(sql_query, params=None, options="FORMAT csv, HEADER", chunk_size=COPY_CHUNK_SIZE, timeout=None):
+    """
+    Streams the result of a SELECT query with COPY ... TO STDOUT.
+
+    The COPY runs on a dedicated connection in a background thread and its
+    output is yielded in chunks of about `chunk_size` bytes. At most
+    COPY_QUEUE_CHUNKS chunks are buffered, so memory use does not depend on
+    the size of the result. Closing the generator early stops the COPY.
+
+    The statement timeout only applies until the first chunk is ready: once
+    output flows, the COPY lasts as long as the reader takes to consume it,
+    so a slow client does not get a truncated result. A reader that goes
+    away still cancels it.
+
+    Args:
+        sql_query (str): SELECT query string.
+        params (tuple): Parameters to substitute in the SQL query.
+        options (str): COPY options (e.g., 'FORMAT csv, HEADER').
+        chunk_size (int): Approximate size in bytes of each yielded chunk.
+        timeout (float): Seconds the COPY may run before its first chunk, see statement_timeout().
+
+    Yields:
+        bytes: Chunks of COPY output.
+    """
+    connection = _read_connection(sql_query, timeout)
+    chunks = queue.Queue(maxsize=COPY_QUEUE_CHUNKS)
+    stopped = threading.Event()
+    done = object()
+    failure = []
+    writer = _ChunkWriter(chunks, stopped, chunk_size)
+
+    def first_chunk_overdue():
+        if not writer.started.is_set() and not stopped.is_set():
+            record_statement_timeout()
+            connection.cancel()
+
+    deadline = threading.Timer(_resolve_timeout(timeout), first_chunk_overdue)
+    deadline.daemon = True
+
+    def run_copy():
+        try:
+            with connection.cursor() as cursor:
+                # The server-side timeout would also count the time spent waiting for the reader
+                cursor.execute("SET statement_timeout = 0")
+                # COPY does not take parameters, so bind them into the query text
+                copy_sql = f"COPY ({cursor.mogrify(sql_query, params).decode()}) TO STDOUT WITH ({options})"
+                deadline.start()
+                cursor.copy_expert(copy_sql, writer)
+                writer.flush()
+        except _CopyCancelled:
+            pass
+        except Exception as e:
+            if not stopped.is_set():
+                logging.error("Error running COPY query", exc_info=True)
+                failure.append(e)
+        finally:
+            while not stopped.is_set():
+                try:
+                    chunks.put(done, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    thread = threading.Thread(target=run_copy, name="copy-query", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        if failure:
+            raise failure[0]
+    finally:
+        stopped.set()
+        deadline.cancel()
+        if thread.is_alive():
+            # The reader went away, interrupt the COPY on the server
+            connection.cancel()
+            record_cancelled()
+        thread.join()
+        connection.close()
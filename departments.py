@@ -0,0 +1,269 @@
+import difflib
+import logging
+import os
+import re
+
+from db_connection import query, transaction
+from reporting import recount_cohort_summary
+
+# Reading the spreadsheet needs xlrd, the index itself is loaded from the database
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
+
+# Department lookup setup
+DEPARTMENT_CODES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Department Codes.xls")
+FUZZY_MATCH_CUTOFF = 0.8  # similarity needed for a name to resolve to a department on its own
+SEARCH_CUTOFF = 0.4  # similarity needed for a department to be listed as a search suggestion
+
+# department_id is the small integer key used by queries, code is the university's 4-character code (e.g., '1010', 'H050')
+DEPARTMENT_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS department (
+        department_id SMALLSERIAL PRIMARY KEY,
+        code CHAR(4) NOT NULL UNIQUE,
+        name VARCHAR(100) NOT NULL,
+        name_en VARCHAR(200)
+    );
+    ALTER TABLE degree_ ADD COLUMN IF NOT EXISTS department_id SMALLINT REFERENCES department (department_id);
+    CREATE INDEX IF NOT EXISTS idx_degree_department_id ON degree_ (department_id);
+"""
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class DepartmentIndex:
+    """
+    In-memory lookup of departments by ID, code and name.
+
+    Names are matched in Chinese and English, ignoring case and extra spaces.
+    Names that do not match exactly fall back to fuzzy matching.
+    """
+
+    def __init__(self, rows=()):
+        self.load(rows)
+
+    def load(self, rows):
+        """
+        Replaces the content of the index.
+
+        The lookups are built first and swapped in afterwards, so requests
+        running during a reload keep using the previous content.
+
+        Args:
+            rows (list): (department_id, code, name, name_en) tuples.
+        """
+        by_id, by_code, by_name = {}, {}, {}
+        for department_id, code, name, name_en in rows:
+            department = {"department_id": department_id, "code": code.strip(), "name": name, "name_en": name_en}
+            by_id[department_id] = department
+            by_code[department["code"].upper()] = department
+            for value in (name, name_en):
+                if value and _normalize(value):
+                    by_name.setdefault(_normalize(value), department)
+        self.by_id, self.by_code, self._by_name = by_id, by_code, by_name
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, department_id):
+        """
+        Returns the department with the given ID, or None.
+        """
+        return self.by_id.get(department_id)
+
+    def find(self, text):
+        """
+        Resolves a department code or name to a department.
+
+        Args:
+            text (str): Department code (e.g., '2010'), or Chinese or English name.
+
+        Returns:
+            dict or None: The department, or None if nothing is close enough.
+        """
+        if text is None:
+            return None
+        department = self.by_code.get(str(text).strip().upper())
+        if department is not None:
+            return department
+        name = _normalize(text)
+        department = self._by_name.get(name)
+        if department is not None:
+            return department
+        matches = difflib.get_close_matches(name, self._by_name, n=1, cutoff=FUZZY_MATCH_CUTOFF)
+        return self._by_name[matches[0]] if matches else None
+
+    def search(self, text, limit=5):
+        """
+        Lists the departments whose code or name best match some text.
+
+        Args:
+            text (str): Part of a code or name.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            list: Departments with a 'score' between 0 and 1, best first.
+        """
+        name = _normalize(text)
+        if not name:
+            return []
+        scores = {}
+        for key, department in list(self._by_name.items()) + [(c.lower(), d) for c, d in self.by_code.items()]:
+            if name in key:
+                score = 0.9 + 0.1 * len(name) / len(key)
+            else:
+                score = difflib.SequenceMatcher(None, name, key).ratio()
+            department_id = department["department_id"]
+            if score >= SEARCH_CUTOFF and score > scores.get(department_id, 0):
+                scores[department_id] = score
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [dict(self.by_id[department_id], score=round(score, 3)) for department_id, score in best]
+
+
+# Process-wide index, reloaded in place by load_department_index()
+department_index = DepartmentIndex()
+
+
+def read_department_codes(path=DEPARTMENT_CODES_FILE):
+    """
+    Reads the department codes spreadsheet.
+
+    Args:
+        path (str): Path of the .xls file (columns: code, Chinese name, English name; one header row).
+
+    Returns:
+        list: (code, name, name_en) tuples.
+    """
+    if xlrd is None:
+        raise RuntimeError("Reading the department codes spreadsheet needs xlrd, which is not installed")
+    sheet = xlrd.open_workbook(path).sheet_by_index(0)
+    departments = []
+    for row in range(1, sheet.nrows):
+        code, name, name_en = (str(value).strip() for value in sheet.row_values(row)[:3])
+        if code and name:
+            departments.append((code, name, name_en or None))
+    return departments
+
+
+def load_department_index():
+    """
+    Loads the department table into the in-memory index.
+
+    Returns:
+        DepartmentIndex: The new index.
+    """
+    columns, results = query("SELECT department_id, code, name, name_en FROM department ORDER BY department_id")
+    department_index.load(results)
+    return department_index
+
+
+# Cohorts of the alumni holding a degree of the given department texts
+LINKED_ALUMNI_COHORTS_SQL = """
+    SELECT DISTINCT al.graduation_year, COALESCE(al.sex, '')
+    FROM degree_ d
+    JOIN earned_by eb ON eb.degree_id = d.degree_id
+    JOIN alumni al ON al.alumni_id = eb.alumni_id
+    WHERE d.department = ANY(%s)
+"""
+
+
+def link_degree_departments():
+    """
+    Sets degree_.department_id from the free-text department of every degree not linked yet.
+
+    The cohort summary rows of the alumni holding a newly linked degree are
+    counted again, as their department may have changed.
+
+    Returns:
+        dict: Number of linked degrees and the department texts that matched nothing.
+    """
+    linked = 0
+    linked_texts = []
+    unmatched = []
+    columns, results = query("SELECT DISTINCT department FROM degree_ WHERE department_id IS NULL AND department IS NOT NULL")
+    with transaction():
+        for (text,) in results:
+            department = department_index.find(text)
+            if department is None:
+                unmatched.append(text)
+                continue
+            linked += query("UPDATE degree_ SET department_id = %s WHERE department = %s AND department_id IS NULL",
+                            (department["department_id"], text))
+            linked_texts.append(text)
+        if linked_texts:
+            columns, cohorts = query(LINKED_ALUMNI_COHORTS_SQL, (linked_texts,))
+            recount_cohort_summary(tuple(row) for row in cohorts)
+    if unmatched:
+        logging.warning("Degree departments without a matching department code: %s", ", ".join(unmatched))
+    return {"linked_degrees": linked, "unmatched_departments": unmatched}
+
+
+def load_departments(path=DEPARTMENT_CODES_FILE):
+    """
+    Imports the department codes spreadsheet into the department table.
+
+    Existing codes are updated, new ones are added. The in-memory index is
+    reloaded and degrees are linked to their department.
+
+    Args:
+        path (str): Path of the .xls file.
+
+    Returns:
+        dict: Number of loaded departments and linking results, or error message.
+    """
+    try:
+        departments = read_department_codes(path)
+        with transaction():
+            query(DEPARTMENT_TABLE_SQL)
+            for code, name, name_en in departments:
+                query("""
+                    INSERT INTO department (code, name, name_en)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (code) DO UPDATE SET name = EXCLUDED.name, name_en = EXCLUDED.name_en
+                """, (code, name, name_en))
+        load_department_index()
+        return {"status": "success", "loaded_departments": len(departments), **link_degree_departments()}
+    except Exception as e:
+        logging.error("Error loading department codes", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def init_departments():
+    """
+    Prepares the department lookup at server startup.
+
+    Creates the department table, imports the spreadsheet the first time,
+    loads the in-memory index and links new degrees.
+    """
+    try:
+        with transaction():
+            query(DEPARTMENT_TABLE_SQL)
+        columns, results = query("SELECT COUNT(*) FROM department")
+        if results[0][0] == 0:
+            result = load_departments()
+            if result["status"] == "error":
+                logging.error("Importing department codes failed: %s", result["message"])
+            return
+        load_department_index()
+        link_degree_departments()
+    except Exception:
+        logging.error("Error initializing departments", exc_info=True)
+
+
+def resolve_department(department_id=None, department=None):
+    """
+    Finds a department from its ID, or from its code or name.
+
+    Args:
+        department_id (int): Department ID.
+        department (str): Department code or name, fuzzy matched.
+
+    Returns:
+        dict or None: The department, or None if not found.
+    """
+    if department_id is not None:
+        return department_index.get(department_id)
+    return department_index.find(department)
@@ -0,0 +1,216 @@
+import itertools
+import logging
+import math
+
+import numpy as np
+
+from db_connection import stream_query
+
+BATCH_SIZE = 50000
+
+# One row per alumni, ordered by alumni_id so that row i is alumni index i, with the amounts of
+# all their donations. Alumni and donations come from one query, so they are read from the same
+# snapshot and every donation lands on the right alumni index.
+DONATION_DATASET_SQL = """
+    SELECT al.alumni_id,
+           al.graduation_year,
+           COALESCE(dep.department, 'Unknown') AS department,
+           sal.avg_salary,
+           COALESCE(dn.amounts, '{}') AS amounts
+    FROM alumni al
+    LEFT JOIN (
+        SELECT DISTINCT ON (eb.alumni_id) eb.alumni_id, d.department
+        FROM earned_by eb
+        JOIN degree_ d ON d.degree_id = eb.degree_id
+        ORDER BY eb.alumni_id, d.degree_id
+    ) dep ON dep.alumni_id = al.alumni_id
+    LEFT JOIN (
+        SELECT alumni_id, AVG(monthly_salary)::float8 AS avg_salary
+        FROM career_history
+        WHERE monthly_salary IS NOT NULL
+        GROUP BY alumni_id
+    ) sal ON sal.alumni_id = al.alumni_id
+    LEFT JOIN (
+        SELECT alumni_id, array_agg(amount::float8) AS amounts
+        FROM donation
+        GROUP BY alumni_id
+    ) dn ON dn.alumni_id = al.alumni_id
+    ORDER BY al.alumni_id
+"""
+
+
+def _concat(parts, dtype):
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+
+def load_donation_dataset():
+    """
+    Loads the data used by the analysis as NumPy arrays.
+
+    Reads the alumni in columnar batches; the donations of each batch are
+    flattened into one entry per donation, pointing at the alumni index.
+
+    Returns:
+        dict: Arrays indexed by alumni ('graduation_year', 'department', 'salary'; NaN when unknown)
+              and by donation ('donor_index', 'amount').
+    """
+    graduation_year, department, salary, donor_index, amount = [], [], [], [], []
+    n_alumni = 0
+    for _, columns in stream_query(DONATION_DATASET_SQL, batch_size=BATCH_SIZE, shape="columns"):
+        _, years, departments, salaries, amounts = columns
+        graduation_year.append(np.asarray(years, dtype=float))
+        department.append(np.asarray(departments, dtype=object))
+        salary.append(np.asarray(salaries, dtype=float))
+        counts = np.fromiter(map(len, amounts), dtype=np.int64, count=len(amounts))
+        donor_index.append(np.repeat(np.arange(n_alumni, n_alumni + len(amounts), dtype=np.int64), counts))
+        amount.append(np.asarray(list(itertools.chain.from_iterable(amounts)), dtype=float))
+        n_alumni += len(amounts)
+    return {
+        "graduation_year": _concat(graduation_year, float),
+        "department": _concat(department, object),
+        "salary": _concat(salary, float),
+        "donor_index": _concat(donor_index, np.int64),
+        "amount": _concat(amount, float),
+    }
+
+
+def _pearson(x, y):
+    # Pearson correlation over the pairs where both values are known
+    valid = ~(np.isnan(x) | np.isnan(y))
+    if valid.sum() < 2:
+        return None
+    x, y = x[valid], y[valid]
+    x = x - x.mean()
+    y = y - y.mean()
+    denominator = math.sqrt(float(np.dot(x, x) * np.dot(y, y)))
+    if denominator == 0:
+        return None
+    return float(np.dot(x, y) / denominator)
+
+
+def _segment_regressions(segment, n_segments, x, y):
+    """
+    Fits y = slope * x + intercept separately for every segment, all segments at once.
+
+    Uses per-segment sums from np.bincount instead of looping over segments.
+    """
+    valid = ~(np.isnan(x) | np.isnan(y))
+    segment, x, y = segment[valid], x[valid], y[valid]
+    n = np.bincount(segment, minlength=n_segments).astype(float)
+    sx = np.bincount(segment, weights=x, minlength=n_segments)
+    sy = np.bincount(segment, weights=y, minlength=n_segments)
+    sxx = np.bincount(segment, weights=x * x, minlength=n_segments)
+    syy = np.bincount(segment, weights=y * y, minlength=n_segments)
+    sxy = np.bincount(segment, weights=x * y, minlength=n_segments)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        cov = n * sxy - sx * sy
+        slope = cov / var_x
+        intercept = (sy - slope * sx) / n
+        r2 = (cov * cov) / (var_x * var_y)
+    return n, slope, intercept, r2
+
+
+def _number(value):
+    # NaN and inf are not valid JSON
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def analyze_donations(dataset, current_year):
+    """
+    Computes donation correlations, per-department regressions and donor-likelihood features.
+
+    Every step is a vectorized NumPy operation over the whole dataset.
+
+    Args:
+        dataset (dict): Arrays as returned by load_donation_dataset().
+        current_year (int): Year used to compute years since graduation.
+
+    Returns:
+        dict: The analysis results, ready to be serialized as JSON.
+    """
+    n_alumni = len(dataset["graduation_year"])
+    salary = dataset["salary"]
+    years_since_graduation = current_year - dataset["graduation_year"]
+
+    # Per-alumni totals from per-donation rows
+    total_amount = np.bincount(dataset["donor_index"], weights=dataset["amount"], minlength=n_alumni)
+    donation_count = np.bincount(dataset["donor_index"], minlength=n_alumni)
+    is_donor = (donation_count > 0).astype(float)
+
+    correlations = {
+        "total_amount_vs_salary": _pearson(total_amount, salary),
+        "total_amount_vs_years_since_graduation": _pearson(total_amount, years_since_graduation),
+        "donation_count_vs_salary": _pearson(donation_count.astype(float), salary),
+        "is_donor_vs_salary": _pearson(is_donor, salary),
+        "is_donor_vs_years_since_graduation": _pearson(is_donor, years_since_graduation),
+    }
+
+    # Department segments
+    names, segment = np.unique(dataset["department"].astype(str), return_inverse=True)
+    n_segments = len(names)
+    segment_size = np.bincount(segment, minlength=n_segments)
+    segment_donors = np.bincount(segment, weights=is_donor, minlength=n_segments)
+    segment_total = np.bincount(segment, weights=total_amount, minlength=n_segments)
+    overall_rate = is_donor.mean() if n_alumni else 0.0
+    n, slope, intercept, r2 = _segment_regressions(segment, n_segments, salary, total_amount)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        donor_rate = segment_donors / segment_size
+        avg_gift = segment_total / segment_donors
+        lift = donor_rate / overall_rate
+
+    # Salary of donors against non-donors, used as a donor-likelihood feature
+    has_salary = ~np.isnan(salary)
+    donor_salary = salary[has_salary & (is_donor == 1)]
+    non_donor_salary = salary[has_salary & (is_donor == 0)]
+
+    segments = [
+        {
+            "department": str(names[i]),
+            "alumni_count": int(segment_size[i]),
+            "donor_rate": _number(donor_rate[i]),
+            "donor_lift": _number(lift[i]),
+            "avg_total_per_donor": _number(avg_gift[i]),
+            "salary_regression": {
+                "n": int(n[i]),
+                "slope": _number(slope[i]),
+                "intercept": _number(intercept[i]),
+                "r2": _number(r2[i]),
+            },
+        }
+        for i in range(n_segments)
+    ]
+
+    return {
+        "alumni_count": n_alumni,
+        "donation_count": int(len(dataset["amount"])),
+        "donor_rate": _number(overall_rate),
+        "correlations": correlations,
+        "donor_likelihood": {
+            "avg_salary_donors": _number(donor_salary.mean()) if len(donor_salary) else None,
+            "avg_salary_non_donors": _number(non_donor_salary.mean()) if len(non_donor_salary) else None,
+        },
+        "segments": segments,
+    }
+
+
+def get_donation_analysis(current_year):
+    """
+    Loads the data and runs the donation analysis.
+
+    Args:
+        current_year (int): Year used to compute years since graduation.
+
+    Returns:
+        dict: Analysis results or error message.
+    """
+    try:
+        dataset = load_donation_dataset()
+        return {"status": "success", "donation_analysis": analyze_donations(dataset, current_year)}
+    except Exception as e:
+        logging.error("Error running donation analysis", exc_info=True)
+        return {"status": "error", "message": str(e)}
@@ -0,0 +1,339 @@
+"""
+Yearly range partitioning of the donation table.
+
+`donation` is partitioned by `date`, one partition per calendar year
+(donation_y2024 holds 2024-01-01 up to 2025-01-01) plus donation_default for
+dates outside every partition. Queries with a condition on `date` (see
+HelpFunctions.year_range_params) only read the partitions of those years.
+
+Run once to convert an existing table (writes wait while rows are copied):
+    python donation_partitions.py migrate
+Other commands:
+    python donation_partitions.py list
+    python donation_partitions.py ensure
+    python donation_partitions.py archive <year>
+    python donation_partitions.py restore <year>
+"""
+import datetime
+import logging
+import sys
+import threading
+import time
+
+from db_connection import query, statement_timeout, transaction
+from change_notify import CHANGE_CHANNEL, install_change_triggers
+
+# Donation partitioning setup
+PARTITION_YEARS_AHEAD = 2  # partitions created in advance after the current year
+PARTITION_MAINTENANCE_INTERVAL = 24 * 3600  # seconds between two checks for missing future partitions
+MIGRATION_STATEMENT_TIMEOUT = 4 * 3600  # seconds the row copy of the migration may take
+ARCHIVE_SCHEMA = "donation_archive"  # detached years are moved to this schema, still queryable
+DEFAULT_PARTITION = "donation_default"
+
+PARTITIONED_SQL = """
+    SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('public.donation'))
+"""
+
+PARTITIONS_SQL = """
+    SELECT c.relname AS partition, pg_get_expr(c.relpartbound, c.oid) AS bounds,
+           GREATEST(c.reltuples, 0)::bigint AS estimated_rows, pg_total_relation_size(c.oid) AS total_bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.donation'::regclass
+    ORDER BY c.relname
+"""
+
+ARCHIVED_SQL = """
+    SELECT c.relname AS partition, GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+           pg_total_relation_size(c.oid) AS total_bytes
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %s AND c.relkind = 'r' AND c.relname LIKE 'donation\\_y%%'
+    ORDER BY c.relname
+"""
+
+# Foreign keys of the donation table (copied to the partitioned table) and to it (which prevent the migration)
+FOREIGN_KEYS_SQL = """
+    SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+    WHERE conrelid = 'public.donation'::regclass AND contype = 'f'
+"""
+REFERENCING_SQL = """
+    SELECT conrelid::regclass::text FROM pg_constraint
+    WHERE confrelid = 'public.donation'::regclass AND contype = 'f'
+"""
+
+
+def partition_name(year):
+    """
+    Returns the name of the partition holding the donations of a year.
+    """
+    return f"donation_y{int(year)}"
+
+
+def year_bounds(year):
+    """
+    Returns the range of `date` values of a year's partition: first day included, last excluded.
+    """
+    return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+
+
+def _scalar(sql_query, params=None):
+    columns, results = query(sql_query, params)
+    return results[0][0] if results else None
+
+
+def _partitions():
+    columns, results = query(PARTITIONS_SQL)
+    return {row[0] for row in results}
+
+
+def _notify_donation_change():
+    # Detaching or attaching a partition fires no row trigger: tell every worker to drop its cached donation responses
+    query("""
+        SELECT pg_notify(%s, json_build_object('table', 'donation', 'op', 'UPDATE',
+                                               'sent_at', EXTRACT(EPOCH FROM clock_timestamp()))::text)
+    """, (CHANGE_CHANNEL,))
+
+
+def _attach_year(table, year):
+    # Donations of the year already stored in the default partition move to the new one first,
+    # otherwise the partition could not be attached
+    start, end = year_bounds(year)
+    if DEFAULT_PARTITION in _partitions():
+        query(f"""
+            WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *)
+            INSERT INTO {table} SELECT * FROM moved
+        """, (start, end))
+    query(f"ALTER TABLE donation ATTACH PARTITION {table} FOR VALUES FROM (%s) TO (%s)", (start, end))
+
+
+def ensure_donation_partitions(years_ahead=PARTITION_YEARS_AHEAD):
+    """
+    Creates the partitions of the current year and the next `years_ahead` years when missing.
+
+    Does nothing while the donation table is not partitioned. Safe to run
+    from several workers at once: they are serialized with an advisory lock.
+
+    Args:
+        years_ahead (int): Years after the current one to create partitions for.
+
+    Returns:
+        dict: The partitions created, or an error message.
+    """
+    try:
+        created = []
+        with transaction():
+            query("SELECT pg_advisory_xact_lock(hashtext('donation_partitions'))")
+            if not _scalar(PARTITIONED_SQL):
+                return {"status": "success", "created": created}
+            existing = _partitions()
+            current_year = datetime.date.today().year
+            for year in range(current_year, current_year + years_ahead + 1):
+                table = partition_name(year)
+                if table in existing:
+                    continue
+                query(f"CREATE TABLE {table} (LIKE donation INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+                _attach_year(table, year)
+                created.append(table)
+        if created:
+            logging.info("Created donation partitions %s", ", ".join(created))
+        return {"status": "success", "created": created}
+    except Exception as e:
+        logging.error("Error creating donation partitions", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def migrate_donation_table(years_ahead=PARTITION_YEARS_AHEAD):
+    """
+    Converts the donation table into a table partitioned by year of `date`.
+
+    The rows are copied into a new partitioned table, which then takes the
+    name `donation`; the old table is kept as donation_unpartitioned until it
+    is dropped by hand. Writes to donation wait until the copy is committed,
+    reads keep working. Running it on a partitioned table does nothing.
+
+    The primary key becomes (donation_id, date), since a unique key of a
+    partitioned table must include the partition column; donation_id keeps
+    its sequence. Tables with a foreign key to donation prevent the migration.
+
+    Args:
+        years_ahead (int): Years after the current one to create partitions for.
+
+    Returns:
+        dict: The partitions created and the rows copied, or an error message.
+    """
+    try:
+        with statement_timeout(MIGRATION_STATEMENT_TIMEOUT), transaction():
+            query("SELECT pg_advisory_xact_lock(hashtext('donation_partitions'))")
+            if _scalar(PARTITIONED_SQL):
+                return {"status": "success", "migrated": False, "message": "donation is already partitioned"}
+            columns, referencing = query(REFERENCING_SQL)
+            if referencing:
+                return {"status": "error", "message": "Foreign keys to donation from: "
+                        + ", ".join(table for (table,) in referencing)}
+
+            # Reads continue on the old table, writes wait for the new one
+            query("LOCK TABLE donation IN EXCLUSIVE MODE")
+            query("""
+                CREATE TABLE donation_partitioned (LIKE donation INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (date)
+            """)
+            query("ALTER TABLE donation_partitioned ADD PRIMARY KEY (donation_id, date)")
+            columns, foreign_keys = query(FOREIGN_KEYS_SQL)
+            for name, definition in foreign_keys:
+                query(f"ALTER TABLE donation_partitioned ADD CONSTRAINT {name}_p {definition}")
+
+            current_year = datetime.date.today().year
+            first_year = _scalar("SELECT EXTRACT(YEAR FROM MIN(date))::int FROM donation") or current_year
+            partitions = []
+            for year in range(min(first_year, current_year), current_year + years_ahead + 1):
+                table = partition_name(year)
+                query(f"CREATE TABLE {table} PARTITION OF donation_partitioned FOR VALUES FROM (%s) TO (%s)",
+                      year_bounds(year))
+                partitions.append(table)
+            query(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF donation_partitioned DEFAULT")
+            # Created on every partition, including the ones added later
+            query("CREATE INDEX idx_donation_alumni_id_p ON donation_partitioned (alumni_id)")
+
+            rows = query("INSERT INTO donation_partitioned SELECT * FROM donation")
+
+            sequence = _scalar("SELECT pg_get_serial_sequence('donation', 'donation_id')")
+            if sequence:
+                # Otherwise the sequence would be dropped with the old table
+                query(f"ALTER SEQUENCE {sequence} OWNED BY donation_partitioned.donation_id")
+            query("ALTER TABLE donation RENAME TO donation_unpartitioned")
+            query("ALTER TABLE donation_partitioned RENAME TO donation")
+            query("ANALYZE donation")
+        # The change notification trigger stayed on the old table
+        install_change_triggers()
+        logging.info("Partitioned donation: %s rows in %s yearly partitions", rows, len(partitions))
+        return {"status": "success", "migrated": True, "rows": rows, "partitions": partitions}
+    except Exception as e:
+        logging.error("Error partitioning the donation table", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def archive_donation_year(year):
+    """
+    Detaches the partition of a past year from donation and moves it to ARCHIVE_SCHEMA.
+
+    The donations of that year no longer appear in any donation query; they
+    stay in donation_archive.donation_y<year> and can be brought back with
+    restore_donation_year. Donations recorded for that year afterwards go to
+    the default partition.
+
+    Args:
+        year (int): Year to archive, before the current year.
+
+    Returns:
+        dict: The archive table, or an error message.
+    """
+    try:
+        if year >= datetime.date.today().year:
+            return {"status": "error", "message": "Only past years can be archived"}
+        table = partition_name(year)
+        with transaction():
+            query("SELECT pg_advisory_xact_lock(hashtext('donation_partitions'))")
+            if table not in _partitions():
+                return {"status": "error", "message": f"No donation partition for {year}"}
+            query(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+            query(f"ALTER TABLE donation DETACH PARTITION {table}")
+            query(f"ALTER TABLE {table} SET SCHEMA {ARCHIVE_SCHEMA}")
+            _notify_donation_change()
+        return {"status": "success", "archived": f"{ARCHIVE_SCHEMA}.{table}"}
+    except Exception as e:
+        logging.error("Error archiving donation year %s", year, exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def restore_donation_year(year):
+    """
+    Attaches an archived year back to donation.
+
+    Args:
+        year (int): Year archived with archive_donation_year.
+
+    Returns:
+        dict: The restored partition, or an error message.
+    """
+    try:
+        table = partition_name(year)
+        with transaction():
+            query("SELECT pg_advisory_xact_lock(hashtext('donation_partitions'))")
+            if not _scalar("SELECT to_regclass(%s) IS NOT NULL", (f"{ARCHIVE_SCHEMA}.{table}",)):
+                return {"status": "error", "message": f"No archived donations for {year}"}
+            query(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} SET SCHEMA public")
+            _attach_year(table, year)
+            _notify_donation_change()
+        return {"status": "success", "restored": table}
+    except Exception as e:
+        logging.error("Error restoring donation year %s", year, exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def list_donation_partitions():
+    """
+    Lists the partitions of the donation table and the archived years.
+
+    Returns:
+        dict: Whether donation is partitioned, each partition with its bounds,
+              estimated row count and size in bytes, and the archived partitions.
+    """
+    try:
+        with transaction():
+            partitioned = bool(_scalar(PARTITIONED_SQL))
+            columns, results = query(PARTITIONS_SQL)
+            partitions = [dict(zip(columns, row)) for row in results]
+            columns, results = query(ARCHIVED_SQL, (ARCHIVE_SCHEMA,))
+            archived = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "partitioned": partitioned, "partitions": partitions, "archived": archived}
+    except Exception as e:
+        logging.error("Error listing donation partitions", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+_maintenance = None
+
+
+def _partition_maintenance(interval):
+    while True:
+        result = ensure_donation_partitions()
+        if result["status"] == "error":
+            logging.error("Donation partition maintenance failed: %s", result["message"])
+        time.sleep(interval)
+
+
+def start_partition_maintenance(interval=PARTITION_MAINTENANCE_INTERVAL):
+    """
+    Starts a background thread that creates the donation partitions of the coming years in advance.
+
+    Calling it again while the thread is running has no effect.
+
+    Args:
+        interval (int): Seconds between two checks.
+    """
+    global _maintenance
+    if _maintenance is not None and _maintenance.is_alive():
+        return
+    _maintenance = threading.Thread(target=_partition_maintenance, args=(interval,),
+                                    name="donation-partitions", daemon=True)
+    _maintenance.start()
+
+
+COMMANDS = {
+    "migrate": migrate_donation_table,
+    "ensure": ensure_donation_partitions,
+    "list": list_donation_partitions,
+    "archive": lambda year: archive_donation_year(int(year)),
+    "restore": lambda year: restore_donation_year(int(year)),
+}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(__doc__)
+        sys.exit(1)
+    result = COMMANDS[sys.argv[1]](*sys.argv[2:])
+    print(result)
+    sys.exit(0 if result["status"] == "success" else 1)
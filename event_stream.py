@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import uuid
+from collections import deque
+
+from db_connection import query
+from change_notify import listen
+
+# Event stream setup
+EVENT_CHANNEL = "api_events"
+EVENT_TYPES = ("event_created", "event_updated", "event_deleted", "membership_changed", "resync")
+REPLAY_BUFFER_SIZE = 200  # recent events kept for clients reconnecting with Last-Event-ID
+SUBSCRIBER_QUEUE_SIZE = 100  # events waiting for a slow client before its stream is closed
+MAX_SUBSCRIBERS = 500  # open streams per process
+HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments on an idle stream
+RETRY_MS = 3000  # how long clients wait before reconnecting
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more, which would roll back the write itself
+MAX_PAYLOAD_BYTES = 7900
+# Data kept when an event is too large to send whole; subscribers re-read the rest
+EVENT_KEY_FIELDS = ("association_id", "alumni_id", "action", "event_name", "date")
+
+# Associations followed by a subscription filtered on an alumni
+MEMBERSHIPS_SQL = "SELECT association_id FROM is_member WHERE alumni_id = %s"
+
+
+def publish_event(event_type, data):
+    """
+    Sends an event to the stream subscribers of every server process.
+
+    Call it inside the transaction of the write it describes: the event is
+    delivered when the transaction commits, and never if it rolls back.
+
+    Args:
+        event_type (str): One of EVENT_TYPES (e.g., 'event_created').
+        data (dict): Event data; must include association_id, and alumni_id for membership changes.
+            Only the fields identifying the change: subscribers re-read the rest.
+    """
+    # The ID is given by each receiving process (see EventBroker.publish)
+    event = {"type": event_type, "data": data}
+    payload = json.dumps(event, default=str)
+    if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+        logging.warning("Stream event %s is too large to send whole, sending its key fields only", event_type)
+        event["data"] = {key: data[key] for key in EVENT_KEY_FIELDS if key in data}
+        payload = json.dumps(event, default=str)
+    query("SELECT pg_notify(%s, %s)", (EVENT_CHANNEL, payload))
+
+
+def load_memberships(alumni_id):
+    """
+    Returns the IDs of the associations an alumni is a member of.
+    """
+    columns, results = query(MEMBERSHIPS_SQL, (alumni_id,))
+    return {association_id for (association_id,) in results}
+
+
+def format_sse(event):
+    """
+    Formats an event as a Server-Sent Events message.
+
+    Args:
+        event (dict): Event with 'id', 'type' and 'data'.
+
+    Returns:
+        str: The message, ending with a blank line.
+    """
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+class Subscription:
+    """
+    One open event stream, with its filters and queue of events to send.
+
+    Events are delivered by the listener thread. When the client reads too
+    slowly and the queue fills up, the subscription is marked overflowed and
+    its stream should be closed; the client reconnects with Last-Event-ID.
+    """
+
+    def __init__(self, association_ids=None, alumni_id=None, member_of=()):
+        """
+        Args:
+            association_ids (set): Only events of these associations, or None.
+            alumni_id (str): Only events of the associations this alumni is a member of,
+                and changes to the alumni's own memberships.
+            member_of (iterable): Associations the alumni is a member of (see MEMBERSHIPS_SQL).
+        """
+        # IDs are compared as strings: they arrive as query parameters, JSON numbers or strings
+        self.association_ids = {str(i) for i in association_ids} if association_ids else None
+        self.alumni_id = str(alumni_id) if alumni_id is not None else None
+        self.member_of = {str(i) for i in member_of}
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def matches(self, event):
+        """
+        Checks whether an event passes the filters of the subscription.
+        """
+        if event["type"] == "resync":
+            return True
+        association_id = str(event["data"].get("association_id"))
+        if event["type"] == "membership_changed" and self.alumni_id is not None:
+            if str(event["data"].get("alumni_id")) != self.alumni_id:
+                return False
+            # Keep following the associations the alumni joins or leaves
+            if event["data"].get("action") == "added":
+                self.member_of.add(association_id)
+            else:
+                self.member_of.discard(association_id)
+            return True
+        if self.association_ids is None and self.alumni_id is None:
+            return True
+        return association_id in (self.association_ids or set()) or association_id in self.member_of
+
+    def deliver(self, event):
+        if self.overflowed or not self.matches(event):
+            return
+        try:
+            self._put(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def _put(self, event):
+        self._queue.put_nowait(event)
+
+    def get(self, timeout):
+        """
+        Waits for the next event.
+
+        Returns:
+            dict or None: The event, or None after `timeout` seconds without one.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """
+    Subscription read by a coroutine on an event loop instead of a thread.
+    """
+
+    def __init__(self, loop, association_ids=None, alumni_id=None, member_of=()):
+        super().__init__(association_ids, alumni_id, member_of)
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def _put(self, event):
+        # Called from the listener thread, the queue may only be used on its loop
+        if self._queue.qsize() >= SUBSCRIBER_QUEUE_SIZE:
+            raise queue.Full
+        self._loop.call_soon_threadsafe(self._enqueue, event)
+
+    def _enqueue(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """
+    Fans out the events received by this process to its open streams.
+
+    Events are numbered in the order this process receives them, which is
+    the order their transactions committed. An ID is "<broker>-<number>":
+    a Last-Event-ID from another process, or from before a restart, cannot
+    be compared with the local numbers, and the client gets a resync instead
+    of a replay. So does a client that missed more than the replay buffer.
+    """
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._recent = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._lock = threading.Lock()
+        self._broker_id = uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self.published = 0
+
+    def _parse_id(self, event_id):
+        # Sequence number of an ID given by this broker, or None
+        broker_id, _, sequence = (event_id or "").partition("-")
+        if broker_id != self._broker_id or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def subscribe(self, subscription, last_event_id=None):
+        """
+        Registers a subscription.
+
+        Args:
+            subscription (Subscription): The subscription.
+            last_event_id (str): ID of the last event the client received, to replay what it missed.
+
+        Returns:
+            list: Recent events the client missed and that match its filters, or a single
+                  resync event when they cannot all be replayed.
+
+        Raises:
+            RuntimeError: If MAX_SUBSCRIBERS streams are already open.
+        """
+        with self._lock:
+            if len(self._subscriptions) >= MAX_SUBSCRIBERS:
+                raise RuntimeError("Too many open event streams")
+            self._subscriptions.add(subscription)
+            recent = list(self._recent)
+            sequence = self._sequence
+        if not last_event_id:
+            return []
+        last_sequence = self._parse_id(last_event_id)
+        # Replay only if nothing was dropped from the buffer since the client's last event
+        oldest = recent[0]["sequence"] if recent else sequence + 1
+        if last_sequence is None or last_sequence > sequence or last_sequence < oldest - 1:
+            return [{"id": f"{self._broker_id}-{sequence}", "sequence": sequence, "type": "resync", "data": {}}]
+        return [event for event in recent if event["sequence"] > last_sequence and subscription.matches(event)]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        """
+        Numbers an event and delivers it to every matching subscription of this process.
+
+        Args:
+            event (dict): Event with 'type' and 'data'; its 'id' is set here.
+        """
+        with self._lock:
+            self._sequence += 1
+            event = dict(event, id=f"{self._broker_id}-{self._sequence}", sequence=self._sequence)
+            if event["type"] != "resync":
+                self._recent.append(event)
+            self.published += 1
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscriptions), "published": self.published}
+
+
+# Process-wide broker, fed by the change listener thread
+event_broker = EventBroker()
+
+
+def sse_stream(subscription, replay):
+    """
+    Generates the body of an event stream until the client disconnects.
+
+    Args:
+        subscription (Subscription): A subscription registered with event_broker.subscribe.
+        replay (list): Events returned by event_broker.subscribe, sent first.
+
+    Yields:
+        str: SSE messages and keep-alive comments.
+    """
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for event in replay:
+            yield format_sse(event)
+        while not subscription.overflowed:
+            event = subscription.get(HEARTBEAT_INTERVAL)
+            # Comments keep proxies from closing an idle connection
+            yield format_sse(event) if event is not None else ": keep-alive\n\n"
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+async def async_sse_stream(subscription, replay):
+    """
+    Async counterpart of sse_stream for an AsyncSubscription.
+    """
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for event in replay:
+            yield format_sse(event)
+        while not subscription.overflowed:
+            event = await subscription.get(HEARTBEAT_INTERVAL)
+            yield format_sse(event) if event is not None else ": keep-alive\n\n"
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+def _receive(payload):
+    event = json.loads(payload)
+    if event["type"] not in EVENT_TYPES:
+        logging.warning("Ignoring unknown stream event type %s", event["type"])
+        return
+    event_broker.publish(event)
+
+
+def _resync():
+    # Events sent while the listener was disconnected are lost: tell clients to reload their lists
+    event_broker.publish({"type": "resync", "data": {}})
+
+
+listen(EVENT_CHANNEL, _receive, resync=_resync)
@@ -0,0 +1,209 @@
+import io
+import logging
+import time
+from datetime import date
+
+from db_connection import copy_query, stream_query
+
+# Parquet output needs pyarrow, CSV works without it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Data export setup
+PARQUET_ROW_GROUP_SIZE = 50000  # rows fetched and written per Parquet row group
+EXPORT_FORMATS = ("csv", "parquet")
+
+# Exportable table -> exported columns with their Parquet type, and the column used by the date range filter
+EXPORT_TABLES = {
+    "alumni": {
+        "columns": [("alumni_id", "string"), ("first_name", "string"), ("last_name", "string"),
+                    ("sex", "string"), ("address", "string"), ("graduation_year", "int"),
+                    ("user_id", "int"), ("phone", "string")],
+        "date_column": None,
+    },
+    "donation": {
+        "columns": [("donation_id", "int"), ("alumni_id", "string"), ("amount", "float"),
+                    ("date", "date"), ("donation_type", "string")],
+        "date_column": "date",
+    },
+    "career_history": {
+        "columns": [("career_id", "int"), ("alumni_id", "string"), ("job_title", "string"),
+                    ("company", "string"), ("start_date", "date"), ("end_date", "date"),
+                    ("monthly_salary", "float"), ("job_description", "string")],
+        "date_column": "start_date",
+    },
+    "is_member": {
+        "columns": [("alumni_id", "string"), ("association_id", "int"), ("join_date", "date")],
+        "date_column": "join_date",
+    },
+    "event_participated_by": {
+        "columns": [("alumni_id", "string"), ("event_name", "string"), ("date", "date")],
+        "date_column": "date",
+    },
+}
+
+
+def _arrow_type(name):
+    return {
+        "string": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "date": pa.date32(),
+    }[name]
+
+
+def build_export_query(table, filters, export_format="csv"):
+    """
+    Builds the SELECT query of an export.
+
+    Args:
+        table (str): One of EXPORT_TABLES.
+        filters (dict): Optional filters:
+            - graduation_year_from / graduation_year_to (int): graduation year of the alumni.
+            - association_id (int): only members of this association.
+            - start_date / end_date (str, YYYY-MM-DD): range on the table's date column.
+        export_format (str): 'csv' or 'parquet'. Parquet exports NUMERIC columns as float8.
+
+    Returns:
+        tuple: (sql_query, params).
+
+    Raises:
+        ValueError: If the table or a filter is not valid.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table. Available: {', '.join(EXPORT_TABLES)}")
+    spec = EXPORT_TABLES[table]
+
+    select = []
+    for name, type_name in spec["columns"]:
+        if export_format == "parquet" and type_name == "float":
+            select.append(f"t.{name}::float8 AS {name}")
+        else:
+            select.append(f"t.{name}")
+
+    conditions = []
+    params = []
+    year_conditions = []
+    for key, operator in (("graduation_year_from", ">="), ("graduation_year_to", "<=")):
+        if filters.get(key) is not None:
+            year_conditions.append(f"graduation_year {operator} %s")
+            params.append(int(filters[key]))
+    if year_conditions:
+        if table == "alumni":
+            conditions.extend(f"t.{condition}" for condition in year_conditions)
+        else:
+            conditions.append(f"t.alumni_id IN (SELECT alumni_id FROM alumni WHERE {' AND '.join(year_conditions)})")
+
+    association_id = filters.get("association_id")
+    if association_id is not None:
+        if table == "is_member":
+            conditions.append("t.association_id = %s")
+        else:
+            conditions.append("t.alumni_id IN (SELECT alumni_id FROM is_member WHERE association_id = %s)")
+        params.append(int(association_id))
+
+    for key, operator in (("start_date", ">="), ("end_date", "<=")):
+        value = filters.get(key)
+        if value is None:
+            continue
+        if spec["date_column"] is None:
+            raise ValueError(f"{table} has no date column to filter on")
+        conditions.append(f"t.{spec['date_column']} {operator} %s")
+        params.append(date.fromisoformat(value))
+
+    sql_query = f"SELECT {', '.join(select)} FROM {table} t"
+    if conditions:
+        sql_query += " WHERE " + " AND ".join(conditions)
+    return sql_query, tuple(params)
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that keeps what the Parquet writer wrote since the last take().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_chunks(table, sql_query, params):
+    schema = pa.schema([(name, _arrow_type(type_name)) for name, type_name in EXPORT_TABLES[table]["columns"]])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for _, columns in stream_query(sql_query, params, batch_size=PARQUET_ROW_GROUP_SIZE, shape="columns"):
+            arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def _measured(chunks, table, export_format):
+    # Logs the size and throughput of an export once it has been fully sent
+    start = time.perf_counter()
+    total_bytes = 0
+    for chunk in chunks:
+        if chunk:
+            total_bytes += len(chunk)
+            yield chunk
+    elapsed = time.perf_counter() - start
+    megabytes = total_bytes / (1024 * 1024)
+    logging.info("Exported %s as %s: %.2f MB in %.2fs (%.2f MB/s)", table, export_format, megabytes, elapsed,
+                 megabytes / elapsed if elapsed else 0.0)
+
+
+def export_table(table, filters, export_format="csv"):
+    """
+    Streams a table export as CSV or Parquet.
+
+    CSV is produced by PostgreSQL with COPY ... TO STDOUT. Parquet is written
+    one row group at a time from a server-side cursor. Either way only one
+    chunk is held in memory at a time.
+
+    Args:
+        table (str): One of EXPORT_TABLES.
+        filters (dict): Filters, see build_export_query.
+        export_format (str): 'csv' or 'parquet'.
+
+    Returns:
+        generator: Chunks of the exported file (bytes).
+
+    Raises:
+        ValueError: If the table, format or a filter is not valid.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format. Available: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet" and pa is None:
+        raise ValueError("Parquet export needs pyarrow, which is not installed")
+
+    sql_query, params = build_export_query(table, filters, export_format)
+    if export_format == "csv":
+        chunks = copy_query(sql_query, params)
+    else:
+        chunks = _parquet_chunks(table, sql_query, params)
+    return _measured(chunks, table, export_format)
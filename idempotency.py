@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import threading
+import time
+
+from db_connection import query, transaction
+
+# Idempotency key setup
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"  # set on responses replayed from the table
+IDEMPOTENT_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+IDEMPOTENCY_EXCLUDED_PATHS = ("/login",)  # responses holding credentials are never stored
+MAX_KEY_LENGTH = 255
+IDEMPOTENCY_KEY_TTL = 24 * 3600  # seconds a stored response is replayed
+# Seconds a request holds its key; a duplicate arriving meanwhile gets 409. Longer than the
+# statement timeout of any route class, so a key is only taken over when its request is gone.
+IN_PROGRESS_LEASE = 600
+IN_PROGRESS_RETRY_AFTER = 1  # seconds a duplicate of a running request is told to wait
+MAX_STORED_KEYS = 100000  # the oldest keys are dropped beyond this many
+CLEANUP_INTERVAL = 600  # seconds between two removals of expired keys
+
+# status_code is NULL while the first request with the key is running
+IDEMPOTENCY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS idempotency_key (
+        client VARCHAR(100) NOT NULL,
+        idempotency_key VARCHAR(255) NOT NULL,
+        request_hash CHAR(64) NOT NULL,
+        status_code SMALLINT,
+        response_body BYTEA,
+        mimetype VARCHAR(100),
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        locked_until TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (client, idempotency_key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_idempotency_key_created_at ON idempotency_key (created_at);
+"""
+
+# Claims the key in one statement, so of two concurrent duplicates only one gets a row back.
+# An expired key, or one whose request died without finishing, can be claimed again.
+CLAIM_KEY_SQL = """
+    INSERT INTO idempotency_key (client, idempotency_key, request_hash, locked_until, expires_at)
+    VALUES (%s, %s, %s, NOW() + make_interval(secs => %s), NOW() + make_interval(secs => %s))
+    ON CONFLICT (client, idempotency_key) DO UPDATE
+    SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_body = NULL, mimetype = NULL,
+        created_at = NOW(), locked_until = EXCLUDED.locked_until, expires_at = EXCLUDED.expires_at
+    WHERE idempotency_key.expires_at < NOW()
+       OR (idempotency_key.status_code IS NULL AND idempotency_key.locked_until < NOW()
+           AND idempotency_key.request_hash = EXCLUDED.request_hash)
+    RETURNING 1
+"""
+
+STORED_KEY_SQL = """
+    SELECT request_hash, status_code, response_body, mimetype
+    FROM idempotency_key WHERE client = %s AND idempotency_key = %s
+"""
+
+COMPLETE_KEY_SQL = """
+    UPDATE idempotency_key SET status_code = %s, response_body = %s, mimetype = %s, locked_until = NULL
+    WHERE client = %s AND idempotency_key = %s AND status_code IS NULL
+"""
+
+RELEASE_KEY_SQL = "DELETE FROM idempotency_key WHERE client = %s AND idempotency_key = %s AND status_code IS NULL"
+
+_stats_lock = threading.Lock()
+_stats = {"claimed": 0, "replayed": 0, "in_progress": 0, "mismatched": 0, "released": 0}
+_cleaner = None
+
+
+def create_idempotency_table():
+    """
+    Creates the idempotency_key table if it does not exist.
+    """
+    with transaction():
+        query("SELECT pg_advisory_xact_lock(hashtext('create_idempotency_table'))")
+        query(IDEMPOTENCY_TABLE_SQL)
+
+
+def request_fingerprint(method, path, query_string, body):
+    """
+    Hashes a request, so a key sent again with a different request is detected.
+
+    Args:
+        method (str): HTTP method.
+        path (str): Request path.
+        query_string (bytes): Raw query string.
+        body (bytes): Raw request body.
+
+    Returns:
+        str: Hex SHA-256 of the request.
+    """
+    digest = hashlib.sha256()
+    for part in (method.encode(), path.encode(), query_string, body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def claim_idempotency_key(client, key, request_hash):
+    """
+    Claims an idempotency key for a request about to run, or finds what happened to it before.
+
+    Args:
+        client (str): Who sends the request (username, or IP address of anonymous clients); keys are per client.
+        key (str): Value of the Idempotency-Key header.
+        request_hash (str): request_fingerprint of the request.
+
+    Returns:
+        dict: 'status' is one of:
+            - 'claimed': the request runs; call complete_idempotency_key or release_idempotency_key afterwards.
+            - 'done': the request already ran, with 'status_code', 'body' and 'mimetype' of its response.
+            - 'in_progress': the same request is running right now.
+            - 'mismatch': the key was used for a different request.
+            - 'error': the table could not be read, with 'message'.
+    """
+    claimed = query(CLAIM_KEY_SQL, (client, key, request_hash, IN_PROGRESS_LEASE, IDEMPOTENCY_KEY_TTL))
+    if claimed is None:
+        return {"status": "error", "message": "Could not check the Idempotency-Key"}
+    if claimed[1]:
+        _count("claimed")
+        return {"status": "claimed"}
+
+    stored = query(STORED_KEY_SQL, (client, key))
+    if stored is None:
+        return {"status": "error", "message": "Could not check the Idempotency-Key"}
+    if not stored[1]:
+        # Released between the two statements: the request may run again
+        return claim_idempotency_key(client, key, request_hash)
+    stored_hash, status_code, body, mimetype = stored[1][0]
+    if stored_hash != request_hash:
+        _count("mismatched")
+        return {"status": "mismatch"}
+    if status_code is None:
+        _count("in_progress")
+        return {"status": "in_progress"}
+    _count("replayed")
+    return {"status": "done", "status_code": status_code, "body": bytes(body), "mimetype": mimetype}
+
+
+def complete_idempotency_key(client, key, status_code, body, mimetype):
+    """
+    Stores the response of a request that claimed its key, to replay it to duplicates.
+    """
+    if query(COMPLETE_KEY_SQL, (status_code, body, mimetype, client, key)) is None:
+        logging.error("Could not store the response for Idempotency-Key %s of %s", key, client)
+
+
+def release_idempotency_key(client, key):
+    """
+    Frees a claimed key without storing a response, so that a retry runs the request again.
+
+    Used when the request failed in a way worth retrying (server error, rate limit).
+    """
+    _count("released")
+    if query(RELEASE_KEY_SQL, (client, key)) is None:
+        logging.error("Could not release Idempotency-Key %s of %s", key, client)
+
+
+def cleanup_idempotency_keys(max_keys=MAX_STORED_KEYS):
+    """
+    Deletes expired keys, then the oldest keys beyond `max_keys`.
+
+    Returns:
+        int: Keys deleted.
+    """
+    deleted = query("DELETE FROM idempotency_key WHERE expires_at < NOW()") or 0
+    deleted += query("""
+        DELETE FROM idempotency_key WHERE (client, idempotency_key) IN (
+            SELECT client, idempotency_key FROM idempotency_key
+            WHERE status_code IS NOT NULL
+            ORDER BY created_at DESC OFFSET %s
+        )
+    """, (max_keys,)) or 0
+    return deleted
+
+
+def _idempotency_cleaner(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            cleanup_idempotency_keys()
+        except Exception:
+            logging.error("Error removing expired idempotency keys", exc_info=True)
+
+
+def start_idempotency_cleanup(interval=CLEANUP_INTERVAL):
+    """
+    Creates the idempotency_key table and starts a background thread that removes expired keys.
+
+    Calling it again while the thread is running has no effect.
+
+    Args:
+        interval (int): Seconds between two cleanups.
+    """
+    global _cleaner
+    if _cleaner is not None and _cleaner.is_alive():
+        return
+    try:
+        create_idempotency_table()
+    except Exception:
+        logging.error("Error creating the idempotency_key table", exc_info=True)
+    _cleaner = threading.Thread(target=_idempotency_cleaner, args=(interval,), name="idempotency-cleanup",
+                                daemon=True)
+    _cleaner.start()
+
+
+def get_idempotency_stats():
+    """
+    Returns the idempotency key metrics of this process.
+
+    Returns:
+        dict: Keys claimed, responses replayed, duplicates rejected while their
+              request was running or because the request differed, and keys released.
+    """
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,372 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db_connection import query, execute_update, replica_reads, statement_timeout, transaction
+from HelpFunctions import get_donation_trends, get_salary_trends, list_alumni
+from donation_analysis import get_donation_analysis
+from departments import resolve_department
+from response_encoding import dumps_bytes
+
+# Job queue setup
+JOB_WORKERS = 2  # reports running at the same time
+MAX_PENDING_JOBS = 20  # queued + running jobs before new submissions are rejected
+JOB_RESULT_TTL_MINUTES = 30  # a finished job is reused for identical submissions during this time
+JOB_RETENTION_DAYS = 7  # finished jobs older than this are deleted at startup
+TREND_CHUNK_YEARS = 10  # donation trends are computed one decade at a time to report progress
+JOB_STATEMENT_TIMEOUT = 900  # seconds each statement of a job may run, jobs are meant for slow reports
+# A running job is owned by one server process for this long, renewed by its heartbeat. Another
+# process takes the job over only once the lease has expired, i.e. when the owner is gone.
+JOB_LEASE_SECONDS = 90
+JOB_HEARTBEAT_INTERVAL = 30  # seconds between two lease renewals and checks for jobs left behind
+
+JOB_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS report_job (
+        job_id VARCHAR(32) PRIMARY KEY,
+        job_type VARCHAR(50) NOT NULL,
+        params JSONB NOT NULL,
+        params_hash CHAR(64) NOT NULL,
+        status VARCHAR(10) NOT NULL DEFAULT 'queued',
+        progress REAL NOT NULL DEFAULT 0,
+        result JSONB,
+        error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+    -- Server process running the job and until when it holds it
+    ALTER TABLE report_job ADD COLUMN IF NOT EXISTS owner VARCHAR(100);
+    ALTER TABLE report_job ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP;
+    -- At most one queued or running job per job type and parameters
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_report_job_in_flight
+        ON report_job (job_type, params_hash) WHERE status IN ('queued', 'running');
+    CREATE INDEX IF NOT EXISTS idx_report_job_done
+        ON report_job (job_type, params_hash, finished_at) WHERE status = 'done';
+    CREATE INDEX IF NOT EXISTS idx_report_job_claimable
+        ON report_job (created_at) WHERE status IN ('queued', 'running');
+"""
+
+# Jobs a worker may take: queued ones, and running ones whose owner stopped renewing the lease
+CLAIMABLE_JOB_CONDITION = "status = 'queued' OR (status = 'running' AND lease_until < NOW())"
+
+# Takes the oldest claimable job. Rows locked by another worker taking a job are skipped,
+# so two workers never get the same job.
+CLAIM_JOB_SQL = f"""
+    UPDATE report_job
+    SET status = 'running', owner = %s, lease_until = NOW() + make_interval(secs => %s),
+        progress = 0, started_at = NOW()
+    WHERE job_id = (
+        SELECT job_id FROM report_job
+        WHERE {CLAIMABLE_JOB_CONDITION}
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING job_id, job_type, params
+"""
+
+_executor = None
+_pending = 0
+_state_lock = threading.Lock()
+_heartbeat = None
+_owner = None  # (PID, owner ID written to report_job.owner)
+
+
+# Job functions: take the job parameters and a progress callback, return a JSON-serializable dict
+def _run_donation_trends(params, report_progress):
+    start_year, end_year = int(params["start_year"]), int(params["end_year"])
+    trends = []
+    total_chunks = (end_year - start_year) // TREND_CHUNK_YEARS + 1
+    for i, chunk_start in enumerate(range(start_year, end_year + 1, TREND_CHUNK_YEARS)):
+        chunk_end = min(chunk_start + TREND_CHUNK_YEARS - 1, end_year)
+        result = get_donation_trends((chunk_start, chunk_end))
+        if result["status"] == "error":
+            return result
+        trends.extend(result["donation_trends"])
+        report_progress((i + 1) / total_chunks)
+    return {"status": "success", "donation_trends": trends}
+
+
+def _run_list_alumni(params, report_progress):
+    return list_alumni(params.get("shape", "dicts"))
+
+
+def _run_salary_trends(params, report_progress):
+    # "department" may be a department ID, code or name
+    department = params["department"]
+    department = resolve_department(department_id=department) if isinstance(department, int) \
+        else resolve_department(department=department)
+    if department is None:
+        return {"status": "error", "message": "Unknown department"}
+    return get_salary_trends(department["department_id"], (int(params["start_year"]), int(params["end_year"])))
+
+
+def _run_donation_analysis(params, report_progress):
+    return get_donation_analysis(int(params.get("current_year", datetime.today().year)))
+
+
+# Job type -> (function, required parameters)
+JOB_TYPES = {
+    "donation_trends": (_run_donation_trends, ("start_year", "end_year")),
+    "list_alumni": (_run_list_alumni, ()),
+    "salary_trends": (_run_salary_trends, ("department", "start_year", "end_year")),
+    "donation_analysis": (_run_donation_analysis, ()),
+}
+
+
+def _params_hash(job_type, params):
+    canonical = json.dumps([job_type, params], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _ensure_started():
+    global _executor
+    with _state_lock:
+        if _executor is None:
+            with transaction():
+                query(JOB_TABLE_SQL)
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="report-job")
+
+
+def _release_slot():
+    global _pending
+    with _state_lock:
+        _pending -= 1
+
+
+def _worker_id():
+    # Unique per process, even when a restarted server gets the PID of the one before it;
+    # renewed after a fork
+    global _owner
+    if _owner is None or _owner[0] != os.getpid():
+        _owner = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    return _owner[1]
+
+
+def _claim_job():
+    """
+    Takes the next claimable job for this process.
+
+    Returns:
+        tuple: (job_id, job_type, params), or None when no job is waiting.
+    """
+    columns, results = query(CLAIM_JOB_SQL, (_worker_id(), JOB_LEASE_SECONDS))
+    return results[0] if results else None
+
+
+def _run_job(job_id, job_type, params):
+    """
+    Runs one claimed job and stores its result or error.
+
+    The job's rows are only written while this process still owns the job, so
+    a job taken over after its lease expired is not overwritten by its old owner.
+    """
+    owner = _worker_id()
+    try:
+        def report_progress(fraction):
+            execute_update("UPDATE report_job SET progress = %s WHERE job_id = %s AND owner = %s",
+                           (round(fraction, 3), job_id, owner))
+
+        func, _ = JOB_TYPES[job_type]
+        # Reports only read, so they can run on a read replica
+        with statement_timeout(JOB_STATEMENT_TIMEOUT), replica_reads():
+            result = func(params, report_progress)
+        if result.get("status") == "error":
+            raise RuntimeError(result.get("message"))
+
+        execute_update("""
+            UPDATE report_job
+            SET status = 'done', progress = 1, result = %s::jsonb, finished_at = NOW(), lease_until = NULL
+            WHERE job_id = %s AND owner = %s
+        """, (dumps_bytes(result).decode("utf-8"), job_id, owner))
+    except Exception as e:
+        logging.error("Error running job %s", job_id, exc_info=True)
+        execute_update("""
+            UPDATE report_job SET status = 'failed', error = %s, finished_at = NOW(), lease_until = NULL
+            WHERE job_id = %s AND owner = %s
+        """, (str(e), job_id, owner))
+
+
+def _run_claimable_jobs():
+    """
+    Runs on a worker thread: claims and runs jobs until none is waiting.
+    """
+    try:
+        while True:
+            job = _claim_job()
+            if job is None:
+                break
+            _run_job(*job)
+    except Exception:
+        logging.error("Error claiming a job", exc_info=True)
+    finally:
+        _release_slot()
+
+
+def _enqueue():
+    # Wakes up a worker; which job it runs is decided by the database
+    global _pending
+    with _state_lock:
+        _pending += 1
+    _executor.submit(_run_claimable_jobs)
+
+
+def _job_heartbeat(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            execute_update("""
+                UPDATE report_job SET lease_until = NOW() + make_interval(secs => %s)
+                WHERE owner = %s AND status = 'running'
+            """, (JOB_LEASE_SECONDS, _worker_id()))
+            # Pick up jobs queued by other processes or left behind by a stopped one
+            columns, results = query(f"SELECT COUNT(*) FROM report_job WHERE {CLAIMABLE_JOB_CONDITION}")
+            with _state_lock:
+                idle = JOB_WORKERS - _pending
+            for _ in range(min(results[0][0], idle)):
+                _enqueue()
+        except Exception:
+            logging.error("Error renewing job leases", exc_info=True)
+
+
+def submit_job(job_type, params):
+    """
+    Submits a report or export job.
+
+    An identical job (same type and parameters) that is already queued or
+    running is shared instead of starting a new one, and an identical job that
+    finished less than JOB_RESULT_TTL_MINUTES ago is returned as-is.
+
+    Args:
+        job_type (str): One of JOB_TYPES.
+        params (dict): Job parameters.
+
+    Returns:
+        dict: The job ID and status, or error message.
+    """
+    try:
+        if job_type not in JOB_TYPES:
+            return {"status": "error", "message": f"Unknown job type. Available: {', '.join(JOB_TYPES)}"}
+        missing = [name for name in JOB_TYPES[job_type][1] if name not in params]
+        if missing:
+            return {"status": "error", "message": f"Missing job parameters: {', '.join(missing)}"}
+
+        _ensure_started()
+        params_hash = _params_hash(job_type, params)
+
+        # Reuse a recent result
+        columns, results = query("""
+            SELECT job_id FROM report_job
+            WHERE job_type = %s AND params_hash = %s AND status = 'done'
+              AND finished_at > NOW() - make_interval(mins => %s)
+            ORDER BY finished_at DESC
+            LIMIT 1
+        """, (job_type, params_hash, JOB_RESULT_TTL_MINUTES))
+        if results:
+            return {"status": "success", "job_id": results[0][0], "job_status": "done", "reused": "cached"}
+
+        with _state_lock:
+            if _pending >= MAX_PENDING_JOBS:
+                return {"status": "error", "message": "Job queue is full, try again later", "retryable": True}
+
+        # Create the job unless an identical one is already in flight
+        job_id = uuid.uuid4().hex
+        columns, results = query("""
+            INSERT INTO report_job (job_id, job_type, params, params_hash)
+            VALUES (%s, %s, %s::jsonb, %s)
+            ON CONFLICT (job_type, params_hash) WHERE status IN ('queued', 'running') DO NOTHING
+            RETURNING job_id
+        """, (job_id, job_type, json.dumps(params, default=str), params_hash))
+        if not results:
+            columns, results = query("""
+                SELECT job_id, status FROM report_job
+                WHERE job_type = %s AND params_hash = %s AND status IN ('queued', 'running')
+            """, (job_type, params_hash))
+            if results:
+                return {"status": "success", "job_id": results[0][0], "job_status": results[0][1], "reused": "in_flight"}
+            return {"status": "error", "message": "Failed to create job", "retryable": True}
+
+        _enqueue()
+        return {"status": "success", "job_id": job_id, "job_status": "queued"}
+    except Exception as e:
+        logging.error("Error submitting job", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def get_job(job_id):
+    """
+    Retrieves the status and progress of a job.
+
+    Args:
+        job_id (str): Job ID.
+
+    Returns:
+        dict: Job details (without the result) or error message.
+    """
+    try:
+        sql_query = """
+            SELECT job_id, job_type, params, status, progress, error, created_at, started_at, finished_at
+            FROM report_job
+            WHERE job_id = %s
+        """
+        columns, results = query(sql_query, (job_id,))
+        if not results:
+            return {"status": "error", "message": "Job not found"}
+        return {"status": "success", "job": dict(zip(columns, results[0]))}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def get_job_result(job_id):
+    """
+    Retrieves the result of a finished job.
+
+    Args:
+        job_id (str): Job ID.
+
+    Returns:
+        dict: The job status and, when done, its result; or error message.
+    """
+    try:
+        columns, results = query("SELECT status, result, error FROM report_job WHERE job_id = %s", (job_id,))
+        if not results:
+            return {"status": "error", "message": "Job not found"}
+        job_status, result, error = results[0]
+        return {"status": "success", "job_status": job_status, "result": result, "error": error}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def start_job_workers(interval=JOB_HEARTBEAT_INTERVAL):
+    """
+    Creates the job table and worker pool, deletes old jobs and starts a
+    background thread that renews the leases of the jobs running here.
+
+    Jobs still queued, or running in a process whose lease has expired, are
+    picked up right away and then on every heartbeat; jobs another live
+    process is running are left to it. Calling it again while the heartbeat
+    thread is running has no effect.
+
+    Args:
+        interval (int): Seconds between two heartbeats.
+    """
+    global _heartbeat
+    if _heartbeat is not None and _heartbeat.is_alive():
+        return
+    try:
+        _ensure_started()
+        execute_update("DELETE FROM report_job WHERE finished_at < NOW() - make_interval(days => %s)", (JOB_RETENTION_DAYS,))
+        columns, results = query(f"SELECT COUNT(*) FROM report_job WHERE {CLAIMABLE_JOB_CONDITION}")
+        for _ in range(min(results[0][0], JOB_WORKERS)):
+            _enqueue()
+    except Exception:
+        logging.error("Error starting job workers", exc_info=True)
+    _heartbeat = threading.Thread(target=_job_heartbeat, args=(interval,), name="job-heartbeat", daemon=True)
+    _heartbeat.start()
@@ -0,0 +1,440 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+
+from db_connection import query, transaction, savepoint, statement_timeout
+
+# Reporting engine setup
+REPORT_REFRESH_INTERVAL = 3600  # seconds between two scheduled refreshes of every report
+REPORT_STATEMENT_TIMEOUT = 900  # seconds each statement of a scheduled refresh may run
+
+# Summary tables are rebuilt by refresh_reports() and read by the analytics endpoints
+REPORT_TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS report_employment (
+        department VARCHAR(100) NOT NULL,
+        graduation_year INT NOT NULL,
+        alumni_count INT NOT NULL,
+        employed_count INT NOT NULL,
+        avg_monthly_salary NUMERIC(12, 2),
+        PRIMARY KEY (department, graduation_year)
+    );
+
+    ALTER TABLE report_employment ADD COLUMN IF NOT EXISTS department_id SMALLINT;
+    CREATE INDEX IF NOT EXISTS idx_report_employment_department_id
+        ON report_employment (department_id, graduation_year);
+
+    CREATE TABLE IF NOT EXISTS report_donation_by_department (
+        department VARCHAR(100) PRIMARY KEY,
+        donor_count INT NOT NULL,
+        donation_count INT NOT NULL,
+        total_amount NUMERIC(14, 2) NOT NULL,
+        avg_amount NUMERIC(14, 2) NOT NULL
+    );
+
+    -- Alumni count per cohort, department (0 when unknown) and sex.
+    -- Rebuilt with the other reports and kept up to date in between by recount_cohort_summary()
+    CREATE TABLE IF NOT EXISTS report_cohort_summary (
+        graduation_year INT NOT NULL,
+        department_id SMALLINT NOT NULL,
+        sex VARCHAR(10) NOT NULL,
+        alumni_count INT NOT NULL,
+        PRIMARY KEY (graduation_year, department_id, sex)
+    );
+    -- Replaced by report_cohort_summary
+    DROP TABLE IF EXISTS report_reunion_cohort;
+
+    CREATE TABLE IF NOT EXISTS report_top_achievers (
+        alumni_id VARCHAR(20) PRIMARY KEY,
+        achievement_count INT NOT NULL,
+        latest_achievement_date DATE
+    );
+    CREATE INDEX IF NOT EXISTS idx_report_top_achievers_rank
+        ON report_top_achievers (achievement_count DESC, latest_achievement_date DESC);
+
+    CREATE TABLE IF NOT EXISTS report_refresh_log (
+        report_name VARCHAR(50) PRIMARY KEY,
+        refreshed_at TIMESTAMP NOT NULL,
+        duration_ms INT NOT NULL
+    );
+
+    -- Cohort lists are served straight from alumni by graduation year, already in name order
+    DROP INDEX IF EXISTS idx_alumni_graduation_year;
+    CREATE INDEX IF NOT EXISTS idx_alumni_cohort ON alumni (graduation_year, last_name, first_name, alumni_id);
+"""
+
+# Department of an alumni `al`: the one of their first degree
+PRIMARY_DEPARTMENT_SQL = """
+    SELECT d.department_id
+    FROM earned_by eb
+    JOIN degree_ d ON d.degree_id = eb.degree_id
+    WHERE eb.alumni_id = al.alumni_id
+    ORDER BY d.degree_id
+    LIMIT 1
+"""
+
+# Report name -> SQL that rebuilds its summary table
+REPORT_QUERIES = {
+    "report_employment": """
+        INSERT INTO report_employment (department, department_id, graduation_year, alumni_count, employed_count,
+                                       avg_monthly_salary)
+        SELECT d.department,
+               MIN(d.department_id),
+               al.graduation_year,
+               COUNT(DISTINCT al.alumni_id),
+               COUNT(DISTINCT ch.alumni_id),
+               AVG(ch.monthly_salary)
+        FROM alumni al
+        -- Each alumni once per department, however many degrees they hold in it
+        JOIN (
+            SELECT DISTINCT eb.alumni_id, d.department, d.department_id
+            FROM earned_by eb
+            JOIN degree_ d ON d.degree_id = eb.degree_id
+        ) d ON d.alumni_id = al.alumni_id
+        LEFT JOIN career_history ch
+            ON ch.alumni_id = al.alumni_id
+            AND (ch.end_date IS NULL OR ch.end_date > CURRENT_DATE)
+        GROUP BY d.department, al.graduation_year
+    """,
+    "report_donation_by_department": """
+        INSERT INTO report_donation_by_department (department, donor_count, donation_count, total_amount, avg_amount)
+        SELECT dep.department,
+               COUNT(DISTINCT dn.alumni_id),
+               COUNT(dn.donation_id),
+               SUM(dn.amount),
+               AVG(dn.amount)
+        FROM donation dn
+        -- Each donation counts once, for the department of the donor's first degree (as PRIMARY_DEPARTMENT_SQL)
+        JOIN (
+            SELECT DISTINCT ON (eb.alumni_id) eb.alumni_id, d.department
+            FROM earned_by eb
+            JOIN degree_ d ON d.degree_id = eb.degree_id
+            ORDER BY eb.alumni_id, d.degree_id
+        ) dep ON dep.alumni_id = dn.alumni_id
+        GROUP BY dep.department
+    """,
+    "report_cohort_summary": f"""
+        INSERT INTO report_cohort_summary (graduation_year, department_id, sex, alumni_count)
+        SELECT al.graduation_year, COALESCE(dep.department_id, 0), COALESCE(al.sex, ''), COUNT(*)
+        FROM alumni al
+        LEFT JOIN LATERAL ({PRIMARY_DEPARTMENT_SQL}) dep ON TRUE
+        GROUP BY 1, 2, 3
+    """,
+    "report_top_achievers": """
+        INSERT INTO report_top_achievers (alumni_id, achievement_count, latest_achievement_date)
+        SELECT alumni_id, COUNT(*), MAX(date)
+        FROM achieve
+        GROUP BY alumni_id
+    """,
+}
+
+_scheduler = None
+
+
+def create_report_tables():
+    """
+    Creates the summary tables and indexes used by the reports, if they do not exist.
+
+    Returns:
+        str: Success or error message.
+    """
+    try:
+        with transaction():
+            query(REPORT_TABLES_SQL)
+        return "Report tables ready."
+    except Exception as e:
+        logging.error("Error creating report tables", exc_info=True)
+        return f"Error: {str(e)}"
+
+
+def refresh_reports(names=None):
+    """
+    Rebuilds summary tables.
+
+    Each report is rebuilt in its own transaction, so readers see either the
+    previous or the new content of a table, never a half-built one.
+
+    Args:
+        names (list): Report names to refresh (keys of REPORT_QUERIES). Refreshes all of them if None.
+
+    Returns:
+        dict: Refresh duration per report or error message.
+    """
+    names = names or list(REPORT_QUERIES)
+    unknown = [name for name in names if name not in REPORT_QUERIES]
+    if unknown:
+        return {"status": "error", "message": f"Unknown reports: {', '.join(unknown)}"}
+
+    refreshed = {}
+    try:
+        for name in names:
+            start = time.perf_counter()
+            with transaction():
+                query(f"DELETE FROM {name}")
+                query(REPORT_QUERIES[name])
+                duration_ms = int((time.perf_counter() - start) * 1000)
+                query("""
+                    INSERT INTO report_refresh_log (report_name, refreshed_at, duration_ms)
+                    VALUES (%s, NOW(), %s)
+                    ON CONFLICT (report_name) DO UPDATE
+                    SET refreshed_at = EXCLUDED.refreshed_at, duration_ms = EXCLUDED.duration_ms
+                """, (name, duration_ms))
+            refreshed[name] = duration_ms
+        return {"status": "success", "refreshed_ms": refreshed}
+    except Exception as e:
+        logging.error("Error refreshing reports", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+def _report_scheduler(interval):
+    create_report_tables()
+    while True:
+        with statement_timeout(REPORT_STATEMENT_TIMEOUT):
+            result = refresh_reports()
+        if result["status"] == "error":
+            logging.error("Scheduled report refresh failed: %s", result["message"])
+        time.sleep(interval)
+
+
+def start_report_scheduler(interval=REPORT_REFRESH_INTERVAL):
+    """
+    Starts a background thread that creates the report tables and refreshes every report periodically.
+
+    Calling it again while the thread is running has no effect.
+
+    Args:
+        interval (int): Seconds between two refreshes.
+    """
+    global _scheduler
+    if _scheduler is not None and _scheduler.is_alive():
+        return
+    _scheduler = threading.Thread(target=_report_scheduler, args=(interval,), name="report-scheduler", daemon=True)
+    _scheduler.start()
+
+
+def _refreshed_at(name):
+    result = query("SELECT refreshed_at FROM report_refresh_log WHERE report_name = %s", (name,))
+    if not result or not result[1]:
+        return None
+    return result[1][0][0]
+
+
+# Cohort Functions
+# Counts again the summary rows of one cohort (graduation year and sex) from alumni. Rows of
+# departments left without alumni are set to 0, then removed.
+RECOUNT_COHORT_SQL = f"""
+    WITH counts AS (
+        SELECT COALESCE(dep.department_id, 0) AS department_id, COUNT(*) AS alumni_count
+        FROM alumni al
+        LEFT JOIN LATERAL ({PRIMARY_DEPARTMENT_SQL}) dep ON TRUE
+        WHERE al.graduation_year = %(year)s AND COALESCE(al.sex, '') = %(sex)s
+        GROUP BY 1
+    )
+    INSERT INTO report_cohort_summary (graduation_year, department_id, sex, alumni_count)
+    SELECT %(year)s, department_id, %(sex)s, alumni_count FROM counts
+    UNION ALL
+    SELECT %(year)s, rcs.department_id, %(sex)s, 0
+    FROM report_cohort_summary rcs
+    WHERE rcs.graduation_year = %(year)s AND rcs.sex = %(sex)s
+      AND rcs.department_id NOT IN (SELECT department_id FROM counts)
+    ON CONFLICT (graduation_year, department_id, sex)
+    DO UPDATE SET alumni_count = EXCLUDED.alumni_count
+"""
+
+# Cohort of one alumni, as keyed in report_cohort_summary
+ALUMNI_COHORT_SQL = "SELECT graduation_year, COALESCE(sex, '') FROM alumni WHERE alumni_id = %s"
+
+
+def get_alumni_cohorts(alumni_id):
+    """
+    Returns the cohort of an alumni, to recount it after the alumni is written.
+
+    Args:
+        alumni_id (str): Alumni ID.
+
+    Returns:
+        list: The (graduation_year, sex) of the alumni, or an empty list if it does not exist.
+    """
+    result = query(ALUMNI_COHORT_SQL, (alumni_id,))
+    return [tuple(row) for row in result[1]] if result else []
+
+
+def recount_cohort_summary(cohorts):
+    """
+    Counts again the cohort summary rows of the given cohorts from alumni.
+
+    Called inside the transaction of a write that can change which cohort or
+    department an alumni counts in: alumni inserts, updates and deletes, and
+    degrees linked to a department. Pass the cohorts read before the write and
+    after it. Counting the rows again, rather than adding or removing one, keeps
+    them right whichever table the department came from. Recounts of one cohort
+    run one at a time, so the last one sees the rows committed by the others.
+    The write goes on even if the summary cannot be updated; the next refresh of
+    the reports fixes it.
+
+    Args:
+        cohorts (iterable): (graduation_year, sex) pairs; duplicates are counted once.
+    """
+    for year, sex in sorted(cohort for cohort in set(cohorts) if cohort[0] is not None):
+        try:
+            with transaction(), savepoint():
+                query("SELECT pg_advisory_xact_lock(hashtext('report_cohort_summary'), hashtext(%s))",
+                      (f"{year}/{sex}",))
+                query(RECOUNT_COHORT_SQL, {"year": year, "sex": sex})
+                query("DELETE FROM report_cohort_summary WHERE graduation_year = %s AND sex = %s AND alumni_count = 0",
+                      (year, sex))
+        except psycopg2.Error as e:
+            logging.warning("Could not recount the cohort summary for %s/%s: %s", year, sex or "-", e)
+
+
+def get_cohort_size(graduation_year):
+    """
+    Returns the number of alumni who graduated in a given year, from the cohort summary.
+    """
+    columns, results = query("""
+        SELECT COALESCE(SUM(alumni_count), 0) FROM report_cohort_summary WHERE graduation_year = %s
+    """, (graduation_year,))
+    return int(results[0][0])
+
+
+# Cohort summary grouping -> column of report_cohort_summary
+COHORT_GROUPS = {"year": "graduation_year", "department": "department_id", "sex": "sex"}
+
+
+def get_cohort_summary(group_by=("year",), year_range=None):
+    """
+    Counts alumni per graduation year, department and/or sex.
+
+    Args:
+        group_by (tuple): Any of 'year', 'department', 'sex'.
+        year_range (tuple): Optional start and end graduation year.
+
+    Returns:
+        dict: One row per group with its alumni count, or error message.
+            Department 0 groups the alumni without a known department.
+    """
+    unknown = [group for group in group_by if group not in COHORT_GROUPS]
+    if unknown or not group_by:
+        return {"status": "error", "message": f"group_by must be made of: {', '.join(COHORT_GROUPS)}"}
+    try:
+        columns = [COHORT_GROUPS[group] for group in group_by]
+        sql_query = f"SELECT {', '.join(columns)}, SUM(alumni_count) AS alumni_count FROM report_cohort_summary"
+        params = ()
+        if year_range:
+            sql_query += " WHERE graduation_year BETWEEN %s AND %s"
+            params = tuple(year_range)
+        sql_query += f" GROUP BY {', '.join(columns)} HAVING SUM(alumni_count) > 0 ORDER BY {', '.join(columns)}"
+        columns, results = query(sql_query, params)
+        summary = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "cohort_summary": summary, "refreshed_at": _refreshed_at("report_cohort_summary")}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+# Trends and Insights Functions
+def get_alumni_employment_trends(department_id, year_range):
+    """
+    Retrieves alumni employment trends for a specific department over a year range.
+
+    Args:
+        department_id (int): Department ID (see departments.py).
+        year_range (tuple): Tuple containing start year and end year (graduation years).
+
+    Returns:
+        dict: Employment trend data per graduation year or error message.
+    """
+    try:
+        start_year, end_year = year_range
+        sql_query = """
+            SELECT graduation_year,
+                   SUM(alumni_count) AS alumni_count,
+                   SUM(employed_count) AS employed_count,
+                   ROUND(SUM(avg_monthly_salary * employed_count) / NULLIF(SUM(employed_count), 0), 2)
+                       AS avg_monthly_salary
+            FROM report_employment
+            WHERE department_id = %s AND graduation_year BETWEEN %s AND %s
+            GROUP BY graduation_year
+            ORDER BY graduation_year
+        """
+        columns, results = query(sql_query, (department_id, start_year, end_year))
+        trends = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "employment_trends": trends, "refreshed_at": _refreshed_at("report_employment")}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def calculate_donation_correlations():
+    """
+    Retrieves donation statistics per department.
+
+    Returns:
+        dict: Donor count, donation count, total and average amount per department, or error message.
+    """
+    try:
+        sql_query = """
+            SELECT department, donor_count, donation_count, total_amount, avg_amount
+            FROM report_donation_by_department
+            ORDER BY total_amount DESC
+        """
+        columns, results = query(sql_query)
+        correlations = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "donation_correlations": correlations,
+                "refreshed_at": _refreshed_at("report_donation_by_department")}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+# Special Reports Functions
+def generate_30_year_reunion_list(years=30):
+    """
+    Generates a list of alumni who graduated a given number of years ago.
+
+    Args:
+        years (int): Years since graduation, 30 by default.
+
+    Returns:
+        dict: Cohort year, cohort size and list of alumni, or error message.
+    """
+    try:
+        cohort_year = datetime.today().year - years
+        cohort_size = get_cohort_size(cohort_year)
+
+        sql_query = """
+            SELECT alumni_id, first_name, last_name, graduation_year, phone
+            FROM alumni
+            WHERE graduation_year = %s
+            ORDER BY last_name, first_name
+        """
+        columns, results = query(sql_query, (cohort_year,))
+        reunion_list = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "graduation_year": cohort_year, "cohort_size": cohort_size,
+                "reunion_list": reunion_list}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def get_top_achievers(limit=10):
+    """
+    Retrieves the alumni with the most achievements.
+
+    Args:
+        limit (int): Number of top achievers to retrieve.
+
+    Returns:
+        dict: List of top achievers or error message.
+    """
+    try:
+        sql_query = """
+            SELECT r.alumni_id, al.first_name, al.last_name, r.achievement_count, r.latest_achievement_date
+            FROM report_top_achievers r
+            JOIN alumni al ON al.alumni_id = r.alumni_id
+            ORDER BY r.achievement_count DESC, r.latest_achievement_date DESC
+            LIMIT %s
+        """
+        columns, results = query(sql_query, (limit,))
+        top_achievers = [dict(zip(columns, row)) for row in results]
+        return {"status": "success", "top_achievers": top_achievers, "refreshed_at": _refreshed_at("report_top_achievers")}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
@@ -0,0 +1,306 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, make_response
+
+from db_connection import pool_timed_out, set_replica_reads
+
+# Response cache setup
+# 'memory' keeps an LRU per worker process, 'file' shares entries between workers on one host
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'alumni_response_cache'))
+CACHE_MAX_ENTRIES = 1024
+CACHE_SWEEP_EVERY = 64  # FileBackend removes expired and purged files every this many writes per process
+
+
+class LRUBackend:
+    """
+    In-process LRU store for cached responses.
+
+    Entries are kept per worker process. A purge() call only reaches the
+    worker that handled the write; the other workers are reached by the
+    change listener (change_notify.py) or by using FileBackend.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, tag):
+        with self._lock:
+            return self._versions.get(tag, 0)
+
+    def bump_version(self, tag):
+        with self._lock:
+            self._versions[tag] = time.time_ns()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+# Entry files of FileBackend are named ENTRY_PREFIX + the SHA-1 of their key
+ENTRY_PREFIX = "entry-"
+
+
+class FileBackend:
+    """
+    File-based store shared by every worker process on the same host.
+
+    Each entry is a pickle file named after the hash of its key, and each
+    tag has a version file. Bumping a tag version makes every key built with
+    the old version unreachable, so purges are visible to all workers.
+
+    Unreachable files are deleted by sweep(), which runs every
+    CACHE_SWEEP_EVERY writes: entries past their TTL or built with an old tag
+    version go first, then the least recently used beyond `max_entries`.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES, sweep_every=CACHE_SWEEP_EVERY):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.sweep_every = sweep_every
+        self._writes = 0
+        self._sweep_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _entry_name(key):
+        return ENTRY_PREFIX + hashlib.sha1(key.encode()).hexdigest()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _write(self, name, data):
+        # Write to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(name))
+
+    def get(self, key):
+        path = self._path(self._entry_name(key))
+        try:
+            with open(path, "rb") as f:
+                pickle.load(f)  # header, only read by sweep()
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if entry["expires_at"] <= time.time():
+            self._remove(path)
+            return None
+        try:
+            # The modification time orders the entries for eviction, as in LRUBackend
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, entry):
+        # The header lets sweep() check an entry without loading its body
+        header = {"expires_at": entry["expires_at"], "tag_versions": entry.get("tag_versions", {})}
+        try:
+            self._write(self._entry_name(key), pickle.dumps(header) + pickle.dumps(entry))
+        except OSError:
+            logging.error("Error writing response cache entry", exc_info=True)
+        with self._sweep_lock:
+            self._writes += 1
+            due = self._writes % self.sweep_every == 0
+        if due:
+            self.sweep()
+
+    def sweep(self):
+        """
+        Deletes the entry files that can no longer be served, then the least
+        recently used ones beyond `max_entries`.
+
+        Returns:
+            int: Files deleted.
+        """
+        now = time.time()
+        versions = {}
+        kept = []
+        deleted = 0
+        for name in os.listdir(self.directory):
+            if not name.startswith(ENTRY_PREFIX):
+                continue
+            path = self._path(name)
+            try:
+                with open(path, "rb") as f:
+                    header = pickle.load(f)
+                mtime = os.path.getmtime(path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                continue
+            stale = any(versions.setdefault(tag, self.get_version(tag)) != version
+                        for tag, version in header["tag_versions"].items())
+            if stale or header["expires_at"] <= now:
+                self._remove(path)
+                deleted += 1
+            else:
+                kept.append((mtime, path))
+        if len(kept) > self.max_entries:
+            kept.sort()
+            for _, path in kept[:len(kept) - self.max_entries]:
+                self._remove(path)
+                deleted += 1
+        return deleted
+
+    def get_version(self, tag):
+        try:
+            with open(self._path(f"tag-{tag}"), "rb") as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump_version(self, tag):
+        try:
+            self._write(f"tag-{tag}", str(time.time_ns()).encode())
+        except OSError:
+            logging.error("Error bumping response cache tag %s", tag, exc_info=True)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._remove(self._path(name))
+
+
+def _create_backend(name):
+    if name == "file":
+        return FileBackend()
+    return LRUBackend()
+
+
+backend = _create_backend(CACHE_BACKEND)
+
+
+def _build_key(vary, tag_versions):
+    """
+    Builds the cache key for the current request.
+
+    The key is made of the request path (which already contains the URL
+    parameters), the query arguments listed in `vary`, and the current
+    version of every tag the route depends on.
+    """
+    parts = [request.path]
+    for name in vary:
+        parts.append(f"{name}={request.args.get(name, '')}")
+    for tag, version in tag_versions.items():
+        parts.append(f"{tag}@{version}")
+    return "|".join(parts)
+
+
+def cached(ttl, vary=(), tags=()):
+    """
+    Caches the JSON response of a GET endpoint.
+
+    Place it directly below `@app.route`. Only 200 responses are stored.
+    Responses carry `Cache-Control` and `ETag` headers, and a request whose
+    `If-None-Match` matches the stored ETag gets an empty 304.
+
+    Args:
+        ttl (int): Seconds an entry stays valid.
+        vary (tuple): Query parameters that change the response (e.g., ('limit',)).
+        tags (tuple): Tables the response is built from. Calling `purge()` with
+            one of these tables invalidates the entry.
+
+    Returns:
+        function: The decorated view function.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+
+            tag_versions = {tag: backend.get_version(tag) for tag in tags}
+            key = _build_key(vary, tag_versions)
+            entry = backend.get(key)
+            if entry is None:
+                # Refill from the primary: a lagging replica could put purged data back for the whole TTL
+                previous = set_replica_reads(False)
+                try:
+                    response = make_response(view(*args, **kwargs))
+                finally:
+                    set_replica_reads(previous)
+                # A swallowed pool timeout may have left a 200 with missing rows
+                if response.status_code != 200 or pool_timed_out():
+                    return response
+                body = response.get_data()
+                entry = {
+                    "body": body,
+                    "mimetype": response.mimetype,
+                    "etag": hashlib.sha1(body).hexdigest(),
+                    "expires_at": time.time() + ttl,
+                    "tag_versions": tag_versions,
+                }
+                backend.set(key, entry)
+
+            max_age = max(int(entry["expires_at"] - time.time()), 0)
+            # Weak comparison, compressed responses carry a weak version of the same ETag
+            if request.if_none_match.contains_weak(entry["etag"]):
+                response = make_response("", 304)
+            else:
+                response = make_response(entry["body"], 200)
+                response.mimetype = entry["mimetype"]
+            response.set_etag(entry["etag"])
+            response.headers["Cache-Control"] = f"public, max-age={max_age}"
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_all():
+    """
+    Invalidates every cached response.
+
+    Used when invalidations may have been missed, e.g. after the change
+    listener (change_notify.py) lost its database connection.
+    """
+    backend.clear()
+
+
+def purge(*tags):
+    """
+    Invalidates every cached response that depends on the given tables.
+
+    Write endpoints call this after a successful change.
+
+    Args:
+        *tags (str): Table names (e.g., 'donation', 'alumni_association').
+    """
+    for tag in tags:
+        backend.bump_version(tag)
@@ -0,0 +1,137 @@
+import datetime
+import decimal
+import gzip
+import json
+
+from flask import request
+from flask.json.provider import JSONProvider
+
+# Use orjson when it is installed, otherwise fall back to the standard library encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent as-is, compressing them costs more than it saves
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(obj):
+    """
+    Converts the non-JSON types psycopg2 returns for DATE, TIMESTAMP and NUMERIC columns.
+
+    The encoder only calls this for values it cannot handle itself, so result
+    rows never need to be converted one by one before serialization.
+    """
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        # Keep the exact value, like Flask's default encoder does
+        return str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """
+    Serializes an object to compact UTF-8 JSON bytes.
+
+    Args:
+        obj: The object to serialize.
+
+    Returns:
+        bytes: The encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider used by `jsonify`.
+
+    Output is always compact (no indentation in debug mode), dates are ISO 8601
+    strings and decimals are strings.
+    """
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def compress_body(body, accepts_br, accepts_gzip):
+    """
+    Compresses a response body with brotli or gzip, preferring brotli.
+
+    Args:
+        body (bytes): The uncompressed body.
+        accepts_br (bool): Whether the client accepts brotli.
+        accepts_gzip (bool): Whether the client accepts gzip.
+
+    Returns:
+        tuple: (body, encoding). The encoding is None when the body was left uncompressed.
+    """
+    if brotli is not None and accepts_br:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if accepts_gzip:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def compress_response(response):
+    """
+    Compresses large JSON responses with brotli or gzip, depending on what the client accepts.
+
+    Registered with `app.after_request`. Streamed responses, small bodies and
+    responses that are already encoded are returned unchanged.
+
+    Args:
+        response (Response): The outgoing response.
+
+    Returns:
+        Response: The (possibly compressed) response.
+    """
+    if (response.status_code != 200
+            or response.is_streamed
+            or response.direct_passthrough
+            or response.mimetype != "application/json"
+            or "Content-Encoding" in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    accepted = request.accept_encodings
+    body, encoding = compress_body(body, bool(accepted["br"]), bool(accepted["gzip"]))
+    if encoding is None:
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+
+    # The compressed body is a different representation, so the validator becomes weak
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
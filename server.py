@@ -1,19 +1,148 @@
-from flask import Flask, request, jsonify
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Response, g, request, jsonify
+from werkzeug.test import EnvironBuilder
 from HelpFunctions import *
+from reporting import *
+from donation_analysis import get_donation_analysis
+from career_analytics import get_career_transitions, get_time_to_first_job, get_salary_growth
+from jobs import submit_job, get_job, get_job_result, start_job_workers
+from exports import export_table
+from donation_partitions import (archive_donation_year, restore_donation_year, list_donation_partitions,
+                                 start_partition_maintenance)
+from departments import init_departments, load_departments, resolve_department, department_index
+from db_connection import (READ_YOUR_WRITES_WINDOW, PoolTimeoutError, db_circuit, get_database_stats, pop_pool_timeout,
+                           pop_wrote, set_replica_reads, set_statement_timeout, set_wrote, shared_connection,
+                           start_replica_monitor)
+from response_cache import cached, purge
+from single_flight import query_flight
+from change_notify import start_change_listener, get_change_listener_stats
+from event_stream import Subscription, event_broker, load_memberships, sse_stream
+from auth_tokens import (InvalidTokenError, issue_token, verify_token, revoke_token, revoke_user_tokens,
+                         start_revocation_sync)
+from response_encoding import FastJSONProvider, compress_response
+from admission import DEFAULT_ROUTE_CLASS, ROUTE_CLASSES, SHED_RETRY_AFTER, admission, route_class
+from idempotency import (IDEMPOTENCY_EXCLUDED_PATHS, IDEMPOTENCY_HEADER, IDEMPOTENT_METHODS, IN_PROGRESS_RETRY_AFTER,
+                         MAX_KEY_LENGTH, REPLAYED_HEADER, claim_idempotency_key, complete_idempotency_key,
+                         get_idempotency_stats, release_idempotency_key, request_fingerprint,
+                         start_idempotency_cleanup)
 
 # 初始化 Flask 應用
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
 
-# 模擬的用戶登入狀態
+# Users who logged in through this process, listed by /logged_in_users (requests are authorized with tokens)
 logged_in_users = {}
 
+# Cookie holding the time until which a client that wrote reads from the primary database
+PRIMARY_READS_COOKIE = "read_primary_until"
 
-def check_permissions(username, required_role):
+# Result shapes accepted by the `shape` query parameter of list endpoints
+RESULT_SHAPES = ("dicts", "columns")
+
+
+def get_result_shape():
+    """
+    Reads the `shape` query parameter of a list endpoint.
+
+    Returns:
+        str or None: 'dicts' (default) or 'columns', or None if the value is not supported.
+    """
+    shape = request.args.get('shape', default='dicts')
+    return shape if shape in RESULT_SHAPES else None
+
+
+def get_fields_arg(table):
+    """
+    Reads and validates the `fields` query parameter of an endpoint.
+
+    Args:
+        table (str): Table whose columns can be requested (see HelpFunctions.TABLE_COLUMNS).
+
+    Returns:
+        tuple: (fields, error response or None). fields is None when all columns are requested.
+    """
+    try:
+        return parse_fields(table, request.args.get('fields')), None
+    except ValueError as e:
+        return None, (jsonify({"status": "error", "message": str(e)}), 400)
+
+
+def get_department_arg():
+    """
+    Reads the department of an analytics endpoint from the query string.
+
+    Query Parameters:
+        - department_id (int): Department ID, or
+        - department (str): Department code (e.g., '2010') or name, fuzzy matched.
+
+    Returns:
+        dict or None: The department, or None if it is missing or unknown.
+    """
+    department_id = request.args.get('department_id', type=int)
+    if department_id is not None:
+        return resolve_department(department_id=department_id)
+    return resolve_department(department=request.args.get('department'))
+
+
+def get_year_range_arg():
+    """
+    Reads the optional `start_year` and `end_year` query parameters of a donation endpoint.
+
+    Returns:
+        tuple: (year range or None, error response or None). The range is None when both are omitted.
     """
-    Checks if the specified user has the required role to access an endpoint.
+    start_year = request.args.get('start_year', type=int)
+    end_year = request.args.get('end_year', type=int)
+    if start_year is None and end_year is None:
+        return None, None
+    if start_year is None or end_year is None:
+        return None, (jsonify({"status": "error", "message": "start_year and end_year must be given together"}), 400)
+    return (start_year, end_year), None
+
+
+@app.errorhandler(PoolTimeoutError)
+def pool_timeout_handler(error=None):
+    # Every pooled connection stayed busy: the client should come back shortly rather than get a 500
+    response = jsonify({"status": "error", "message": "Server busy, try again later"})
+    response.headers["Retry-After"] = str(SHED_RETRY_AFTER)
+    return response, 503
+
+
+@app.before_request
+def authenticate_request():
+    """
+    Verifies the bearer token of the request and stores its claims in g.current_user.
+
+    Requests without an Authorization header go on anonymously (g.current_user is None),
+    requests with an invalid, expired or revoked token are rejected with 401.
+    """
+    g.current_user = None
+    authorization = request.headers.get("Authorization")
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return jsonify({"status": "error", "message": "Authorization header must be 'Bearer <token>'"}), 401
+    try:
+        g.current_user = verify_token(token.strip())
+    except InvalidTokenError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    return None
+
+
+def check_permissions(required_role):
+    """
+    Checks if the user of the current request has the required role to access an endpoint.
+
+    The user and role come from the bearer token verified by authenticate_request.
 
     Args:
-        username (str): The username of the user attempting to access the endpoint.
         required_role (str): The role required to access the endpoint (e.g., "Admin", "User").
 
     Returns:
@@ -21,9 +150,9 @@ def check_permissions(username, required_role):
             - (bool): Whether the user has the required permissions.
             - (str): A message indicating the status ("Unauthorized", "Permission denied", or an empty string if successful).
     """
-    if username not in logged_in_users:
+    if g.current_user is None:
         return False, "Unauthorized"
-    user_role = logged_in_users[username].get("role")
+    user_role = g.current_user["role"]
     if required_role == "User":
         return True, ""  # Allow all roles for this endpoint
     if user_role != required_role:
@@ -31,6 +160,157 @@ def check_permissions(username, required_role):
     return True, ""
 
 
+@app.before_request
+def admit_request():
+    """
+    Applies the rate limit and concurrency limit of the endpoint's route class (see admission.py).
+
+    Runs after authenticate_request: logged-in users are limited per username,
+    anonymous clients per IP address. Rejected requests get 429 or 503 with a
+    Retry-After header, before they use a database connection. Admitted
+    requests run their statements with the timeout of their route class.
+    """
+    # While the database is unreachable (circuit breaker open), answer at once instead of failing every query
+    retry_after = db_circuit.retry_after()
+    if retry_after and not request.path.startswith("/stats/"):
+        response = jsonify({"status": "error", "message": "Database unavailable, try again later"})
+        response.headers["Retry-After"] = str(max(int(retry_after), 1))
+        return response, 503
+
+    view = app.view_functions.get(request.endpoint)
+    client = g.current_user["name"] if g.current_user else request.remote_addr
+    g.admission = admission.admit(client, getattr(view, "route_class", DEFAULT_ROUTE_CLASS))
+    if not g.admission.allowed:
+        response = jsonify({"status": "error", "message": g.admission.message})
+        response.headers["Retry-After"] = str(g.admission.retry_after)
+        return response, g.admission.status
+    g.previous_statement_timeout = set_statement_timeout(g.admission.statement_timeout)
+    return None
+
+
+@app.before_request
+def route_reads():
+    """
+    Lets the read-only queries of GET requests run on the read replicas (see db_connection.replica_reads).
+
+    A client that wrote in the last READ_YOUR_WRITES_WINDOW seconds carries the
+    PRIMARY_READS_COOKIE cookie and reads from the primary, so it always sees
+    its own writes, whichever server process handles the request.
+    """
+    pop_wrote()
+    pop_pool_timeout()
+    pinned = request.cookies.get(PRIMARY_READS_COOKIE, default=0.0, type=float) > time.time()
+    g.previous_replica_reads = set_replica_reads(request.method == "GET" and not pinned)
+
+
+@app.before_request
+def check_idempotency_key():
+    """
+    Runs a write request at most once per Idempotency-Key header (see idempotency.py).
+
+    A POST, PUT, PATCH or DELETE carrying the header claims its key before the
+    view runs. A retry of a request that already finished gets the stored
+    response again, with the Idempotent-Replayed header; a retry arriving while
+    the first request is still running gets 409 with Retry-After; a key reused
+    for a different request gets 422. Keys are per user (per IP address when
+    not logged in).
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key or request.method not in IDEMPOTENT_METHODS or request.path in IDEMPOTENCY_EXCLUDED_PATHS:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({"status": "error",
+                        "message": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+    client = g.current_user["name"] if g.current_user else request.remote_addr
+    request_hash = request_fingerprint(request.method, request.path, request.query_string,
+                                       request.get_data(cache=True))
+    claim = claim_idempotency_key(client, key, request_hash)
+    if claim["status"] == "claimed":
+        g.idempotency_key = (client, key)
+        return None
+    if claim["status"] == "done":
+        response = Response(claim["body"], status=claim["status_code"], mimetype=claim["mimetype"])
+        response.headers[REPLAYED_HEADER] = "true"
+        return response
+    if claim["status"] == "mismatch":
+        return jsonify({"status": "error",
+                        "message": f"{IDEMPOTENCY_HEADER} was already used for a different request"}), 422
+    if claim["status"] == "in_progress":
+        response = jsonify({"status": "error", "message": "A request with this Idempotency-Key is still running"})
+        response.headers["Retry-After"] = str(IN_PROGRESS_RETRY_AFTER)
+        return response, 409
+    response = jsonify(claim)
+    response.headers["Retry-After"] = str(IN_PROGRESS_RETRY_AFTER)
+    return response, 503
+
+
+@app.after_request
+def pin_reads_to_primary(response):
+    # The client just wrote: its next reads go to the primary until the replicas have caught up
+    if pop_wrote():
+        response.set_cookie(PRIMARY_READS_COOKIE, str(time.time() + READ_YOUR_WRITES_WINDOW),
+                            max_age=READ_YOUR_WRITES_WINDOW, httponly=True)
+    return response
+
+
+@app.after_request
+def release_admission(response):
+    # A streamed response keeps its slot until the client has received all of it
+    current = g.pop("admission", None)
+    if current is not None:
+        if response.is_streamed:
+            response.call_on_close(current.release)
+        else:
+            current.release()
+    return response
+
+
+@app.after_request
+def store_idempotent_response(response):
+    # Registered after compress_response, so it runs before it and stores the uncompressed body.
+    # Failures worth retrying (server errors, rate limits) free the key so that a retry runs again.
+    owner = g.pop("idempotency_key", None)
+    if owner is not None:
+        if response.status_code >= 500 or response.status_code == 429 or response.is_streamed:
+            release_idempotency_key(*owner)
+        else:
+            complete_idempotency_key(*owner, response.status_code, response.get_data(), response.mimetype)
+    return response
+
+
+@app.after_request
+def answer_pool_timeout(response):
+    """
+    Turns the response into a 503 with Retry-After if a query of the request
+    found no free pooled connection.
+
+    Most HelpFunctions calls catch every exception and answer an error message,
+    which would reach the client as a 404 or 500; clients retry on 503. Runs
+    before store_idempotent_response, so the Idempotency-Key is released.
+    """
+    if pop_pool_timeout() and not response.is_streamed:
+        response, status = pool_timeout_handler()
+        response.status_code = status
+    return response
+
+
+@app.teardown_request
+def end_admission(error=None):
+    # after_request does not run when the view raised; the database settings are restored in every case
+    current = g.pop("admission", None)
+    if current is not None:
+        current.release()
+    if "previous_statement_timeout" in g:
+        set_statement_timeout(g.pop("previous_statement_timeout"))
+    if "previous_replica_reads" in g:
+        set_replica_reads(g.pop("previous_replica_reads"))
+    # The view raised: free the idempotency key so that a retry runs again
+    owner = g.pop("idempotency_key", None)
+    if owner is not None:
+        release_idempotency_key(*owner)
+
+
 # === 用戶管理 ===
 @app.route('/login', methods=['POST'])
 def login():
@@ -48,7 +328,9 @@ def login():
             "status": "success",
             "user_id": 1,
             "username": "b11705022",
-            "role": "Admin"
+            "role": "Admin",
+            "token": "eyJzdWIiOjEs...",   // send as "Authorization: Bearer <token>"
+            "expires_at": 1700000000
         }
     """
     data = request.json
@@ -60,16 +342,19 @@ def login():
 
     user = login_user(username, password)
     if user:
+        token, claims = issue_token(user["user_id"], username, user["role"])
         logged_in_users[username] = {
             "user_id": user["user_id"],
             "role": user["role"]
         }
-        print("logged_in_users:", logged_in_users)
         return jsonify({
             "status": "success",
             "user_id": user["user_id"],
             "username": username,
             "role": user["role"],
+            "token": token,
+            "token_type": "Bearer",
+            "expires_at": claims["exp"],
             "message": "login success"
         }), 200
 
@@ -78,12 +363,7 @@ def login():
 @app.route('/logout', methods=['POST'])
 def logout():
     """
-    Endpoint for user logout.
-
-    Input JSON:
-        {
-            "username": "b11705022",
-        }
+    Endpoint for user logout. Revokes the bearer token of the request.
 
     Return JSON:
         {
@@ -96,13 +376,13 @@ def logout():
             "message": "用戶名或密碼錯誤"
         }
     """
-    data = request.json
-    username = data.get("username")
-    if username not in logged_in_users:
-        return jsonify({"status": "error", "message": f"user {username} has not logged in yet"}), 400
-    
-    # Remove the user from logged_in_users
-    del logged_in_users[username]
+    if g.current_user is None:
+        return jsonify({"status": "error", "message": "user has not logged in yet"}), 400
+
+    message = revoke_token(g.current_user)
+    if "Error" in message:
+        return jsonify({"status": "error", "message": message}), 500
+    logged_in_users.pop(g.current_user["name"], None)
     return jsonify({"status": "success", "message": "success"}), 200
 
 
@@ -110,11 +390,7 @@ def logout():
 @app.route('/dashboard', methods=['GET'])
 def dashboard():
     """
-    Endpoint for the dashboard.
-    Input JSON:
-        {
-            "username": "b11705022"
-        }
+    Endpoint for the dashboard, for the user of the bearer token.
     Return JSON:
         {
             "status": "success",
@@ -123,16 +399,13 @@ def dashboard():
         }
     """
 
-    data = request.json
-    username = data.get("username")
-    if username not in logged_in_users:
-        return jsonify({"status": "error", "message": f"user {username} hasn't logged in"}), 400
-    
-    user = logged_in_users[username]
+    if g.current_user is None:
+        return jsonify({"status": "error", "message": "user hasn't logged in"}), 400
+
     return jsonify({
         "status": "success",
-        "message": f"歡迎, {username}!",
-        "role": user["role"]
+        "message": f"歡迎, {g.current_user['name']}!",
+        "role": g.current_user["role"]
     }), 200
 
 
@@ -161,8 +434,7 @@ def create_user_endpoint():
         {
             "username": "b11705022",
             "password": "admin",
-            "role": "Admin",
-            "current_user": "b11705023"
+            "role": "Admin"
         }
     Return JSON:
         {
@@ -174,12 +446,11 @@ def create_user_endpoint():
     username = data.get("username")
     password = data.get("password")
     role = data.get("role")
-    current_user = data.get("current_user")
 
     if not username or not password or not role:
         return jsonify({"status": "error", "message": "缺少必要欄位"}), 400
 
-    has_permission, message = check_permissions(current_user, "Admin")
+    has_permission, message = check_permissions("Admin")
     if not has_permission:
         return jsonify({"status": "error", "message": message}), 403
 
@@ -190,62 +461,87 @@ def create_user_endpoint():
     return jsonify({"status": "success", "message": result_message}), 201
 
 
-
-@app.route('/delete_user/<string:user_id>', methods=['DELETE'])
-def delete_user_endpoint(user_id):
+@app.route('/create_alumni_account', methods=['POST'])
+def create_alumni_account_endpoint():
     """
-    Endpoint for deleting a user.
-
+    創建校友帳號與校友資料（僅限 Admin），兩者在同一個 transaction 內完成
     Input JSON:
         {
-            "username": "b11705023"
+            "username": "b11705022",
+            "password": "123",
+            "first_name": "John",
+            "last_name": "Doe",
+            "sex": "M",
+            "address": "123 Main St, City, Country",
+            "graduation_year": 2020,
+            "phone": "1234567890"
+        }
+    Return JSON:
+        {
+            "status": "success",
+            "message": "42"   // the new user_id
         }
+    """
+    data = request.json
+    if not data or not all(k in data for k in ['username', 'password', 'first_name', 'last_name', 'sex', 'address', 'graduation_year', 'phone']):
+        return jsonify({"status": "error", "message": "缺少必要欄位"}), 400
+
+    has_permission, message = check_permissions("Admin")
+    if not has_permission:
+        return jsonify({"status": "error", "message": message}), 403
+
+    alumni_data = {k: data[k] for k in ['first_name', 'last_name', 'sex', 'address', 'graduation_year', 'phone']}
+    result_message = create_alumni_account(data["username"], data["password"], alumni_data)
+    if "Error" in result_message:
+        return jsonify({"status": "error", "message": result_message}), 500
+    purge("alumni")
+
+    return jsonify({"status": "success", "message": result_message}), 201
+
+
+
+@app.route('/delete_user/<string:user_id>', methods=['DELETE'])
+def delete_user_endpoint(user_id):
+    """
+    Endpoint for deleting a user. The tokens of the deleted user are revoked.
 
     Args:
-        user_id (int): User ID to delete.
+        user_id (str): Username of the user to delete.
 
     Returns:
         JSON with status and message
     """
-    # check if the user is logged in
-    data = request.json
-    username = data.get("username")
-    
     # Role check: only Admin can delete users
-    data = request.json
-    username = data.get("username")
-    has_permission, message = check_permissions(username, "Admin")
+    has_permission, message = check_permissions("Admin")
     if not has_permission:
         return jsonify({"status": "error", "message": message}), 403
 
     message = delete_user(user_id)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    revoke_user_tokens(user_id)
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/update_user/<string:user_id>', methods=['PUT'])
 def update_user_endpoint(user_id):
     """
-    Endpoint for updating a user's details.
+    Endpoint for updating a user's details. The tokens of the updated user are
+    revoked, so a new password or role applies at once.
 
     Input JSON:
         {
-            "username": "updated_user",
-            "password": "new_password"
+            "password": "new_password",
+            "role": "Analyst"
         }
 
     Args:
-        user_id (int): User ID to update.
+        user_id (str): Username of the user to update.
 
     Returns:
         JSON with status and message.
     """
-    # check if the user is logged in
-    data = request.json
-    admin_name = data.get("admin_name")
-    
     # Role check: only Admin can update users
-    has_permission, message = check_permissions(admin_name, "Admin")
+    has_permission, message = check_permissions("Admin")
     if not has_permission:
         return jsonify({"status": "error", "message": message}), 403
     
@@ -256,6 +552,7 @@ def update_user_endpoint(user_id):
     message = update_user(user_id, data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    revoke_user_tokens(user_id)
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/get_user_details/<int:user_id>', methods=['GET'])
@@ -269,14 +566,8 @@ def get_user_details_endpoint(user_id):
     Returns:
         JSON with status and user details.
     """
-    # check if the user is logged in
-    data = request.json
-    username = data.get("username")
-    if username not in logged_in_users:
-        return jsonify({"status": "error", "message": f"用戶 {username} 尚未登入"}), 400
-    
     # Role check: only Admin can view user details
-    has_permission, message = check_permissions(username, "Admin")
+    has_permission, message = check_permissions("Admin")
     if not has_permission:
         return jsonify({"status": "error", "message": message}), 403
 
@@ -302,10 +593,22 @@ def get_degree_endpoint(alumni_id):
     return jsonify(degree), 200  # 返回狀態碼200及學歷詳細信息
 
 
+def _revoke_tokens_of(user_id):
+    """
+    Revokes the tokens of a user known by ID; tokens are revoked by username.
+    """
+    username = get_user_name(user_id)
+    if username is None:
+        logging.warning("Role of user %s changed, but no username found to revoke their tokens", user_id)
+        return
+    revoke_user_tokens(username)
+
+
 @app.route('/assign_role/<int:user_id>', methods=['PUT'])
 def assign_role_endpoint(user_id):
     """
-    Endpoint for assigning a role to a user.
+    Endpoint for assigning a role to a user. The tokens of the user are
+    revoked, so the new role applies at once.
 
     Input JSON:
         {
@@ -318,14 +621,8 @@ def assign_role_endpoint(user_id):
     Returns:
         JSON with status and message.
     """
-    # check if the user is logged in
-    data = request.json
-    username = data.get("username")
-    if username not in logged_in_users:
-        return jsonify({"status": "error", "message": f"用戶 {username} 尚未登入"}), 400
-    
     # Role check: only Admin can assign roles
-    has_permission, message = check_permissions(username, "Admin")
+    has_permission, message = check_permissions("Admin")
     if not has_permission:
         return jsonify({"status": "error", "message": message}), 403
 
@@ -337,13 +634,15 @@ def assign_role_endpoint(user_id):
     message = assign_role(user_id, role)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    _revoke_tokens_of(user_id)
     return jsonify({"status": "success", "message": message}), 200
 
 
 @app.route('/change_role/<int:user_id>', methods=['PUT'])
 def change_role_endpoint(user_id):
     """
-    Endpoint for changing a user's role.
+    Endpoint for changing a user's role. The tokens of the user are revoked,
+    so the new role applies at once.
 
     Input JSON:
         {
@@ -356,14 +655,8 @@ def change_role_endpoint(user_id):
     Returns:
         JSON with status and message.
     """
-    # check if the user is logged in
-    data = request.json
-    username = data.get("username")
-    if username not in logged_in_users:
-        return jsonify({"status": "error", "message": f"用戶 {username} 尚未登入"}), 400
-    
     # Role check: only Admin can change roles
-    has_permission, message = check_permissions(username, "Admin")
+    has_permission, message = check_permissions("Admin")
     if not has_permission:
         return jsonify({"status": "error", "message": message}), 403
 
@@ -375,6 +668,7 @@ def change_role_endpoint(user_id):
     message = change_role(user_id, new_role)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    _revoke_tokens_of(user_id)
     return jsonify({"status": "success", "message": message}), 200
 
 
@@ -406,6 +700,7 @@ def add_alumni_endpoint():
     message = add_alumni(data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("alumni")
     return jsonify({"status": "success", "message": message}), 201
 
 @app.route('/get_alumni/<string:alumni_id>', methods=['GET'])
@@ -416,10 +711,17 @@ def get_alumni_endpoint(alumni_id):
     Args:
         alumni_id (string): ID of the alumni to retrieve.
 
+    Query Parameters:
+        - fields (str): Comma-separated columns to return (e.g., "first_name,last_name,phone"), all columns if omitted.
+
     Returns:
         JSON with alumni details.
     """
-    alumni_details = get_alumni(alumni_id)
+    fields, error = get_fields_arg("alumni")
+    if error:
+        return error
+
+    alumni_details = get_alumni(alumni_id, fields)
     if alumni_details["status"] == "error":
         return jsonify(alumni_details), 404
     return jsonify(alumni_details), 200
@@ -449,6 +751,7 @@ def update_alumni_endpoint(alumni_id):
     message = update_alumni(alumni_id, data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("alumni")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/delete_alumni/<int:alumni_id>', methods=['DELETE'])
@@ -465,18 +768,28 @@ def delete_alumni_endpoint(alumni_id):
     message = delete_alumni(alumni_id)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("alumni")
     return jsonify({"status": "success", "message": message}), 200
 
 
 @app.route('/list_alumni', methods=['GET'])
+@route_class('heavy')
 def list_alumni_endpoint():
     """
     Lists all alumni.
 
+    Query Parameters:
+        - shape (str): 'dicts' (default) for one object per row, or 'columns' for
+          {"columns": [...], "data": [[...], ...], "row_count": n}.
+
     Returns:
         JSON with list of all alumni.
     """
-    alumni_list = list_alumni()
+    shape = get_result_shape()
+    if shape is None:
+        return jsonify({"status": "error", "message": "shape must be one of: dicts, columns"}), 400
+
+    alumni_list = list_alumni(shape)
     return jsonify(alumni_list), 200
 
 
@@ -543,6 +856,7 @@ def add_career_history_endpoint(alumni_id):
     message = add_career_history(alumni_id, career_data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("career_history")
     return jsonify({"status": "success", "message": message}), 201
 
 @app.route('/update_career_history/<int:career_id>', methods=['PUT'])
@@ -570,6 +884,7 @@ def update_career_history_endpoint(career_id):
     message = update_career_history(career_id, data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("career_history")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/delete_career_history/<int:career_id>', methods=['DELETE'])
@@ -586,6 +901,7 @@ def delete_career_history_endpoint(career_id):
     message = delete_career_history(career_id)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("career_history")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/get_career_history/<int:career_id>', methods=['GET'])
@@ -613,14 +929,122 @@ def get_career_paths_endpoint(alumni_id):
     Args:
         alumni_id (int): Alumni ID.
 
+    Query Parameters:
+        - fields (str): Comma-separated columns to return (e.g., "job_title,company,start_date"), all columns if omitted.
+
     Returns:
         JSON with career path details.
     """
-    career_paths = get_career_paths(alumni_id)
+    fields, error = get_fields_arg("career_history")
+    if error:
+        return error
+
+    career_paths = get_career_paths(alumni_id, fields)
     if career_paths["status"] == "error":
         return jsonify(career_paths), 404
     return jsonify(career_paths), 200
 
+# Career Analytics Endpoints
+# Cached per department and cohort; career and alumni writes purge them
+CAREER_ANALYTICS_VARY = ('department_id', 'department', 'cohort')
+
+
+def get_career_filters():
+    """
+    Reads the department and cohort filters of a career analytics endpoint.
+
+    Query Parameters:
+        - department_id (int) or department (str, code or name): Optional department.
+        - cohort (int): Optional graduation year.
+
+    Returns:
+        tuple: (department_id, cohort, error response or None).
+    """
+    department_id = None
+    if request.args.get('department_id') or request.args.get('department'):
+        department = get_department_arg()
+        if department is None:
+            return None, None, (jsonify({"status": "error", "message": "Unknown department"}), 404)
+        department_id = department["department_id"]
+    return department_id, request.args.get('cohort', type=int), None
+
+
+@app.route('/career_analytics/transitions', methods=['GET'])
+@route_class('heavy')
+@cached(ttl=600, vary=CAREER_ANALYTICS_VARY + ('by', 'limit'), tags=('career_history', 'alumni'))
+def get_career_transitions_endpoint():
+    """
+    Lists the most common moves between consecutive jobs.
+
+    Query Parameters:
+        - department_id / department, cohort: Optional filters (see get_career_filters).
+        - by (str): 'job_title' (default) or 'company'.
+        - limit (int): Number of transitions (default 20).
+
+    Example URL:
+        /career_analytics/transitions?department=Information%20Management&cohort=2015&by=company
+
+    Returns:
+        JSON with transitions, their count, company change rate and average months before the move.
+    """
+    department_id, cohort, error = get_career_filters()
+    if error:
+        return error
+    by = request.args.get('by', default='job_title')
+    limit = request.args.get('limit', default=20, type=int)
+
+    transitions = get_career_transitions(department_id, cohort, by, limit)
+    if transitions["status"] == "error":
+        return jsonify(transitions), 400 if transitions["message"].startswith("by must") else 500
+    return jsonify(transitions), 200
+
+
+@app.route('/career_analytics/time_to_first_job', methods=['GET'])
+@route_class('heavy')
+@cached(ttl=600, vary=CAREER_ANALYTICS_VARY, tags=('career_history', 'alumni'))
+def get_time_to_first_job_endpoint():
+    """
+    Measures the months between graduation and the first job, per graduating cohort.
+
+    Query Parameters:
+        - department_id / department, cohort: Optional filters (see get_career_filters).
+
+    Returns:
+        JSON with cohort size, alumni with a job, average and median months and 6-month employment rate per cohort.
+    """
+    department_id, cohort, error = get_career_filters()
+    if error:
+        return error
+
+    result = get_time_to_first_job(department_id, cohort)
+    if result["status"] == "error":
+        return jsonify(result), 500
+    return jsonify(result), 200
+
+
+@app.route('/career_analytics/salary_growth', methods=['GET'])
+@route_class('heavy')
+@cached(ttl=600, vary=CAREER_ANALYTICS_VARY, tags=('career_history', 'alumni'))
+def get_salary_growth_endpoint():
+    """
+    Builds the salary curve by years since graduation.
+
+    Query Parameters:
+        - department_id / department, cohort: Optional filters (see get_career_filters).
+
+    Returns:
+        JSON with alumni count, average and median monthly salary and growth against the first salary per year.
+    """
+    department_id, cohort, error = get_career_filters()
+    if error:
+        return error
+
+    result = get_salary_growth(department_id, cohort)
+    if result["status"] == "error":
+        return jsonify(result), 500
+    return jsonify(result), 200
+
+
 # Donation Management Endpoints
 
 @app.route('/record_donation/<string:alumni_id>', methods=['POST'])
@@ -648,6 +1072,7 @@ def record_donation_endpoint(alumni_id):
     message = record_donation(alumni_id, donation_data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("donation")
     return jsonify({"status": "success", "message": message}), 201
 
 @app.route('/update_donation/<int:donation_id>', methods=['PUT'])
@@ -675,6 +1100,7 @@ def update_donation_endpoint(donation_id):
     message = update_donation(donation_id, data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("donation")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/delete_donation/<int:donation_id>', methods=['DELETE'])
@@ -691,6 +1117,7 @@ def delete_donation_endpoint(donation_id):
     message = delete_donation(donation_id)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("donation")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/get_donation/<string:donation_id>', methods=['GET'])
@@ -701,10 +1128,26 @@ def get_donation_endpoint(donation_id):
     Args:
         donation_id (int): ID of the donation to retrieve.
 
+    Query Parameters:
+        - shape (str): 'dicts' (default) for one object per row, or 'columns' for
+          {"columns": [...], "data": [[...], ...], "row_count": n}.
+        - fields (str): Comma-separated columns to return (e.g., "amount,date"), all columns if omitted.
+        - start_year, end_year (int): Only donations made in these years; only those years are read.
+
     Returns:
         JSON with donation details.
     """
-    donation_details = get_donation(donation_id)
+    shape = get_result_shape()
+    if shape is None:
+        return jsonify({"status": "error", "message": "shape must be one of: dicts, columns"}), 400
+    fields, error = get_fields_arg("donation")
+    if error:
+        return error
+    year_range, error = get_year_range_arg()
+    if error:
+        return error
+
+    donation_details = get_donation(donation_id, shape, fields, year_range)
     if donation_details["status"] == "error":
         return jsonify(donation_details), 404
     return jsonify(donation_details), 200
@@ -727,24 +1170,30 @@ def get_total_donations_by_alumni_endpoint(alumni_id):
     return jsonify(total_donations), 200
 
 @app.route('/get_top_donors', methods=['GET'])
+@cached(ttl=300, vary=('limit', 'start_year', 'end_year'), tags=('donation',))
 def get_top_donors_endpoint():
     """
     Retrieves the top donors.
 
     Query Parameters:
         - limit (int): The number of top donors to retrieve (e.g., 5).
+        - start_year, end_year (int): Only count donations made in these years, all years if omitted.
     
     Example URL:
-        /get_top_donors?limit=5
+        /get_top_donors?limit=5&start_year=2020&end_year=2024
 
     Returns:
         JSON with list of top donors.
     """
     limit = request.args.get('limit', default=10, type=int)
-    top_donors = get_top_donors(limit)
+    year_range, error = get_year_range_arg()
+    if error:
+        return error
+    top_donors = get_top_donors(limit, year_range)
     return jsonify(top_donors), 200
 
 @app.route('/get_donation_trends', methods=['GET'])
+@route_class('heavy')
 def get_donation_trends_endpoint():
     """
     Retrieves donation trends over a specific year range.
@@ -768,6 +1217,51 @@ def get_donation_trends_endpoint():
     donation_trends = get_donation_trends((start_year, end_year))
     return jsonify(donation_trends), 200
 
+@app.route('/donations/archive/<int:year>', methods=['POST'])
+def archive_donation_year_endpoint(year):
+    """
+    Detaches the donations of a past year from the donation table (Admin only).
+
+    The year's partition moves to the donation_archive schema; its donations no longer
+    appear in any donation endpoint until it is restored.
+
+    Args:
+        year (int): Year to archive (e.g., 2005).
+
+    Returns:
+        JSON with the archive table.
+    """
+    has_permission, message = check_permissions("Admin")
+    if not has_permission:
+        return jsonify({"status": "error", "message": message}), 403
+
+    result = archive_donation_year(year)
+    if result["status"] == "error":
+        return jsonify(result), 400
+    purge("donation")
+    return jsonify(result), 200
+
+@app.route('/donations/restore/<int:year>', methods=['POST'])
+def restore_donation_year_endpoint(year):
+    """
+    Attaches an archived year back to the donation table (Admin only).
+
+    Args:
+        year (int): Archived year (e.g., 2005).
+
+    Returns:
+        JSON with the restored partition.
+    """
+    has_permission, message = check_permissions("Admin")
+    if not has_permission:
+        return jsonify({"status": "error", "message": message}), 403
+
+    result = restore_donation_year(year)
+    if result["status"] == "error":
+        return jsonify(result), 400
+    purge("donation")
+    return jsonify(result), 200
+
 
 # Achievement Management Endpoints
 
@@ -796,6 +1290,7 @@ def add_achievement_endpoint(alumni_id):
     message = add_achievement(achievement_data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("achievement")
     return jsonify({"status": "success", "message": message}), 201
 
 @app.route('/update_achievement', methods=['PUT'])
@@ -825,6 +1320,7 @@ def update_achievement_endpoint():
     message = update_achievement(data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("achievement")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/delete_achievement', methods=['DELETE'])
@@ -846,6 +1342,7 @@ def delete_achievement_endpoint():
     message = delete_achievement(data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("achievement")
     return jsonify({"status": "success", "message": message}), 200
 
 
@@ -882,12 +1379,14 @@ def list_achievements_endpoint(alumni_id):
     return jsonify(achievements), 200
 
 @app.route('/find_achievements_by_category', methods=['GET'])
+@cached(ttl=300, vary=('category', 'fields'), tags=('achievement',))
 def find_achievements_by_category_endpoint():
     """
     Finds achievements by category.
 
     Query Parameters:
         - category (str): Category of achievements to search for (e.g., "Academic").
+        - fields (str): Comma-separated columns to return (e.g., "title,date"), all columns if omitted.
 
     Example URL:
         /find_achievements_by_category?category=Academic
@@ -898,8 +1397,11 @@ def find_achievements_by_category_endpoint():
     category = request.args.get('category')
     if not category:
         return jsonify({"status": "error", "message": "Missing category parameter"}), 400
+    fields, error = get_fields_arg("achievement")
+    if error:
+        return error
 
-    achievements = find_achievements_by_category(category)
+    achievements = find_achievements_by_category(category, fields)
     return jsonify(achievements), 200
 
 # Association Management Endpoints
@@ -929,6 +1431,7 @@ def create_association_endpoint():
     message = create_association(data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("alumni_association")
     return jsonify({"status": "success", "message": message}), 201
 
 @app.route('/update_association/<int:association_id>', methods=['PUT'])
@@ -959,6 +1462,7 @@ def update_association_endpoint(association_id):
     message = update_association(association_id, data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("alumni_association")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/delete_association/<int:association_id>', methods=['DELETE'])
@@ -975,6 +1479,7 @@ def delete_association_endpoint(association_id):
     message = delete_association(association_id)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("alumni_association")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/get_association/<int:association_id>', methods=['GET'])
@@ -1042,10 +1547,29 @@ def list_association_members_endpoint(association_id):
     Args:
         association_id (int): ID of the association.
 
+    Query Parameters:
+        - shape (str): 'dicts' (default) for one object per row, or 'columns' for
+          {"columns": [...], "data": [[...], ...], "row_count": n}.
+        - include (str): Comma-separated related data to embed in every member:
+          alumni, degree, total_donations, cadre_positions (shape 'dicts' only).
+
+    Example URL:
+        /get_association_members/4?include=degree,total_donations
+
     Returns:
         JSON with list of members.
     """
-    members = list_association_members(association_id)
+    shape = get_result_shape()
+    if shape is None:
+        return jsonify({"status": "error", "message": "shape must be one of: dicts, columns"}), 400
+    include = tuple(dict.fromkeys(name.strip() for name in request.args.get('include', '').split(',') if name.strip()))
+    unknown = [name for name in include if name not in LOADER_QUERIES]
+    if unknown:
+        return jsonify({"status": "error", "message": f"include must be among: {', '.join(LOADER_QUERIES)}"}), 400
+    if include and shape != "dicts":
+        return jsonify({"status": "error", "message": "include needs shape=dicts"}), 400
+
+    members = list_association_members(association_id, shape, include)
     if members["status"] == "error":
         return jsonify(members), 404
     return jsonify(members), 200
@@ -1077,6 +1601,7 @@ def create_event_endpoint(association_id):
     message = create_event(association_id, event_data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("association_event")
     return jsonify({"status": "success", "message": message}), 201
 
 @app.route('/update_event', methods=['PUT'])
@@ -1106,6 +1631,7 @@ def update_event_endpoint():
     message = update_event(data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("association_event")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/delete_event', methods=['DELETE'])
@@ -1125,6 +1651,7 @@ def delete_event_endpoint():
     message = delete_event(data)
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("association_event")
     return jsonify({"status": "success", "message": message}), 200
 
 @app.route('/list_events_by_association/<int:association_id>', methods=['GET'])
@@ -1135,82 +1662,618 @@ def list_events_by_association_endpoint(association_id):
     Args:
         association_id (int): ID of the association.
 
+    Query Parameters:
+        - shape (str): 'dicts' (default) for one object per row, or 'columns' for
+          {"columns": [...], "data": [[...], ...], "row_count": n}.
+        - fields (str): Comma-separated columns to return (e.g., "event_name,date"), all columns if omitted.
+
     Returns:
         JSON with list of events.
     """
-    events = list_events_by_association(association_id)
+    shape = get_result_shape()
+    if shape is None:
+        return jsonify({"status": "error", "message": "shape must be one of: dicts, columns"}), 400
+    fields, error = get_fields_arg("association_event")
+    if error:
+        return error
+
+    events = list_events_by_association(association_id, shape, fields)
     if events["status"] == "error":
         return jsonify(events), 404
     return jsonify(events), 200
 
 # Data Analysis Endpoints
-# @app.route('/get_alumni_employment_trends', methods=['GET'])
-# def get_alumni_employment_trends_endpoint():
-#     """
-#     Retrieves alumni employment trends for a specific department over a year range.
+# Served from the summary tables maintained by reporting.py
+@app.route('/get_alumni_employment_trends', methods=['GET'])
+@route_class('heavy')
+def get_alumni_employment_trends_endpoint():
+    """
+    Retrieves alumni employment trends for a specific department over a year range.
+
+    Query Parameters:
+        - department_id (int): Department ID, or
+        - department (str): Department code or name (e.g., "2010", "Computer Science").
+        - start_year (int): Start graduation year (e.g., "2010").
+        - end_year (int): End graduation year (e.g., "2020").
+
+    Example URL:
+        /get_alumni_employment_trends?department=Computer%20Science&start_year=2010&end_year=2020
+
+    Returns:
+        JSON with employment trends data and the matched department.
+    """
+    start_year = request.args.get('start_year', type=int)
+    end_year = request.args.get('end_year', type=int)
+
+    if not (request.args.get('department_id') or request.args.get('department')) or not start_year or not end_year:
+        return jsonify({"status": "error", "message": "Missing required parameters"}), 400
+
+    department = get_department_arg()
+    if department is None:
+        return jsonify({"status": "error", "message": "Unknown department"}), 404
+
+    trends = get_alumni_employment_trends(department["department_id"], (start_year, end_year))
+    if trends["status"] == "error":
+        return jsonify(trends), 500
+    trends["department"] = department
+    return jsonify(trends), 200
+
+
+# Cohort Endpoints
+COHORT_PAGE_SIZE = 50
+COHORT_MAX_PAGE_SIZE = 500
+
+
+@app.route('/cohorts/<int:year>', methods=['GET'])
+def get_cohort_endpoint(year):
+    """
+    Lists the alumni of a graduation cohort, one page at a time, ordered by name.
+
+    Query Parameters:
+        - page (int): Page number, starting at 1 (default 1).
+        - page_size (int): Alumni per page (default 50, at most 500).
+
+    Example URL:
+        /cohorts/1995?page=2&page_size=100
+
+    Returns:
+        JSON with the cohort size, the page and its alumni.
+    """
+    page = request.args.get('page', default=1, type=int)
+    page_size = request.args.get('page_size', default=COHORT_PAGE_SIZE, type=int)
+    if page < 1 or not 1 <= page_size <= COHORT_MAX_PAGE_SIZE:
+        return jsonify({"status": "error",
+                        "message": f"page must be at least 1 and page_size between 1 and {COHORT_MAX_PAGE_SIZE}"}), 400
+
+    cohort = get_alumni_by_graduation_year(year, page, page_size)
+    if cohort["status"] == "error":
+        return jsonify(cohort), 500
+    cohort.update({
+        "graduation_year": year,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": -(-cohort["cohort_size"] // page_size),
+    })
+    return jsonify(cohort), 200
+
+
+@app.route('/cohorts/summary', methods=['GET'])
+@route_class('heavy')
+@cached(ttl=300, vary=('group_by', 'start_year', 'end_year'), tags=('alumni',))
+def get_cohort_summary_endpoint():
+    """
+    Counts alumni per graduation year, department and/or sex.
 
-#     Query Parameters:
-#         - department (str): Department name (e.g., "Computer Science").
-#         - start_year (int): Start year (e.g., "2010").
-#         - end_year (int): End year (e.g., "2020").
+    Query Parameters:
+        - group_by (str): Comma-separated list of year, department, sex (default "year").
+        - start_year, end_year (int): Optional graduation year range.
+
+    Example URL:
+        /cohorts/summary?group_by=year,department&start_year=1990&end_year=2000
+
+    Returns:
+        JSON with one row per group. Department rows include the department code and name;
+        department_id 0 groups alumni without a known department.
+    """
+    group_by = tuple(group.strip() for group in request.args.get('group_by', default='year').split(','))
+    start_year = request.args.get('start_year', type=int)
+    end_year = request.args.get('end_year', type=int)
+    year_range = (start_year, end_year) if start_year and end_year else None
+
+    summary = get_cohort_summary(group_by, year_range)
+    if summary["status"] == "error":
+        return jsonify(summary), 400 if summary["message"].startswith("group_by") else 500
+    if "department" in group_by:
+        for row in summary["cohort_summary"]:
+            department = resolve_department(department_id=row["department_id"])
+            row["department_code"] = department["code"] if department else None
+            row["department_name"] = department["name"] if department else None
+    return jsonify(summary), 200
+
+
+# Department Lookup Endpoints
+@app.route('/departments', methods=['GET'])
+def list_departments_endpoint():
+    """
+    Lists all departments with their ID, code, Chinese and English name.
+
+    Returns:
+        JSON with the list of departments.
+    """
+    departments = sorted(department_index.by_id.values(), key=lambda department: department["code"])
+    return jsonify({"status": "success", "departments": departments}), 200
+
+
+@app.route('/departments/search', methods=['GET'])
+def search_departments_endpoint():
+    """
+    Suggests departments matching part of a code or name.
+
+    Query Parameters:
+        - q (str): Text to search for (e.g., "資訊", "Computer").
+        - limit (int): Maximum number of suggestions (default 5).
+
+    Returns:
+        JSON with matching departments, best first, each with a similarity score.
+    """
+    text = request.args.get('q')
+    if not text:
+        return jsonify({"status": "error", "message": "Missing q parameter"}), 400
+    limit = request.args.get('limit', default=5, type=int)
+    return jsonify({"status": "success", "departments": department_index.search(text, limit)}), 200
+
+
+@app.route('/load_departments', methods=['POST'])
+def load_departments_endpoint():
+    """
+    Re-imports Department Codes.xls into the department table (Admin only).
+
+    Returns:
+        JSON with the number of departments loaded and degrees linked to a department.
+    """
+    has_permission, message = check_permissions("Admin")
+    if not has_permission:
+        return jsonify({"status": "error", "message": message}), 403
+
+    result = load_departments()
+    if result["status"] == "error":
+        return jsonify(result), 500
+    return jsonify(result), 200
+
+
+@app.route('/calculate_donation_correlations', methods=['GET'])
+@route_class('heavy')
+def calculate_donation_correlations_endpoint():
+    """
+    Retrieves donation statistics per department.
+
+    Returns:
+        JSON with donation statistics per department.
+    """
+    correlations = calculate_donation_correlations()
+    if correlations["status"] == "error":
+        return jsonify(correlations), 500
+    return jsonify(correlations), 200
+
+@app.route('/generate_30_year_reunion_list', methods=['GET'])
+@route_class('heavy')
+def generate_30_year_reunion_list_endpoint():
+    """
+    Generates a list of alumni who graduated 30 years ago.
+
+    Query Parameters:
+        - years (int): Years since graduation (default 30).
+
+    Returns:
+        JSON with reunion list.
+    """
+    years = request.args.get('years', default=30, type=int)
+    reunion_list = generate_30_year_reunion_list(years)
+    if reunion_list["status"] == "error":
+        return jsonify(reunion_list), 500
+    return jsonify(reunion_list), 200
+
+
+@app.route('/get_donation_analysis', methods=['GET'])
+@route_class('heavy')
+@cached(ttl=3600, tags=('donation', 'career_history', 'alumni'))
+def get_donation_analysis_endpoint():
+    """
+    Computes donation correlations with salary and graduation year, per-department
+    regressions of total donation on salary, and donor-likelihood features.
+
+    Returns:
+        JSON with the donation analysis.
+    """
+    analysis = get_donation_analysis(datetime.today().year)
+    if analysis["status"] == "error":
+        return jsonify(analysis), 500
+    return jsonify(analysis), 200
+
+
+@app.route('/get_top_achievers', methods=['GET'])
+@route_class('heavy')
+def get_top_achievers_endpoint():
+    """
+    Retrieves the top achievers.
+
+    Query Parameters:
+        - limit (int): Number of top achievers to retrieve (e.g., 5).
 
-#     Example URL:
-#         /get_alumni_employment_trends?department=Computer%20Science&start_year=2010&end_year=2020
+    Example URL:
+        /get_top_achievers?limit=5
+
+    Returns:
+        JSON with list of top achievers.
+    """
+    limit = request.args.get('limit', default=10, type=int)
+    top_achievers = get_top_achievers(limit)
+    if top_achievers["status"] == "error":
+        return jsonify(top_achievers), 500
+    return jsonify(top_achievers), 200
+
+
+@app.route('/refresh_reports', methods=['POST'])
+@route_class('heavy')
+def refresh_reports_endpoint():
+    """
+    Rebuilds the report summary tables now instead of waiting for the scheduler (Analyst or Admin).
+
+    Input JSON:
+        {
+            "reports": ["report_employment"]   // optional, all reports if omitted
+        }
+
+    Returns:
+        JSON with refresh duration per report.
+    """
+    # The body is optional: the caller is identified by its bearer token
+    data = request.get_json(silent=True) or {}
+    has_permission, message = check_permissions("Analyst")
+    if not has_permission:
+        has_permission, message = check_permissions("Admin")
+    if not has_permission:
+        return jsonify({"status": "error", "message": message}), 403
+
+    result = refresh_reports(data.get("reports"))
+    if result["status"] == "error":
+        return jsonify(result), 500
+    return jsonify(result), 200
+
+
+# Data Export Endpoints
+EXPORT_MIMETYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+@app.route('/export/<table>', methods=['GET'])
+@route_class('heavy')
+def export_table_endpoint(table):
+    """
+    Streams a full table export as CSV or Parquet (Admin only).
+
+    Tables: alumni, donation, career_history, is_member, event_participated_by.
+
+    Query Parameters:
+        - format (str): 'csv' (default) or 'parquet'.
+        - graduation_year_from, graduation_year_to (int): Graduation year of the alumni.
+        - association_id (int): Only members of this association.
+        - start_date, end_date (str): Date range (YYYY-MM-DD) on the table's date column.
+
+    Example URL:
+        /export/donation?format=csv&start_date=2020-01-01
+
+    Returns:
+        The exported file, sent in chunks as it is produced.
+    """
+    has_permission, message = check_permissions("Admin")
+    if not has_permission:
+        return jsonify({"status": "error", "message": message}), 403
+
+    export_format = request.args.get("format", default="csv")
+    filters = {key: request.args.get(key) for key in
+               ("graduation_year_from", "graduation_year_to", "association_id", "start_date", "end_date")}
+    try:
+        chunks = export_table(table, filters, export_format)
+        # Read the first chunk now so database errors still get an error response
+        first = next(chunks, b"")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    response = Response(itertools.chain([first], chunks), mimetype=EXPORT_MIMETYPES[export_format])
+    response.headers["Content-Disposition"] = f"attachment; filename={table}.{export_format}"
+    return response
+
+
+# Background Job Endpoints
+@app.route('/jobs', methods=['POST'])
+def submit_job_endpoint():
+    """
+    Submits a long-running report or export to the background job queue.
 
-#     Returns:
-#         JSON with employment trends data.
-#     """
-#     department = request.args.get('department')
-#     start_year = request.args.get('start_year', type=int)
-#     end_year = request.args.get('end_year', type=int)
+    Input JSON:
+        {
+            "job_type": "donation_trends",   // donation_trends, list_alumni, salary_trends, donation_analysis
+            "params": {"start_year": 1990, "end_year": 2024}
+        }
 
-#     if not department or not start_year or not end_year:
-#         return jsonify({"status": "error", "message": "Missing required parameters"}), 400
+    Returns:
+        JSON with the job ID. Poll /jobs/<job_id> and download /jobs/<job_id>/result when done.
+    """
+    data = request.json
+    if not data or not data.get("job_type"):
+        return jsonify({"status": "error", "message": "Missing required fields"}), 400
+    params = data.get("params") or {}
+    if not isinstance(params, dict):
+        return jsonify({"status": "error", "message": "params must be an object"}), 400
 
-#     trends = get_alumni_employment_trends(department, (start_year, end_year))
-#     return jsonify(trends), 200
+    result = submit_job(data["job_type"], params)
+    if result["status"] == "error":
+        if result.get("retryable"):
+            return jsonify(result), 503
+        if result["message"].startswith(("Unknown job type", "Missing job parameters")):
+            return jsonify(result), 400
+        return jsonify(result), 500
+    return jsonify(result), 200 if result["job_status"] == "done" else 202
 
 
-# @app.route('/calculate_donation_correlations', methods=['GET'])
-# def calculate_donation_correlations_endpoint():
-#     """
-#     Calculates correlations between alumni demographics and donation amounts.
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_endpoint(job_id):
+    """
+    Retrieves the status and progress (0 to 1) of a background job.
 
-#     Returns:
-#         JSON with donation correlations.
-#     """
-#     correlations = calculate_donation_correlations()
-#     return jsonify(correlations), 200
+    Returns:
+        JSON with job details.
+    """
+    result = get_job(job_id)
+    if result["status"] == "error":
+        return jsonify(result), 404 if result["message"] == "Job not found" else 500
+    return jsonify(result), 200
 
-# @app.route('/generate_30_year_reunion_list', methods=['GET'])
-# def generate_30_year_reunion_list_endpoint():
-#     """
-#     Generates a list of alumni who graduated 30 years ago.
 
-#     Returns:
-#         JSON with reunion list.
-#     """
-#     reunion_list = generate_30_year_reunion_list()
-#     return jsonify(reunion_list), 200
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result_endpoint(job_id):
+    """
+    Downloads the result of a finished background job.
 
+    Returns:
+        JSON with the job result, 409 while the job is still queued or running.
+    """
+    result = get_job_result(job_id)
+    if result["status"] == "error":
+        return jsonify(result), 404 if result["message"] == "Job not found" else 500
+    if result["job_status"] == "failed":
+        return jsonify({"status": "error", "message": result["error"]}), 500
+    if result["job_status"] != "done":
+        return jsonify({"status": "error", "message": f"Job is {result['job_status']}"}), 409
+    return jsonify(result["result"]), 200
 
-# @app.route('/get_top_achievers', methods=['GET'])
-# def get_top_achievers_endpoint():
-#     """
-#     Retrieves the top achievers.
 
-#     Query Parameters:
-#         - limit (int): Number of top achievers to retrieve (e.g., 5).
+# Batch Endpoint
+# Every sub-request is admitted like a direct call, after the batch itself took a token: a
+# full-size batch from a client with a full bucket must fit in the burst of the lookup class
+BATCH_MAX_REQUESTS = ROUTE_CLASSES[DEFAULT_ROUTE_CLASS]["burst"] - 1
+BATCH_WORKERS = 4  # threads running the sub-requests of a parallel batch
+BATCH_METHODS = ("GET", "POST", "PUT", "DELETE")
+# Streamed exports and nested batches cannot be part of a batch
+BATCH_EXCLUDED_PREFIXES = ("/batch", "/export/", "/stream/")
 
-#     Example URL:
-#         /get_top_achievers?limit=5
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
 
-#     Returns:
-#         JSON with list of top achievers.
-#     """
-#     limit = request.args.get('limit', default=10, type=int)
-#     top_achievers = get_top_achievers(limit)
-#     return jsonify(top_achievers), 200
+
+def _check_sub_request(item):
+    """
+    Validates one sub-request of a batch.
+
+    Returns:
+        str or None: Error message, or None if the sub-request is valid.
+    """
+    if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+        return "every request needs a path"
+    if not item["path"].startswith("/") or item["path"].startswith(BATCH_EXCLUDED_PREFIXES):
+        return f"path not allowed in a batch: {item['path']}"
+    if item.get("method", "GET").upper() not in BATCH_METHODS:
+        return f"method must be one of: {', '.join(BATCH_METHODS)}"
+    return None
+
+
+def _dispatch_sub_request(item, headers, remote_addr):
+    """
+    Runs one sub-request of a batch through the Flask view functions.
+
+    The sub-request gets its own request context, so it goes through the same
+    authentication, caching and error handling as a direct call, and is
+    rate limited and logged under the address of the batch client.
+
+    Args:
+        item (dict): {"method": "GET", "path": "/get_alumni/1?fields=first_name", "body": {...}}.
+        headers (dict): Headers passed on from the batch request.
+        remote_addr (str): Client address of the batch request.
+
+    Returns:
+        dict: {"status": HTTP status code, "body": response JSON (or text)}.
+    """
+    builder = EnvironBuilder(path=item["path"], method=item.get("method", "GET").upper(),
+                             json=item.get("body"), headers=headers, environ_base={"REMOTE_ADDR": remote_addr})
+    try:
+        with app.app_context(), app.request_context(builder.get_environ()):
+            response = app.full_dispatch_request()
+    except Exception as e:
+        logging.error("Error running batch request %s", item["path"], exc_info=True)
+        return {"status": 500, "body": {"status": "error", "message": str(e)}}
+    if any(cookie.startswith(f"{PRIMARY_READS_COOKIE}=") for cookie in response.headers.getlist("Set-Cookie")):
+        # A sub-request wrote, the batch response pins the client to the primary
+        set_wrote()
+    body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    return {"status": response.status_code, "body": body}
+
+
+@app.route('/batch', methods=['POST'])
+def batch_endpoint():
+    """
+    Runs several API calls in one HTTP round trip.
+
+    Sub-requests run in order on one shared database connection. With
+    "parallel": true and only GET sub-requests, they run at the same time
+    on a small thread pool instead. The Authorization header of the batch
+    applies to every sub-request.
+
+    Input JSON:
+        {
+            "requests": [
+                {"method": "GET", "path": "/get_alumni/b11705022"},
+                {"method": "GET", "path": "/get_career_paths/b11705022?fields=job_title,company"},
+                {"method": "POST", "path": "/add_donation", "body": {...}}
+            ],
+            "parallel": false
+        }
+
+    Returns:
+        JSON with one {"status": code, "body": ...} entry per sub-request, in request order.
+    """
+    data = request.json
+    items = data.get("requests") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"status": "error", "message": "requests must be a non-empty list"}), 400
+    if len(items) > BATCH_MAX_REQUESTS:
+        return jsonify({"status": "error", "message": f"At most {BATCH_MAX_REQUESTS} requests per batch"}), 400
+    for index, item in enumerate(items):
+        error = _check_sub_request(item)
+        if error:
+            return jsonify({"status": "error", "message": f"requests[{index}]: {error}"}), 400
+
+    # The token applies to every sub-request, the cookies keep reads after a write on the primary
+    headers = {name: request.headers[name] for name in ("Authorization", "Cookie") if name in request.headers}
+    remote_addr = request.remote_addr
+    if data.get("parallel") and all(item.get("method", "GET").upper() == "GET" for item in items):
+        responses = list(_batch_executor.map(lambda item: _dispatch_sub_request(item, headers, remote_addr), items))
+    else:
+        with shared_connection():
+            responses = [_dispatch_sub_request(item, headers, remote_addr) for item in items]
+    return jsonify({"status": "success", "responses": responses}), 200
+
+
+# Monitoring Endpoints
+@app.route('/stats/single_flight', methods=['GET'])
+def single_flight_stats_endpoint():
+    """
+    Reports how many read queries of this process were coalesced with an identical query in flight.
+
+    Returns:
+        JSON with executions, coalesced calls, coalesced rate, calls in flight and the largest group of followers.
+    """
+    return jsonify({"status": "success", "single_flight": query_flight.stats()}), 200
+
+
+@app.route('/stats/change_listener', methods=['GET'])
+def change_listener_stats_endpoint():
+    """
+    Reports the cache invalidation notifications received by this process.
+
+    Returns:
+        JSON with connection state, notifications received, delivery lag in ms, reconnects and full cache flushes.
+    """
+    return jsonify({"status": "success", "change_listener": get_change_listener_stats()}), 200
+
+
+@app.route('/stats/admission', methods=['GET'])
+def admission_stats_endpoint():
+    """
+    Reports the requests admitted and rejected by the admission control of this process.
+
+    Returns:
+        JSON with, per route class, its limits and the requests admitted, throttled (429),
+        shed (503) and running, and the clients throttled most often.
+    """
+    return jsonify({"status": "success", "admission": admission.stats()}), 200
+
+
+@app.route('/stats/database', methods=['GET'])
+def database_stats_endpoint():
+    """
+    Reports statement timeouts, cancelled queries and the circuit breaker state of this process.
+
+    Returns:
+        JSON with the counters and the circuit breaker state ('closed', 'open' or 'half_open').
+    """
+    return jsonify({"status": "success", "database": get_database_stats()}), 200
+
+
+@app.route('/stats/idempotency', methods=['GET'])
+def idempotency_stats_endpoint():
+    """
+    Reports how many write requests carried an Idempotency-Key and how their duplicates were answered.
+
+    Returns:
+        JSON with keys claimed, responses replayed, duplicates rejected (in progress or
+        a different request) and keys released after a failure, for this process.
+    """
+    return jsonify({"status": "success", "idempotency": get_idempotency_stats()}), 200
+
+
+@app.route('/stats/donation_partitions', methods=['GET'])
+def donation_partitions_stats_endpoint():
+    """
+    Lists the yearly partitions of the donation table and the archived years.
+
+    Returns:
+        JSON with each partition's bounds, estimated row count and size in bytes.
+    """
+    partitions = list_donation_partitions()
+    if partitions["status"] == "error":
+        return jsonify(partitions), 500
+    return jsonify({"status": "success", "donation_partitions": partitions}), 200
+
+
+# Event Stream Endpoints
+# Headers of Server-Sent Events responses; X-Accel-Buffering stops nginx from buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@app.route('/stream/events', methods=['GET'])
+def stream_events_endpoint():
+    """
+    Streams event and membership changes as Server-Sent Events.
+
+    Event types: event_created, event_updated, event_deleted, membership_changed,
+    and resync when changes may have been missed (reload the lists then).
+    A client that reconnects with the Last-Event-ID header first receives the
+    recent events it missed.
+
+    Query Parameters:
+        - association_id (int): Only changes of this association; can be repeated.
+        - alumni_id (str): Only changes of the associations this alumni is a member of,
+          and changes to its own memberships.
+
+    Example URL:
+        /stream/events?alumni_id=A001
+
+    Returns:
+        A text/event-stream response that stays open, or JSON with an error message.
+    """
+    alumni_id = request.args.get('alumni_id')
+    try:
+        member_of = load_memberships(alumni_id) if alumni_id else ()
+        subscription = Subscription(request.args.getlist('association_id'), alumni_id, member_of)
+        replay = event_broker.subscribe(subscription, request.headers.get("Last-Event-ID"))
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    return Response(sse_stream(subscription, replay), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.route('/stats/event_stream', methods=['GET'])
+def event_stream_stats_endpoint():
+    """
+    Reports the open event streams of this process.
+
+    Returns:
+        JSON with the number of subscribers and events published.
+    """
+    return jsonify({"status": "success", "event_stream": event_broker.stats()}), 200
 
 
 # Event Participation Endpoints
@@ -1332,34 +2395,51 @@ def get_personal_events_endpoint(alumni_id):
     return jsonify(events), 200
 
 @app.route('/get_all_open_associations', methods=['GET'])
+@cached(ttl=300, vary=('fields',), tags=('alumni_association',))
 def get_all_associations_endpoint():
     """
     Retrieves all associations.
 
+    Query Parameters:
+        - fields (str): Comma-separated columns to return (e.g., "association_id,association_name"), all columns if omitted.
+
     Returns:
         JSON with a list of all associations.
     """
-    associations = get_all_open_association()
+    fields, error = get_fields_arg("alumni_association")
+    if error:
+        return error
+
+    associations = get_all_open_association(fields)
     
     if associations["status"] == "error":
         return jsonify(associations), 404
     return jsonify(associations), 200
 
 @app.route('/get_all_upcoming_events', methods=['GET'])
+@cached(ttl=60, vary=('fields',), tags=('association_event',))
 def get_all_upcoming_events_endpoint():
     """
     Retrieves all upcoming events.
 
+    Query Parameters:
+        - fields (str): Comma-separated columns to return (e.g., "event_name,date,location"), all columns if omitted.
+
     Returns:
         JSON with a list of all upcoming events.
     """
-    events = get_all_upcoming_events()
+    fields, error = get_fields_arg("association_event")
+    if error:
+        return error
+
+    events = get_all_upcoming_events(fields)
     
     if events["status"] == "error":
         return jsonify(events), 404
     return jsonify(events), 200
 
 @app.route('/is_association_cadre/<string:alumni_id>', methods=['GET'])
+@cached(ttl=300, tags=('is_cadre',))
 def is_association_cadre_endpoint(alumni_id):
     """
     Checks if an alumni is a cadre of an association.
@@ -1396,6 +2476,7 @@ def end_cadre_endpoint(association_id, alumni_id):
         
         if "Error" in message:
             return jsonify({"status": "error", "message": message}), 500
+        purge("is_cadre")
         
         return jsonify({"status": "success", "message": message}), 201
     except Exception as e:
@@ -1420,10 +2501,60 @@ def add_cadre_to_association_endpoint(alumni_id, association_id, pos):
     
     if "Error" in message:
         return jsonify({"status": "error", "message": message}), 500
+    purge("is_cadre")
     
     return jsonify({"status": "success", "message": message}), 201
 
 
+@app.route('/handover_cadre/<int:association_id>', methods=['POST'])
+def handover_cadre_endpoint(association_id):
+    """
+    Hands one or more cadre positions over to new alumni atomically.
+
+    Replaces calling /end_cadre and /add_cadre_to_association separately:
+    the current holder's row is ended and the successor's row inserted in
+    one transaction.
+
+    URL Parameters:
+        association_id (int): The ID of the association.
+
+    Input JSON:
+        {
+            "handovers": [
+                {"from_alumni_id": "B11705022", "to_alumni_id": "B11705048", "position": "President"},
+                {"from_alumni_id": "B11705022", "to_alumni_id": "B11705059", "position": "Treasurer"}
+            ]
+        }
+
+    Returns:
+        JSON with a message indicating the result of the operation.
+    """
+    data = request.json
+    handovers = data.get("handovers") if data else None
+    if not handovers or not isinstance(handovers, list) or not all(
+            isinstance(item, dict) and all(item.get(k) for k in ['from_alumni_id', 'to_alumni_id', 'position'])
+            for item in handovers):
+        return jsonify({"status": "error", "message": "Missing required fields"}), 400
+
+    message = handover_cadre(association_id, handovers)
+    if "Error" in message:
+        return jsonify({"status": "error", "message": message}), 500
+    purge("is_cadre")
+
+    return jsonify({"status": "success", "message": message}), 201
+
+
 if __name__ == "__main__":
+    # With the reloader on, only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # The reports group degrees by department_id, so departments are set up first
+        init_departments()
+        start_report_scheduler()
+        start_job_workers()
+        start_revocation_sync()
+        start_change_listener()
+        start_replica_monitor()
+        start_partition_maintenance()
+        start_idempotency_cleanup()
     app.run(debug=True, port=5001)
     
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import threading
+
+# Single-flight setup
+# Calls waiting on a leader give up and run the call themselves after this many seconds
+FOLLOWER_TIMEOUT = 30
+
+
+class _Call:
+    """
+    One in-flight call shared by its leader and followers.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self.task = None  # asyncio task of an async call
+
+
+class SingleFlight:
+    """
+    Lets concurrent identical calls share one execution.
+
+    The first caller for a key (the leader) runs the call; callers arriving
+    with the same key while it runs (followers) wait for it and get the same
+    result, or the same exception. Nothing is kept once the call is done, so
+    this is not a cache: a call starting afterwards runs again.
+
+    Results are shared between callers and must not be modified.
+
+    Example:
+        flight = SingleFlight("query")
+        columns, rows = flight.do(("SELECT ...", ()), lambda: query("SELECT ..."))
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0  # calls actually run
+        self.coalesced = 0  # calls served by another caller's execution
+        self.max_followers = 0  # most callers that shared one execution, not counting the leader
+
+    def do(self, key, func):
+        """
+        Runs `func()` unless an identical call is in flight, then waits for that one.
+
+        Args:
+            key (hashable): Identifies identical calls (e.g., SQL and parameters).
+            func (callable): The call to run.
+
+        Returns:
+            The result of the leader's call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.executions += 1
+            else:
+                call.followers += 1
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            if call.done.wait(FOLLOWER_TIMEOUT):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            logging.warning("Single-flight %s: leader still running after %ss, running the call again",
+                            self.name, FOLLOWER_TIMEOUT)
+            return func()
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.max_followers = max(self.max_followers, call.followers)
+            call.done.set()
+
+    async def do_async(self, key, coroutine_func):
+        """
+        Async counterpart of do() for calls made on an event loop.
+
+        Args:
+            key (hashable): Identifies identical calls.
+            coroutine_func (callable): Returns the coroutine to run.
+
+        Returns:
+            The result of the leader's call.
+        """
+        call = self._async_calls.get(key)
+        if call is not None:
+            call.followers += 1
+            with self._lock:
+                self.coalesced += 1
+            # A follower that is cancelled must not cancel the shared call
+            return await asyncio.shield(call.task)
+
+        call = self._async_calls[key] = _Call()
+        with self._lock:
+            self.executions += 1
+        call.task = asyncio.ensure_future(coroutine_func())
+
+        def finished(task):
+            if self._async_calls.get(key) is call:
+                del self._async_calls[key]
+            with self._lock:
+                self.max_followers = max(self.max_followers, call.followers)
+
+        call.task.add_done_callback(finished)
+        return await asyncio.shield(call.task)
+
+    def stats(self):
+        """
+        Returns the coalescing metrics.
+
+        Returns:
+            dict: Executions, coalesced calls, the share of calls that were
+                  coalesced, calls in flight and the largest group of followers.
+        """
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / total, 3) if total else 0.0,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "max_followers": self.max_followers,
+            }
+
+
+# Shared by every coalesced read query of the process
+query_flight = SingleFlight("query")